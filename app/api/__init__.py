@@ -1,7 +1,8 @@
 from fastapi import APIRouter
-from . import health, documents, user
+from . import health, documents, metrics, user
 
 api_router = APIRouter()
 api_router.include_router(health.router, prefix="/health", tags=["Health"])
+api_router.include_router(metrics.router, prefix="/metrics", tags=["Health"])
 api_router.include_router(user.router, prefix="/auth", tags=["auth"])
 api_router.include_router(documents.router, prefix="/documents", tags=["Documents"])
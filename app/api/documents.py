@@ -1,90 +1,355 @@
+import asyncio
+from contextlib import aclosing
 from datetime import datetime
-import hashlib
-from uuid import uuid4
-from app.models.documents import DocumentCreate
-from app.models.user import UserInDB
-from app.services.redis_service import redis_client
+from typing import List, Optional
+from uuid import UUID, uuid4
+from app.models.documents import Document, DocumentCreate, DocumentPage
+from app.models.user import User, UserInDB
 import json
+import os
 from fastapi import Depends, Request
 
 from fastapi import APIRouter, File, UploadFile, HTTPException, Query
-from fastapi.responses import JSONResponse
-from tempfile import NamedTemporaryFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pathlib import Path
 
-from app.services.user_documents import attach_documents_to_user, create_document, get_current_user, get_uuid_by_username
-from app.utils.limiter import limiter
+from app.services.user_documents import (
+    attach_documents_to_user,
+    create_document,
+    get_current_active_user,
+    get_current_user,
+    get_document_for_user,
+    get_optional_current_user,
+    get_uuid_by_username,
+    list_documents_for_user,
+)
+from app.utils.executor import run_in_aws_executor
+from app.utils.limiter import limiter, rate_limit_identity, token_budget
+from app.utils.metrics import record_cache_lookup
 
-from app.services.textract_service import extract_text_from_file
-from app.services.s3_service import upload_file_to_s3
-from app.services.openai_service import summarize_text
+from app.services.batch_service import BATCH_MAX_FILES, group_by_content, process_batch
+from app.services.cache_service import get_cached_extraction, get_cached_result, get_cached_result_bytes, has_cached_result
+from app.services.document_pipeline import process_document_once, process_document_stream
+from app.services.document_writer import document_writer
+from app.services.ingest_service import IngestedFile, ingest_upload
+from app.services.job_service import TERMINAL_STATUSES, create_job, get_job
+from app.services.llm_client import LLM_BREAKER_RESET, LLMUnavailableError
+from app.services.openai_service import estimate_summary_tokens
+from app.services.s3_service import s3_https_url, upload_ingested_to_s3_async
 
 from app.common import ALLOWED_EXTENSIONS, SummaryLength
 
 router = APIRouter()
 
+JOB_EVENTS_POLL_INTERVAL = float(os.getenv("JOB_EVENTS_POLL_INTERVAL", 0.5))
+
+
+def record_document(
+    current_user: Optional[User], ingested: IngestedFile, summary_length: SummaryLength, result: dict
+) -> None:
+    """Add the upload to a signed-in user's history; the write happens in the background."""
+    if current_user is None or current_user.disabled:
+        return
+    document_writer.enqueue(DocumentCreate(
+        user_uuid=current_user.uuid,
+        summary_title=str(ingested.filename)[:15] + "...",
+        summary=result["summary"],
+        document_url=s3_https_url(result["s3_url"]),
+        document_name=ingested.filename,
+        document_size=round(ingested.size / 1024),
+        summary_length=summary_length.value,
+        date=datetime.utcnow(),
+    ))
+
+
 @router.post("/upload")
 @router.post("/upload/")
 @limiter.limit("5/minute")
 async def upload_document(
     request: Request,
     file: UploadFile = File(...),
-    summary_length: SummaryLength = Query("medium", description="Choose summary length: short, medium, or long")
+    summary_length: SummaryLength = Query(SummaryLength.medium, description="Choose summary length: short, medium, or long"),
+    current_user: Optional[User] = Depends(get_optional_current_user),
+):
+    ext = Path(file.filename).suffix.lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Only PDF, DOCX, PNG, JPG, JPEG files are supported")
+
+    ingested = await ingest_upload(file)
+
+    try:
+        cached_body = await get_cached_result_bytes(
+            ingested.content_hash, summary_length, legacy_hash=ingested.digest_with(summary_length.value)
+        )
+        # Counted here rather than in the cache service so the single-flight
+        # re-checks do not skew the hit ratio.
+        record_cache_lookup("summary", cached_body is not None)
+        if cached_body:
+            if current_user is not None:
+                record_document(current_user, ingested, summary_length, json.loads(cached_body))
+            return Response(content=cached_body, media_type="application/json")
+
+        # Cache hits are free; only uploads that reach the LLM use the budget.
+        identity = rate_limit_identity(request)
+        await token_budget.check(identity)
+
+        try:
+            result, reused = await process_document_once(ingested, summary_length)
+        except LLMUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(LLM_BREAKER_RESET))})
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+        if not reused:
+            await token_budget.charge(
+                identity, estimate_summary_tokens(result["extracted_text"], result["summary"], summary_length)
+            )
+        record_document(current_user, ingested, summary_length, result)
+        return JSONResponse(content=result)
+    finally:
+        ingested.close()
+
+
+@router.post("/upload/batch")
+@router.post("/upload/batch/")
+@limiter.limit("5/minute")
+async def upload_document_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    summary_length: SummaryLength = Query(SummaryLength.medium, description="Choose summary length: short, medium, or long"),
+    current_user: Optional[User] = Depends(get_optional_current_user),
+):
+    """
+    Upload up to BATCH_MAX_FILES files at once. Streams newline-delimited
+    JSON: a "batch" summary, then per-file "stage", "result" and "error"
+    events (each with the file's index and filename) as documents finish,
+    then "done". Identical files are processed once.
+    """
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"A batch can hold at most {BATCH_MAX_FILES} files")
+
+    identity = rate_limit_identity(request)
+    rejected = []
+    accepted = []
+    try:
+        for index, file in enumerate(files):
+            if Path(file.filename).suffix.lower() not in ALLOWED_EXTENSIONS:
+                rejected.append((index, file.filename, "Only PDF, DOCX, PNG, JPG, JPEG files are supported"))
+                continue
+            try:
+                accepted.append((index, await ingest_upload(file)))
+            except HTTPException as e:
+                rejected.append((index, file.filename, e.detail))
+    except BaseException:
+        for _, ingested in accepted:
+            ingested.close()
+        raise
+    ingested_by_index = dict(accepted)
+
+    async def check_budget():
+        await token_budget.check(identity)
+
+    async def charge(result: dict):
+        await token_budget.charge(
+            identity, estimate_summary_tokens(result["extracted_text"], result["summary"], summary_length)
+        )
+
+    async def events():
+        batch = process_batch(group_by_content(accepted), summary_length, rejected, check_budget, charge)
+        try:
+            async with aclosing(batch):
+                async for event in batch:
+                    if event["type"] == "result":
+                        record_document(
+                            current_user, ingested_by_index[event["index"]], summary_length, event["result"]
+                        )
+                    yield json.dumps(event) + "\n"
+        finally:
+            for ingested in ingested_by_index.values():
+                ingested.close()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@router.post("/upload/stream")
+@limiter.limit("5/minute")
+async def upload_document_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    summary_length: SummaryLength = Query(SummaryLength.medium, description="Choose summary length: short, medium, or long")
 ):
+    """
+    Same as /upload but streams newline-delimited JSON: a "metadata" event
+    with the extracted text and S3 url, then "token" events as the summary is
+    generated, then "done". Failures after the stream started arrive as an
+    "error" event.
+    """
     ext = Path(file.filename).suffix.lower()
     if ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(status_code=400, detail="Only PDF, DOCX, PNG, JPG, JPEG files are supported")
 
-    file_bytes = await file.read()
+    ingested = await ingest_upload(file)
+    identity = rate_limit_identity(request)
+
+    # Checked before the response starts so an exhausted budget is a 429,
+    # not an error event; a cached result would not have needed it.
+    try:
+        cached_result = await get_cached_result(
+            ingested.content_hash, summary_length, legacy_hash=ingested.digest_with(summary_length.value)
+        )
+        record_cache_lookup("summary", cached_result is not None)
+        if not cached_result:
+            await token_budget.check(identity)
+    except BaseException:
+        ingested.close()
+        raise
+
+    async def events():
+        try:
+            if cached_result:
+                yield json.dumps({
+                    "type": "metadata",
+                    "filename": cached_result["filename"],
+                    "extracted_text": cached_result["extracted_text"],
+                    "s3_url": cached_result["s3_url"],
+                }) + "\n"
+                yield json.dumps({"type": "done", "summary": cached_result["summary"], "cached": True}) + "\n"
+                return
+
+            async def charge(result: dict):
+                await token_budget.charge(
+                    identity, estimate_summary_tokens(result["extracted_text"], result["summary"], summary_length)
+                )
 
-    hash_input = file_bytes + summary_length.value.encode()
-    doc_hash = hashlib.sha256(hash_input).hexdigest()
+            async for event in process_document_stream(ingested, summary_length, charge):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": f"Processing failed: {str(e)}"}) + "\n"
+        finally:
+            ingested.close()
 
-    redis_key = f"summary:{doc_hash}"
+    return StreamingResponse(events(), media_type="application/x-ndjson")
 
-    cached_data = await redis_client.get(redis_key)
-    if cached_data:
-       return JSONResponse(content=json.loads(cached_data))
 
+@router.post("/jobs", status_code=202)
+@router.post("/jobs/", status_code=202)
+@limiter.limit("5/minute")
+async def create_document_job(
+    request: Request,
+    file: UploadFile = File(...),
+    summary_length: SummaryLength = Query(SummaryLength.medium, description="Choose summary length: short, medium, or long")
+):
+    """
+    Queue a document for background processing and return its job id right
+    away. Poll GET /documents/jobs/{job_id} or stream
+    GET /documents/jobs/{job_id}/events for progress.
+    """
     ext = Path(file.filename).suffix.lower()
-    with NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-        tmp.write(file_bytes)
-        tmp_path = Path(tmp.name)
+    if ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Only PDF, DOCX, PNG, JPG, JPEG files are supported")
+
+    ingested = await ingest_upload(file)
 
     try:
-        text = extract_text_from_file(tmp_path)
-        s3_url = upload_file_to_s3(tmp_path, file.filename)
-        summary = await summarize_text(text, summary_length)
-
-        # # save meta data to db
-        # if current_user:
-        #     document_data = DocumentCreate(
-        #         user_uuid=get_uuid_by_username(current_user.username),
-        #         summary_title=str(file.filename)[:15] + "...",
-        #         summary=summary,
-        #         document_url=s3_url,
-        #         document_name=file.filename,
-        #         document_size=round(len(file_bytes) / 1024, 2),
-        #         summary_length=summary_length,
-        #         date=datetime.utcnow()
-        #     )
-
-        #     create_document(document_data)
-        # else:
-        #     # guest
-        #     pass
-
-        result = {
+        job_fields = {
             "filename": file.filename,
-            "extracted_text": text,
-            "summary": summary,
-            "s3_url": s3_url
+            "summary_length": summary_length.value,
+            "content_hash": ingested.content_hash,
         }
 
-        await redis_client.set(redis_key, json.dumps(result), ex=604800)
+        cached = await has_cached_result(ingested.content_hash, summary_length)
+        record_cache_lookup("summary", cached)
+        if cached:
+            job_id = await create_job({**job_fields, "status": "completed", "stage": "completed"}, enqueue=False)
+            return {"job_id": job_id, "status": "completed"}
 
-        return JSONResponse(content=result)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+        # The worker charges the tokens once the job is done.
+        identity = rate_limit_identity(request)
+        await token_budget.check(identity)
+
+        extraction = await get_cached_extraction(ingested.content_hash)
+        if extraction:
+            s3_url = extraction["s3_url"]
+        else:
+            try:
+                # Workers run on other hosts, so the file is handed over through S3.
+                s3_url = await upload_ingested_to_s3_async(ingested)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+
+        job_id = await create_job({
+            **job_fields, "s3_url": s3_url, "rate_identity": identity, "status": "queued", "stage": "queued",
+        })
+        return {"job_id": job_id, "status": "queued"}
     finally:
-        tmp_path.unlink(missing_ok=True)
\ No newline at end of file
+        ingested.close()
+
+
+async def build_job_response(job: dict) -> dict:
+    response = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "stage": job.get("stage"),
+        "filename": job.get("filename"),
+    }
+    if job["status"] == "completed":
+        response["result"] = await get_cached_result(job["content_hash"], SummaryLength(job["summary_length"]))
+    elif job["status"] == "failed":
+        response["error"] = job.get("error")
+    return response
+
+
+@router.get("/jobs/{job_id}")
+async def get_document_job(job_id: str):
+    job = await get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await build_job_response(job)
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_document_job(job_id: str):
+    """
+    Server-sent events: one event per status/stage change, ending with the
+    completed or failed state.
+    """
+    job = await get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last_state = None
+        while True:
+            job = await get_job(job_id)
+            if job is None:
+                return
+            state = (job["status"], job.get("stage"))
+            if state != last_state:
+                last_state = state
+                payload = await build_job_response(job)
+                yield f"data: {json.dumps(payload)}\n\n"
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(JOB_EVENTS_POLL_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@router.get("", response_model=DocumentPage)
+@router.get("/", response_model=DocumentPage)
+async def list_documents(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    The current user's documents, newest first, without their summaries.
+    """
+    return await run_in_aws_executor(list_documents_for_user, current_user.uuid, limit, cursor)
+
+
+@router.get("/{document_id}", response_model=Document)
+async def get_document(document_id: UUID, current_user: User = Depends(get_current_active_user)):
+    document = await run_in_aws_executor(get_document_for_user, document_id, current_user.uuid)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return document
@@ -1,8 +1,34 @@
 from fastapi import APIRouter
 
+from app.services.cache_service import get_cache_stats
+from app.services.extraction_service import get_extraction_stats
+from app.services.llm_client import get_llm_stats
+from app.services.text_cache import get_text_cache_stats
+from app.utils.executor import get_executor_stats
+
 router = APIRouter()
 
 @router.get("")
 @router.get("/")
 async def health_check():
     return {"status": "ok"}
+
+
+@router.get("/cache")
+async def cache_stats():
+    return {**get_cache_stats(), "text": get_text_cache_stats()}
+
+
+@router.get("/extraction")
+async def extraction_stats():
+    return get_extraction_stats()
+
+
+@router.get("/executors")
+async def executor_stats():
+    return get_executor_stats()
+
+
+@router.get("/llm")
+async def llm_stats():
+    return get_llm_stats()
@@ -0,0 +1,14 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
+
+from app.utils import metrics
+
+router = APIRouter()
+
+
+@router.get("")
+@router.get("/")
+async def prometheus_metrics():
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(content=metrics.render_metrics(), media_type=metrics.CONTENT_TYPE_LATEST)
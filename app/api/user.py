@@ -5,19 +5,30 @@ from datetime import timedelta
 
 from app.services import user_documents
 from app.models.user import User, UserCreate, UserInDB, Token
+from app.utils.executor import ExecutorBusyError
 
 router = APIRouter()
 
 
+def auth_busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many logins in progress, try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
+
 @router.post("/register", response_model=User)
-def register(user: UserCreate):
+async def register(user: UserCreate):
     """
     Register a new user with username and password.
     """
     try:
-        user = user_documents.create_user(user.username, user.password)
+        user = await user_documents.register_user(user.username, user.password)
     except HTTPException as e:
         raise e
+    except ExecutorBusyError:
+        raise auth_busy_exception()
 
     return User(
         uuid=user.uuid,
@@ -28,12 +39,15 @@ def register(user: UserCreate):
 
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """
     Login user and return JWT access token.
     OAuth2PasswordRequestForm expects form fields: username and password
     """
-    user: UserInDB = user_documents.authenticate_user(form_data.username, form_data.password)
+    try:
+        user: UserInDB = await user_documents.authenticate_user(form_data.username, form_data.password)
+    except ExecutorBusyError:
+        raise auth_busy_exception()
 
     if not user:
         raise HTTPException(
@@ -1,6 +1,9 @@
-import boto3
 from boto3.dynamodb.conditions import Key
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-users_table = dynamodb.Table("users")
-documents_table = dynamodb.Table("documents")
+from app.utils.aws import aws_clients, lazy_module_attributes
+
+__getattr__ = lazy_module_attributes(__name__, {
+    "dynamodb": lambda: aws_clients.resource("dynamodb"),
+    "users_table": lambda: aws_clients.table("users"),
+    "documents_table": lambda: aws_clients.table("documents"),
+})
@@ -1,22 +1,33 @@
 import asyncio
 import os
+from contextlib import asynccontextmanager
 
-import boto3
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.services.user_documents import get_current_user
-from slowapi.errors import RateLimitExceeded
-from slowapi import _rate_limit_exceeded_handler
 
-from app.utils.limiter import limiter
+from app.utils.body_limit import MaxBodySizeMiddleware
+from app.services.document_writer import document_writer
+from app.services.batch_service import BATCH_MAX_BYTES
+from app.services.ingest_service import MAX_UPLOAD_BYTES
+from app.services.lifecycle import close_clients, warm_clients
+from app.utils.metrics import METRICS_ENABLED, MetricsMiddleware
 
 from app.api import api_router
 
 
-app = FastAPI(title="FastAPI LLM Agent")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warm_clients()
+    await document_writer.start()
+    yield
+    # Pending history entries are written before the process exits.
+    await document_writer.stop()
+    await close_clients()
+
+
+app = FastAPI(title="FastAPI LLM Agent", lifespan=lifespan)
 
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 app.include_router(api_router)
 
 origins = [
@@ -27,6 +38,16 @@ origins = [
 ]
 
 
+# multipart framing adds a little on top of the file itself
+app.add_middleware(
+    MaxBodySizeMiddleware,
+    max_body_size=MAX_UPLOAD_BYTES + 64 * 1024,
+    path_limits={
+        "/documents/upload/batch": BATCH_MAX_BYTES,
+        "/documents/upload/batch/": BATCH_MAX_BYTES,
+    },
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -34,3 +55,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+# Outermost, so the latency it records includes the other middlewares.
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, HttpUrl
 from uuid import UUID, uuid4
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 
 class DocumentBase(BaseModel):
@@ -24,3 +24,19 @@ class Document(DocumentBase):
 
     class Config:
         orm_mode = True
+
+
+class DocumentListItem(BaseModel):
+    """History entry: everything but the summary text."""
+    id: UUID
+    summary_title: str
+    document_url: HttpUrl
+    document_name: str
+    document_size: int
+    summary_length: str
+    date: datetime
+
+
+class DocumentPage(BaseModel):
+    items: List[DocumentListItem]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page
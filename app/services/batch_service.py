@@ -0,0 +1,152 @@
+"""
+Batch uploads: many files in one request. Files are grouped by content
+hash so a document sent twice is processed once, all summary cache entries
+are fetched with one MGET, and the misses go through the pipeline at most
+BATCH_CONCURRENCY at a time. Events are yielded per file as soon as they
+happen, so one bad file fails only itself.
+"""
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.common import SummaryLength
+from app.services.cache_service import get_cached_results_bytes
+from app.services.document_pipeline import process_document_once
+from app.services.ingest_service import IngestedFile
+from app.utils.metrics import record_cache_lookup
+
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", 200))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", 200 * 1024 * 1024))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+
+
+class BatchDocument:
+    """One distinct document of a batch and the files (by position) that contain it."""
+
+    def __init__(self, ingested: IngestedFile):
+        self.ingested = ingested
+        self.files: List[Tuple[int, str]] = []
+
+    def events(self, event_type: str, **fields) -> List[dict]:
+        return [
+            {"type": event_type, "index": index, "filename": filename, **fields}
+            for index, filename in self.files
+        ]
+
+
+def group_by_content(files: List[Tuple[int, IngestedFile]]) -> List[BatchDocument]:
+    documents: Dict[str, BatchDocument] = {}
+    for index, ingested in files:
+        document = documents.get(ingested.content_hash)
+        if document is None:
+            document = documents[ingested.content_hash] = BatchDocument(ingested)
+        else:
+            # Only the first copy is processed; a closed IngestedFile keeps
+            # its name and size.
+            ingested.close()
+        document.files.append((index, ingested.filename))
+    return list(documents.values())
+
+
+def result_events(document: BatchDocument, result: dict, cached: bool) -> List[dict]:
+    # Each file gets the result under its own name; only the first file of a
+    # group is the one that was actually processed.
+    return [
+        {**event, "cached": cached, "duplicate": position > 0, "result": {**result, "filename": event["filename"]}}
+        for position, event in enumerate(document.events("result"))
+    ]
+
+
+async def process_batch(
+    documents: List[BatchDocument],
+    summary_length: SummaryLength,
+    rejected: Optional[List[Tuple[int, str, str]]] = None,
+    before_process: Optional[Callable[[], Awaitable[None]]] = None,
+    after_summary: Optional[Callable[[dict], Awaitable[None]]] = None,
+) -> AsyncIterator[dict]:
+    """
+    Yields a "batch" summary, then "stage", "result" and "error" events
+    tagged with the file's index and filename in completion order, then
+    "done". rejected lists files refused before ingestion as (index,
+    filename, detail). before_process runs before each document that has to
+    be processed; an HTTPException from it fails that document.
+    after_summary runs with the result of each document whose summary took
+    an LLM call.
+    """
+    rejected = rejected or []
+    counts = {"succeeded": 0, "failed": len(rejected)}
+
+    cached_bodies = await get_cached_results_bytes(
+        [document.ingested.content_hash for document in documents], summary_length
+    )
+    misses = []
+    for document, body in zip(documents, cached_bodies):
+        record_cache_lookup("summary", body is not None)
+        if body is None:
+            misses.append(document)
+
+    yield {
+        "type": "batch",
+        "files": sum(len(document.files) for document in documents) + len(rejected),
+        "unique": len(documents),
+        "cached": len(documents) - len(misses),
+        "rejected": len(rejected),
+    }
+    for index, filename, detail in rejected:
+        yield {"type": "error", "index": index, "filename": filename, "detail": detail}
+
+    for document, body in zip(documents, cached_bodies):
+        if body is not None:
+            counts["succeeded"] += len(document.files)
+            for event in result_events(document, json.loads(body), cached=True):
+                yield event
+
+    events: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run(document: BatchDocument) -> None:
+        async def on_stage(stage: str):
+            for event in document.events("stage", stage=stage):
+                events.put_nowait(event)
+
+        try:
+            async with semaphore:
+                if before_process is not None:
+                    await before_process()
+                result, reused = await process_document_once(
+                    document.ingested, summary_length, on_stage=on_stage
+                )
+        except HTTPException as e:
+            failed = document.events("error", detail=e.detail)
+        except Exception as e:
+            failed = document.events("error", detail=f"Processing failed: {str(e)}")
+        else:
+            if not reused and after_summary is not None:
+                await after_summary(result)
+            counts["succeeded"] += len(document.files)
+            for event in result_events(document, result, cached=False):
+                events.put_nowait(event)
+            return
+        counts["failed"] += len(document.files)
+        for event in failed:
+            events.put_nowait(event)
+
+    for document in misses:
+        for event in document.events("stage", stage="queued"):
+            yield event
+
+    tasks = [asyncio.create_task(run(document)) for document in misses]
+    finished = asyncio.gather(*tasks)
+    finished.add_done_callback(lambda _: events.put_nowait(None))
+    try:
+        while (event := await events.get()) is not None:
+            yield event
+    finally:
+        # The client went away: stop the documents still waiting or running.
+        for task in tasks:
+            task.cancel()
+
+    yield {"type": "done", **counts}
@@ -0,0 +1,158 @@
+"""
+Two cache layers keyed by the sha256 of the uploaded file:
+
+  extract:v{EXTRACTION_CACHE_VERSION}:{content_hash}
+      extracted text and S3 url; shared by every summary length
+  summary:v{SUMMARY_CACHE_VERSION}:{content_hash}:{length}:{model}:{prompt version}
+      the full upload response
+
+A model or prompt change only invalidates the summary layer, so asking for
+another length or re-summarizing never pays for Textract or S3 again.
+
+Both layers are read through a size-bounded in-process LRU tier before
+Redis. Values are stored as encoded bytes so a hit can be returned as the
+response body without being decoded and re-encoded. In Redis they are
+wrapped by app.utils.cache_codec (compressed above a size threshold).
+"""
+import json
+import os
+from typing import List, Optional
+
+from app.common import SummaryLength
+from app.services.openai_service import SUMMARY_MODEL, SUMMARY_PROMPT_VERSION
+from app.services.redis_service import redis_client
+from app.utils import cache_codec
+from app.utils.lru_cache import LRUCache
+from app.utils.metrics import record_cache_lookup, stage
+
+EXTRACTION_CACHE_VERSION = "1"
+SUMMARY_CACHE_VERSION = "1"
+EXTRACTION_CACHE_TTL = 604800  # one week
+SUMMARY_CACHE_TTL = 604800  # one week
+
+# Hot entries are also kept in process memory in front of Redis. Keys are
+# content addressed and never rewritten with different values, so the local
+# TTL only bounds memory held by cold entries, not staleness.
+LOCAL_CACHE_MAX_BYTES = int(os.getenv("LOCAL_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+LOCAL_CACHE_TTL = int(os.getenv("LOCAL_CACHE_TTL", 600))
+
+local_cache = LRUCache(max_bytes=LOCAL_CACHE_MAX_BYTES, ttl=LOCAL_CACHE_TTL)
+redis_stats = {"hits": 0, "misses": 0}
+
+
+def extraction_cache_key(content_hash: str) -> str:
+    return f"extract:v{EXTRACTION_CACHE_VERSION}:{content_hash}"
+
+
+def summary_cache_key(content_hash: str, summary_length: SummaryLength) -> str:
+    return (
+        f"summary:v{SUMMARY_CACHE_VERSION}:{content_hash}:{summary_length.value}"
+        f":{SUMMARY_MODEL}:{SUMMARY_PROMPT_VERSION}"
+    )
+
+
+def legacy_summary_cache_key(legacy_hash: str) -> str:
+    # Entries written before the cache was layered, keyed by
+    # sha256(file_bytes + summary_length). They expire within a week.
+    return f"summary:{legacy_hash}"
+
+
+@stage("cache_lookup")
+async def tiered_mget(keys: List[str]) -> List[Optional[bytes]]:
+    """Values for keys from the local tier, falling back to one Redis MGET."""
+    values = [local_cache.get(key) for key in keys]
+    missing = [i for i, value in enumerate(values) if value is None]
+    if not missing:
+        return values
+
+    remote_values = await redis_client.mget([keys[i] for i in missing])
+    for i, value in zip(missing, remote_values):
+        if value is not None:
+            try:
+                value = cache_codec.decode(value)
+            except Exception as e:
+                print(f"Undecodable cache entry {keys[i]}: {e}")
+                value = None
+        if value is None:
+            redis_stats["misses"] += 1
+            continue
+        redis_stats["hits"] += 1
+        local_cache.set(keys[i], value)
+        values[i] = value
+    return values
+
+
+async def tiered_set(key: str, value: bytes, ex: int) -> None:
+    # The local tier keeps the plain JSON so hits skip decompression; Redis
+    # gets the compact encoding.
+    local_cache.set(key, value)
+    await redis_client.set(key, cache_codec.encode(value), ex=ex)
+
+
+def get_cache_stats() -> dict:
+    return {
+        "local": {
+            **local_cache.stats,
+            "entries": len(local_cache),
+            "bytes": local_cache.current_bytes,
+            "max_bytes": local_cache.max_bytes,
+        },
+        "redis": dict(redis_stats),
+    }
+
+
+async def get_cached_extraction(content_hash: str) -> Optional[dict]:
+    cached_data, = await tiered_mget([extraction_cache_key(content_hash)])
+    record_cache_lookup("extraction", cached_data is not None)
+    if cached_data:
+        return json.loads(cached_data)
+    return None
+
+
+async def cache_extraction(content_hash: str, extracted_text: str, s3_url: str) -> None:
+    await tiered_set(
+        extraction_cache_key(content_hash),
+        json.dumps({"extracted_text": extracted_text, "s3_url": s3_url}).encode(),
+        ex=EXTRACTION_CACHE_TTL,
+    )
+
+
+async def get_cached_result_bytes(
+    content_hash: str, summary_length: SummaryLength, legacy_hash: Optional[str] = None
+) -> Optional[bytes]:
+    """The cached upload response exactly as stored, ready to be sent as-is."""
+    keys = [summary_cache_key(content_hash, summary_length)]
+    if legacy_hash is not None:
+        keys.append(legacy_summary_cache_key(legacy_hash))
+
+    for cached_data in await tiered_mget(keys):
+        if cached_data:
+            return cached_data
+    return None
+
+
+async def get_cached_results_bytes(content_hashes: List[str], summary_length: SummaryLength) -> List[Optional[bytes]]:
+    """Cached upload responses for many documents with a single MGET."""
+    return await tiered_mget([summary_cache_key(content_hash, summary_length) for content_hash in content_hashes])
+
+
+async def get_cached_result(
+    content_hash: str, summary_length: SummaryLength, legacy_hash: Optional[str] = None
+) -> Optional[dict]:
+    cached_data = await get_cached_result_bytes(content_hash, summary_length, legacy_hash)
+    if cached_data:
+        return json.loads(cached_data)
+    return None
+
+
+async def has_cached_result(content_hash: str, summary_length: SummaryLength) -> bool:
+    key = summary_cache_key(content_hash, summary_length)
+    if local_cache.get(key) is not None:
+        return True
+    return bool(await redis_client.exists(key))
+
+
+async def cache_result(content_hash: str, summary_length: SummaryLength, result: dict) -> None:
+    await tiered_set(
+        summary_cache_key(content_hash, summary_length), json.dumps(result).encode(), ex=SUMMARY_CACHE_TTL
+    )
@@ -0,0 +1,190 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Optional, Tuple
+
+from app.common import SummaryLength
+from app.services.cache_service import cache_extraction, cache_result, get_cached_extraction, get_cached_result
+from app.services.extraction_service import extract_text
+from app.services.ingest_service import IngestedFile
+from app.services.openai_service import summarize_text, summarize_text_stream
+from app.services.redis_service import redis_client
+from app.services.s3_service import upload_ingested_to_s3_async
+from app.services.text_cache import get_reusable_summary, get_text_signature, remember_summary
+from app.services.textract_service import MultiPageDocumentError, extract_text_from_s3_url_async
+from app.utils.single_flight import SingleFlight
+
+StageCallback = Callable[[str], Awaitable[None]]
+ResultCallback = Callable[[dict], Awaitable[None]]
+
+document_flight = SingleFlight("singleflight:document")
+
+
+async def coalesce_document(
+    content_hash: str,
+    summary_length: SummaryLength,
+    fn: Callable[[], Awaitable[Tuple[dict, bool]]],
+    release: Optional[Callable[[], None]] = None,
+) -> Tuple[dict, bool]:
+    """
+    Run fn, which must produce and cache the result for this document and
+    summary length, at most once at a time across all workers and replicas.
+    Concurrent callers get the same (result, reused) pair; a result
+    another process produced counts as reused. See SingleFlight.do for
+    release.
+    """
+    async def fetch():
+        result = await get_cached_result(content_hash, summary_length)
+        return None if result is None else (result, True)
+
+    return await document_flight.do(
+        redis_client, f"{content_hash}:{summary_length.value}", fn, fetch, release
+    )
+
+
+async def extract_and_store(ingested: IngestedFile, s3_url: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Extracted text and S3 url for an upload, from the extraction cache when
+    possible. Pass s3_url when the file is already in S3 to skip the upload.
+    """
+    cached = await get_cached_extraction(ingested.content_hash)
+    if cached:
+        return cached["extracted_text"], cached["s3_url"]
+
+    # The S3 upload starts right away and overlaps with extraction. Documents
+    # that need OCR on more pages than the synchronous Textract APIs handle
+    # well are extracted from the uploaded object instead, which has to wait
+    # for the upload.
+    upload = None
+    if s3_url is None:
+        upload = asyncio.ensure_future(upload_ingested_to_s3_async(ingested))
+    try:
+        try:
+            text = await extract_text(ingested)
+        except MultiPageDocumentError:
+            if upload is not None:
+                s3_url = await upload
+            text = await extract_text_from_s3_url_async(s3_url)
+        if upload is not None:
+            s3_url = await upload
+    finally:
+        if upload is not None and not upload.done():
+            upload.cancel()
+
+    await cache_extraction(ingested.content_hash, text, s3_url)
+    return text, s3_url
+
+
+async def summarize_extraction(
+    content_hash: str,
+    filename: str,
+    text: str,
+    s3_url: str,
+    summary_length: SummaryLength,
+) -> Tuple[dict, bool]:
+    """
+    The result for an extraction, cached, and whether its summary came from
+    the text cache, so that no LLM call was made for it.
+    """
+    # Same text under different bytes (re-exported, re-scanned, new
+    # metadata) reuses the earlier summary instead of calling the LLM.
+    signature = await get_text_signature(text)
+    summary = await get_reusable_summary(signature, summary_length)
+    reused = summary is not None
+    if not reused:
+        summary = await summarize_text(text, summary_length)
+        await remember_summary(signature, summary_length, summary)
+
+    result = {
+        "filename": filename,
+        "extracted_text": text,
+        "summary": summary,
+        "s3_url": s3_url
+    }
+
+    await cache_result(content_hash, summary_length, result)
+    return result, reused
+
+
+async def process_document(
+    ingested: IngestedFile,
+    summary_length: SummaryLength,
+    s3_url: Optional[str] = None,
+    on_stage: Optional[StageCallback] = None,
+) -> Tuple[dict, bool]:
+    """
+    Extract, store and summarize an ingested upload, filling both cache
+    layers on the way.
+    """
+    async def stage(name: str):
+        if on_stage is not None:
+            await on_stage(name)
+
+    await stage("extracting")
+    text, s3_url = await extract_and_store(ingested, s3_url)
+
+    await stage("summarizing")
+    return await summarize_extraction(ingested.content_hash, ingested.filename, text, s3_url, summary_length)
+
+
+async def process_document_once(
+    ingested: IngestedFile,
+    summary_length: SummaryLength,
+    s3_url: Optional[str] = None,
+    on_stage: Optional[StageCallback] = None,
+) -> Tuple[dict, bool]:
+    # The shared call keeps running for other callers when this one is
+    # cancelled and its caller closes ingested, so it holds its own reference.
+    ingested.retain()
+    return await coalesce_document(
+        ingested.content_hash,
+        summary_length,
+        lambda: process_document(ingested, summary_length, s3_url, on_stage),
+        ingested.close,
+    )
+
+
+async def process_document_stream(
+    ingested: IngestedFile,
+    summary_length: SummaryLength,
+    after_summary: Optional[ResultCallback] = None,
+) -> AsyncIterator[dict]:
+    """
+    Streaming variant of process_document. Yields a "metadata" event once
+    extraction and the S3 upload finish, a "token" event per summary token and
+    a final "done" event; the assembled result is cached like process_document.
+    after_summary runs with the result before "done" when the summary took an
+    LLM call.
+    """
+    text, s3_url = await extract_and_store(ingested)
+
+    yield {
+        "type": "metadata",
+        "filename": ingested.filename,
+        "extracted_text": text,
+        "s3_url": s3_url,
+    }
+
+    signature = await get_text_signature(text)
+    summary = await get_reusable_summary(signature, summary_length)
+    reused = summary is not None
+    if reused:
+        yield {"type": "token", "content": summary}
+    else:
+        tokens = []
+        async for token in summarize_text_stream(text, summary_length):
+            tokens.append(token)
+            yield {"type": "token", "content": token}
+        summary = "".join(tokens).strip()
+        await remember_summary(signature, summary_length, summary)
+
+    result = {
+        "filename": ingested.filename,
+        "extracted_text": text,
+        "summary": summary,
+        "s3_url": s3_url
+    }
+    await cache_result(ingested.content_hash, summary_length, result)
+
+    if not reused and after_summary is not None:
+        await after_summary(result)
+
+    yield {"type": "done", "summary": summary}
@@ -0,0 +1,138 @@
+"""
+Background writer for document history. Requests enqueue DocumentCreate
+records and return; one task per process groups them into batch_writer
+flushes of up to DOCUMENT_WRITER_BATCH_SIZE items or whatever arrived within
+DOCUMENT_WRITER_FLUSH_INTERVAL seconds. Item ids are assigned at enqueue
+time, so retrying a batch can only rewrite the same items.
+"""
+import asyncio
+import os
+from typing import List, Optional
+from uuid import uuid4
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from app.models.documents import DocumentCreate
+from app.services.user_documents import document_item
+from app.utils.aws import aws_clients
+from app.utils.executor import run_in_aws_executor
+
+DOCUMENT_WRITER_BATCH_SIZE = int(os.getenv("DOCUMENT_WRITER_BATCH_SIZE", 25))
+DOCUMENT_WRITER_FLUSH_INTERVAL = float(os.getenv("DOCUMENT_WRITER_FLUSH_INTERVAL", 1))
+DOCUMENT_WRITER_MAX_QUEUE = int(os.getenv("DOCUMENT_WRITER_MAX_QUEUE", 10000))
+DOCUMENT_WRITER_MAX_RETRIES = int(os.getenv("DOCUMENT_WRITER_MAX_RETRIES", 5))
+DOCUMENT_WRITER_RETRY_DELAY = float(os.getenv("DOCUMENT_WRITER_RETRY_DELAY", 0.2))
+DOCUMENT_WRITER_DRAIN_TIMEOUT = float(os.getenv("DOCUMENT_WRITER_DRAIN_TIMEOUT", 10))
+
+_STOP = object()
+
+
+def write_document_batch(table, items: List[dict]) -> None:
+    # batch_writer splits into BatchWriteItem calls and re-sends whatever
+    # DynamoDB returns as UnprocessedItems until everything is written.
+    with table.batch_writer(overwrite_by_pkeys=["id"]) as batch:
+        for item in items:
+            batch.put_item(Item=item)
+
+
+class DocumentWriter:
+    def __init__(
+        self,
+        table=None,
+        batch_size: int = DOCUMENT_WRITER_BATCH_SIZE,
+        flush_interval: float = DOCUMENT_WRITER_FLUSH_INTERVAL,
+        max_queue: int = DOCUMENT_WRITER_MAX_QUEUE,
+        max_retries: int = DOCUMENT_WRITER_MAX_RETRIES,
+        retry_delay: float = DOCUMENT_WRITER_RETRY_DELAY,
+    ):
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.stats = {"enqueued": 0, "written": 0, "batches": 0, "retries": 0, "failed": 0, "dropped": 0}
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    def enqueue(self, document: DocumentCreate) -> Optional[str]:
+        """Queue a document for writing; its id, or None when the queue is full."""
+        # The sentinel may sit in the queue too, so the cap is checked here
+        # rather than with a bounded asyncio.Queue.
+        if self.queue.qsize() >= self.max_queue:
+            self.stats["dropped"] += 1
+            print(f"Document writer queue full, dropping history entry for {document.document_name}")
+            return None
+        document_id = str(uuid4())
+        self.queue.put_nowait(document_item(document, document_id))
+        self.stats["enqueued"] += 1
+        return document_id
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = DOCUMENT_WRITER_DRAIN_TIMEOUT) -> None:
+        """Flush everything already queued, waiting at most timeout seconds."""
+        if self._task is None:
+            # Never started (e.g. a worker process): drain inline.
+            self._task = asyncio.create_task(self._run())
+        self._stopping = True
+        self.queue.put_nowait(_STOP)
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            print(f"Document writer did not drain within {timeout}s, {self.queue.qsize()} entries lost")
+        finally:
+            self._task = None
+            self._stopping = False
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    # Once stopping, whatever is already queued is flushed
+                    # without waiting out the interval.
+                    if self._stopping:
+                        item = self.queue.get_nowait()
+                    else:
+                        item = await asyncio.wait_for(self.queue.get(), deadline - loop.time())
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item is _STOP:
+                    # Back of the line: stop after the items queued behind it.
+                    self.queue.put_nowait(_STOP)
+                    break
+                batch.append(item)
+            await self.flush(batch)
+
+    async def flush(self, items: List[dict]) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                await run_in_aws_executor(write_document_batch, self.table or aws_clients.table("documents"), items)
+                self.stats["written"] += len(items)
+                self.stats["batches"] += 1
+                return
+            except (BotoCoreError, ClientError) as e:
+                if attempt == self.max_retries:
+                    self.stats["failed"] += len(items)
+                    print(f"Document writer gave up on {len(items)} entries: {e}")
+                    return
+                self.stats["retries"] += 1
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+
+document_writer = DocumentWriter()
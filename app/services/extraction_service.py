@@ -0,0 +1,196 @@
+"""
+Extraction routing. Born-digital PDFs are read from their embedded text
+layer in the process pool; only pages without usable text are split out and
+sent to Textract OCR. DOCX parsing also runs in the pool, and images are
+rotated, grayscaled and downscaled there before they go to Textract.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import List, Union
+
+from app.services.ingest_service import IngestedFile
+from app.services.textract_service import (
+    MultiPageDocumentError,
+    extract_text_from_ingested_async,
+    get_textract,
+    lines_from_blocks,
+)
+from app.utils.aws import lazy_module_attributes
+from app.utils.document_parsing import extract_docx_text, extract_pdf_pages, split_pdf_pages
+from app.utils.executor import run_in_aws_executor, run_in_cpu_executor
+from app.utils.image_processing import prepare_image_for_ocr
+from app.utils.metrics import stage, timed
+
+__getattr__ = lazy_module_attributes(__name__, {"textract": get_textract})
+
+logger = logging.getLogger(__name__)
+
+LOCAL_PDF_EXTRACTION = os.getenv("LOCAL_PDF_EXTRACTION", "true").lower() == "true"
+# A page whose text layer has fewer letters/digits than this is treated as
+# scanned (empty layer, or just a page number/watermark) and OCRed instead.
+LOCAL_TEXT_MIN_CHARS = int(os.getenv("LOCAL_TEXT_MIN_CHARS", 20))
+OCR_PAGE_CONCURRENCY = int(os.getenv("OCR_PAGE_CONCURRENCY", 4))
+# Past this many scanned pages one asynchronous Textract job over the whole
+# document beats a sync call per page.
+OCR_SYNC_MAX_PAGES = int(os.getenv("OCR_SYNC_MAX_PAGES", 10))
+IMAGE_PREPROCESSING = os.getenv("IMAGE_PREPROCESSING", "true").lower() == "true"
+# Around 300 DPI for a letter-size page, well above what Textract needs.
+IMAGE_OCR_MAX_SIDE = int(os.getenv("IMAGE_OCR_MAX_SIDE", 2400))
+IMAGE_OCR_JPEG_QUALITY = int(os.getenv("IMAGE_OCR_JPEG_QUALITY", 85))
+RECENT_EXTRACTIONS = 50
+
+extraction_stats = {
+    "pdf_text_layer": 0,
+    "pdf_mixed": 0,
+    "pdf_async_ocr": 0,
+    "pdf_fallback": 0,
+    "pages_text_layer": 0,
+    "pages_ocr": 0,
+    "docx": 0,
+    "image": 0,
+    "image_bytes_in": 0,
+    "image_bytes_out": 0,
+}
+recent_extractions = deque(maxlen=RECENT_EXTRACTIONS)
+
+
+def has_usable_text(text: str) -> bool:
+    return sum(ch.isalnum() for ch in text) >= LOCAL_TEXT_MIN_CHARS
+
+
+def document_source(ingested: IngestedFile) -> Union[bytes, str]:
+    # Spooled uploads are handed to the pool by path so a large file is not
+    # pickled across the process boundary.
+    if ingested.path is not None:
+        return str(ingested.path)
+    return ingested.getvalue()
+
+
+def record_extraction(
+    ingested: IngestedFile, route: str, started: float, pages: List[dict] = None, **details
+) -> None:
+    # Served unauthenticated by /health/extraction, so no filenames: they are
+    # other users' private document names.
+    report = {
+        "ext": ingested.ext,
+        "route": route,
+        "ms": round((time.perf_counter() - started) * 1000, 1),
+        "pages": pages or [],
+        **details,
+    }
+    recent_extractions.append(report)
+    if logger.isEnabledFor(logging.DEBUG):
+        extra = "".join(f" {name}={value}" for name, value in details.items())
+        timings = ", ".join(f"p{p['page']}={p['route']}:{p['ms']}ms" for p in pages or [])
+        logger.debug(
+            "Extracted %s via %s in %sms%s%s",
+            ingested.filename, route, report["ms"], extra, f" [{timings}]" if timings else "",
+        )
+
+
+def get_extraction_stats() -> dict:
+    return {"counters": dict(extraction_stats), "recent": list(recent_extractions)}
+
+
+async def ocr_page(page_bytes: bytes, semaphore: asyncio.Semaphore) -> tuple:
+    async with semaphore:
+        started = time.perf_counter()
+        with timed("textract"):
+            response = await run_in_aws_executor(get_textract().detect_document_text, Document={"Bytes": page_bytes})
+        return lines_from_blocks(response.get("Blocks", [])), time.perf_counter() - started
+
+
+async def extract_pdf_text(ingested: IngestedFile) -> str:
+    started = time.perf_counter()
+    source = document_source(ingested)
+    try:
+        with timed("local_parse"):
+            pages = await run_in_cpu_executor(extract_pdf_pages, source)
+    except Exception as e:
+        # Encrypted, damaged or otherwise unreadable for pypdf: Textract
+        # decides (and raises MultiPageDocumentError for multi-page files).
+        logger.warning("Local PDF parsing failed for %s, using Textract: %s", ingested.filename, e)
+        extraction_stats["pdf_fallback"] += 1
+        text = await extract_text_from_ingested_async(ingested)
+        record_extraction(ingested, "textract", started)
+        return text
+
+    report = [
+        {"page": p["page"], "route": "text", "ms": round(p["seconds"] * 1000, 1)}
+        for p in pages
+    ]
+    scanned = [p["page"] for p in pages if not has_usable_text(p["text"])]
+
+    if len(scanned) > OCR_SYNC_MAX_PAGES:
+        extraction_stats["pdf_async_ocr"] += 1
+        extraction_stats["pages_ocr"] += len(pages)
+        record_extraction(ingested, "async_ocr", started)
+        raise MultiPageDocumentError()
+
+    texts = {p["page"]: p["text"] for p in pages}
+    if scanned:
+        semaphore = asyncio.Semaphore(OCR_PAGE_CONCURRENCY)
+        page_documents = await run_in_cpu_executor(split_pdf_pages, source, scanned)
+        results = await asyncio.gather(*(ocr_page(doc, semaphore) for doc in page_documents))
+        for number, (text, seconds) in zip(scanned, results):
+            texts[number] = text
+            report[number - 1].update(route="ocr", ms=round(seconds * 1000, 1))
+
+    extraction_stats["pdf_mixed" if scanned else "pdf_text_layer"] += 1
+    extraction_stats["pages_ocr"] += len(scanned)
+    extraction_stats["pages_text_layer"] += len(pages) - len(scanned)
+    record_extraction(ingested, "mixed" if scanned else "text_layer", started, report)
+
+    return "\n".join(texts[number].strip() for number in sorted(texts) if texts[number].strip())
+
+
+async def extract_image_text(ingested: IngestedFile) -> str:
+    started = time.perf_counter()
+    try:
+        with timed("image_prepare"):
+            prepared = await run_in_cpu_executor(
+                prepare_image_for_ocr, document_source(ingested), IMAGE_OCR_MAX_SIDE, IMAGE_OCR_JPEG_QUALITY
+            )
+        image_bytes = prepared["bytes"]
+    except Exception as e:
+        # Not decodable by Pillow; Textract may still manage.
+        logger.warning("Image pre-processing failed for %s, sending it as-is: %s", ingested.filename, e)
+        image_bytes = ingested.getvalue()
+    prepared_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    with timed("textract"):
+        response = await run_in_aws_executor(get_textract().detect_document_text, Document={"Bytes": image_bytes})
+
+    extraction_stats["image"] += 1
+    extraction_stats["image_bytes_in"] += ingested.size
+    extraction_stats["image_bytes_out"] += len(image_bytes)
+    record_extraction(
+        ingested, "image", started, bytes_in=ingested.size, bytes_out=len(image_bytes), prepare_ms=prepared_ms
+    )
+    return lines_from_blocks(response.get("Blocks", []))
+
+
+@stage("extract")
+async def extract_text(ingested: IngestedFile) -> str:
+    """
+    Text of an upload. Raises MultiPageDocumentError when the document has to
+    go through an asynchronous Textract job on its S3 copy instead.
+    """
+    if ingested.ext == ".pdf" and LOCAL_PDF_EXTRACTION:
+        return await extract_pdf_text(ingested)
+
+    if ingested.ext == ".docx":
+        started = time.perf_counter()
+        with timed("local_parse"):
+            text = await run_in_cpu_executor(extract_docx_text, document_source(ingested))
+        extraction_stats["docx"] += 1
+        record_extraction(ingested, "docx", started)
+        return text
+
+    if ingested.ext in [".jpg", ".jpeg", ".png"] and IMAGE_PREPROCESSING:
+        return await extract_image_text(ingested)
+
+    return await extract_text_from_ingested_async(ingested)
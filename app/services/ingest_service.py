@@ -0,0 +1,199 @@
+import hashlib
+import io
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile, SpooledTemporaryFile
+from typing import BinaryIO, List, Optional
+
+from fastapi import HTTPException, UploadFile, status
+
+from app.utils.metrics import record_document_size, stage
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+SPOOL_THRESHOLD_BYTES = int(os.getenv("SPOOL_THRESHOLD_BYTES", 5 * 1024 * 1024))
+INGEST_CHUNK_BYTES = 256 * 1024
+
+
+class FileView(io.RawIOBase):
+    """A read-only view of an open file with its own position (os.pread), so
+    several readers can share one file descriptor."""
+
+    def __init__(self, fd: int, size: int):
+        self._fd = fd
+        self._size = size
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self._size}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        data = os.pread(self._fd, min(len(buffer), self._size - self._position), self._position)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+class IngestedFile:
+    """
+    An upload read exactly once: hashed incrementally while streaming and kept
+    in memory, or spooled to disk once it grows past SPOOL_THRESHOLD_BYTES.
+    The cache key, extraction and S3 steps all share this single copy. An
+    upload the form parser has already buffered is adopted instead of copied.
+
+    Whoever else needs the data after its owner is done with it (a shared
+    single-flight call) takes a reference with retain(); the data is freed by
+    the close() that drops the last reference.
+    """
+
+    def __init__(self, filename: str, spool_threshold: int = SPOOL_THRESHOLD_BYTES):
+        self.filename = filename
+        self.ext = Path(filename).suffix.lower()
+        self.size = 0
+        self.path: Optional[Path] = None
+        self._spool_threshold = spool_threshold
+        self._hasher = hashlib.sha256()
+        self._chunks: List[bytes] = []
+        self._spool: Optional[BinaryIO] = None
+        self._value: Optional[bytes] = None
+        self._adopted: Optional[BinaryIO] = None
+        self._refs = 1
+
+    def write(self, chunk: bytes) -> None:
+        self._hasher.update(chunk)
+        self.size += len(chunk)
+
+        if self._spool is None and self.size > self._spool_threshold:
+            self._spool = NamedTemporaryFile(delete=False, suffix=self.ext)
+            self.path = Path(self._spool.name)
+            for buffered in self._chunks:
+                self._spool.write(buffered)
+            self._chunks = []
+
+        if self._spool is not None:
+            self._spool.write(chunk)
+        else:
+            self._chunks.append(chunk)
+
+    def hash(self, chunk: bytes) -> None:
+        """Account for a chunk whose bytes are stored by the file adopt() takes."""
+        self._hasher.update(chunk)
+        self.size += len(chunk)
+
+    def adopt(self, file: BinaryIO) -> None:
+        """
+        Use file, which holds the bytes passed to hash(), as the stored copy.
+        A file on disk is read in place; one still in memory becomes the
+        shared bytes object. IngestedFile closes it.
+        """
+        # SpooledTemporaryFile.fileno() would roll an in-memory file over to
+        # disk; take the bytes it holds instead.
+        if isinstance(file, SpooledTemporaryFile) and not file._rolled:
+            self._value = file._file.getvalue()
+            file.close()
+            return
+        try:
+            file.fileno()
+        except (OSError, io.UnsupportedOperation):
+            file.seek(0)
+            self._value = file.read()
+            file.close()
+            return
+        self._adopted = file
+
+    def finish(self) -> None:
+        if self._spool is not None:
+            self._spool.close()
+        else:
+            self._value = b"".join(self._chunks)
+            self._chunks = []
+
+    @property
+    def content_hash(self) -> str:
+        return self._hasher.hexdigest()
+
+    def digest_with(self, suffix: str) -> str:
+        """sha256(file_bytes + suffix) without touching the file bytes again."""
+        hasher = self._hasher.copy()
+        hasher.update(suffix.encode())
+        return hasher.hexdigest()
+
+    @property
+    def closed(self) -> bool:
+        return self._refs <= 0
+
+    def retain(self) -> "IngestedFile":
+        self._refs += 1
+        return self
+
+    def _check_open(self) -> None:
+        if self.closed:
+            raise ValueError(f"{self.filename} was read after it was closed")
+
+    def getvalue(self) -> bytes:
+        self._check_open()
+        # In-memory uploads return the one shared bytes object; spooled uploads
+        # are read back from disk once and then kept for later callers.
+        if self._value is None:
+            if self._adopted is not None:
+                with self.open() as f:
+                    self._value = f.read()
+            else:
+                self._value = self.path.read_bytes()
+        return self._value
+
+    def open(self) -> BinaryIO:
+        self._check_open()
+        if self._adopted is not None:
+            return io.BufferedReader(FileView(self._adopted.fileno(), self.size))
+        if self.path is not None:
+            return open(self.path, "rb")
+        return io.BytesIO(self._value)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self._refs -= 1
+        if self._refs:
+            return
+        self._value = None
+        self._chunks = []
+        if self._spool is not None:
+            self._spool.close()
+        if self._adopted is not None:
+            self._adopted.close()
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+
+
+@stage("ingest")
+async def ingest_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> IngestedFile:
+    """
+    The form parser has already buffered the upload (on disk past 1MB); it is
+    hashed in place and that buffer is kept rather than copied again.
+    """
+    ingested = IngestedFile(file.filename)
+    try:
+        while chunk := await file.read(INGEST_CHUNK_BYTES):
+            if ingested.size + len(chunk) > max_bytes:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"File exceeds the maximum upload size of {max_bytes} bytes",
+                )
+            ingested.hash(chunk)
+        # Taken over from the request: its file is closed with the form when
+        # the response ends, and the ingested file can be needed for longer.
+        ingested.adopt(file.file)
+        file.file = io.BytesIO()
+    except BaseException:
+        ingested.close()
+        raise
+    record_document_size(ingested.ext, ingested.size)
+    return ingested
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import time
+from typing import Iterable, Optional, Set
+from uuid import uuid4
+
+from redis.exceptions import RedisError
+
+from app.services.redis_service import redis_client
+
+JOB_QUEUE_KEY = "jobs:queue"
+JOB_PROCESSING_KEY = "jobs:processing"
+JOB_TTL = 86400  # one day
+# A claimed job holds a lease that its worker renews while the job runs; a
+# job in the processing list without one was left there by a dead worker.
+JOB_LEASE_TTL = int(os.getenv("JOB_LEASE_TTL", 60))
+
+TERMINAL_STATUSES = {"completed", "failed"}
+
+
+def job_key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+def job_lease_key(job_id: str) -> str:
+    return f"job:{job_id}:lease"
+
+
+async def create_job(fields: dict, enqueue: bool = True) -> str:
+    job_id = str(uuid4())
+    job = {"id": job_id, "created_at": str(time.time()), **fields}
+
+    pipe = redis_client.pipeline()
+    pipe.hset(job_key(job_id), mapping=job)
+    pipe.expire(job_key(job_id), JOB_TTL)
+    if enqueue:
+        pipe.rpush(JOB_QUEUE_KEY, job_id)
+    await pipe.execute()
+
+    return job_id
+
+
+async def get_job(job_id: str) -> Optional[dict]:
+    job = await redis_client.hgetall(job_key(job_id))
+    if not job:
+        return None
+    return {k.decode(): v.decode() for k, v in job.items()}
+
+
+async def update_job(job_id: str, **fields) -> None:
+    fields["updated_at"] = str(time.time())
+    await redis_client.hset(job_key(job_id), mapping=fields)
+
+
+async def claim_next_job(timeout: int = 5) -> Optional[str]:
+    # The id stays in the processing list until the worker acknowledges it, so
+    # a crashed worker leaves a trace that can be requeued.
+    job_id = await redis_client.blmove(JOB_QUEUE_KEY, JOB_PROCESSING_KEY, timeout, "LEFT", "RIGHT")
+    if not job_id:
+        return None
+    await redis_client.set(job_lease_key(job_id.decode()), "1", ex=JOB_LEASE_TTL)
+    return job_id.decode()
+
+
+async def keep_job_lease(job_id: str) -> None:
+    """Renew the lease of a running job until cancelled."""
+    while True:
+        await asyncio.sleep(JOB_LEASE_TTL / 3)
+        try:
+            await redis_client.expire(job_lease_key(job_id), JOB_LEASE_TTL)
+        except RedisError as e:
+            print(f"Renewing the lease of job {job_id} failed: {e}")
+
+
+async def ack_job(job_id: str) -> None:
+    pipe = redis_client.pipeline()
+    pipe.lrem(JOB_PROCESSING_KEY, 1, job_id)
+    pipe.delete(job_lease_key(job_id))
+    await pipe.execute()
+
+
+async def unleased_jobs() -> Set[str]:
+    """Ids in the processing list without a live lease."""
+    job_ids = [job_id.decode() for job_id in await redis_client.lrange(JOB_PROCESSING_KEY, 0, -1)]
+    pipe = redis_client.pipeline()
+    for job_id in job_ids:
+        pipe.exists(job_lease_key(job_id))
+    leased = await pipe.execute() if job_ids else []
+    return {job_id for job_id, has_lease in zip(job_ids, leased) if not has_lease}
+
+
+async def requeue_stale_jobs(job_ids: Iterable[str]) -> int:
+    """
+    Move those of job_ids that still have no lease from the processing list
+    back onto the queue; jobs a live worker is running keep their place.
+    """
+    moved = 0
+    for job_id in job_ids:
+        if await redis_client.exists(job_lease_key(job_id)):
+            continue
+        # Only the process that takes the id out of the list requeues it.
+        if await redis_client.lrem(JOB_PROCESSING_KEY, 1, job_id):
+            await redis_client.lpush(JOB_QUEUE_KEY, job_id)
+            moved += 1
+    return moved
@@ -0,0 +1,361 @@
+"""
+Chat completion calls to the LLM providers, with the failure handling the
+bare openai.ChatCompletion.acreate call lacks:
+
+  - one pooled aiohttp session per process (openai 0.27 opens a new session,
+    and a new TLS connection, for every call unless given one)
+  - a deadline per call and a timeout per attempt
+  - retries with full-jitter exponential backoff on timeouts, connection
+    errors, 429 and 5xx, honouring Retry-After
+  - optional hedging: a second identical request when the first has not
+    answered after LLM_HEDGE_AFTER, first answer wins
+  - a circuit breaker per provider; while the primary's is open calls go to
+    LLM_FALLBACK_PROVIDER, or fail fast with LLMUnavailableError
+  - latency percentiles and event counts per provider
+
+Providers speak the OpenAI chat completions API. "openai" is the real one
+and "stub" is app.utils.fake_llm_server, for load tests and CI without
+network; others can be added with register_provider.
+"""
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+import openai
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+LLM_FALLBACK_PROVIDER = os.getenv("LLM_FALLBACK_PROVIDER")
+LLM_STUB_URL = os.getenv("LLM_STUB_URL", "http://127.0.0.1:8080/v1")
+
+# A whole call, retries included, never takes longer than LLM_DEADLINE.
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", 120))
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", 60))
+# Longest pause between two chunks of a streamed answer.
+LLM_STREAM_IDLE_TIMEOUT = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT", 30))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 8))
+# Seconds, or a latency percentile of the provider such as "p95"; empty or
+# 0 disables hedging. Only non-streamed calls are hedged.
+LLM_HEDGE_AFTER = os.getenv("LLM_HEDGE_AFTER", "")
+# Percentile hedging starts once this many latencies are known.
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 50))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", 30))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 100))
+LLM_STATS_WINDOW = int(os.getenv("LLM_STATS_WINDOW", 1000))
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMUnavailableError(Exception):
+    """Every configured provider has its circuit breaker open."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError)):
+        return True
+    if isinstance(error, (
+        openai.error.Timeout,
+        openai.error.APIConnectionError,
+        openai.error.RateLimitError,
+        openai.error.ServiceUnavailableError,
+        openai.error.TryAgain,
+    )):
+        return True
+    if isinstance(error, openai.error.APIError):
+        return error.http_status is None or error.http_status in RETRYABLE_STATUS
+    return False
+
+
+def retry_delay(attempt: int, error: BaseException) -> float:
+    retry_after = getattr(error, "headers", None) and error.headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+
+def percentile(values, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class CircuitBreaker:
+    """
+    Opens after LLM_BREAKER_FAILURES failures in a row; after
+    LLM_BREAKER_RESET seconds one trial call is let through and its outcome
+    closes or reopens it.
+    """
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, reset_after: float = LLM_BREAKER_RESET):
+        self.failures_to_open = failures
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_after:
+            self.state = "half_open"
+            self.trial_in_flight = False
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def release(self) -> None:
+        """The call ended without an outcome (it was cancelled); a half-open
+        breaker lets the next call through as its trial."""
+        self.trial_in_flight = False
+
+    def record_failure(self) -> bool:
+        """True when this failure opened the breaker."""
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failures_to_open):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+
+class Provider:
+    """
+    An OpenAI-compatible chat completions endpoint. Without api_base and
+    api_key it uses openai.api_base and openai.api_key, which openai sets
+    from OPENAI_API_BASE and OPENAI_API_KEY.
+    """
+
+    def __init__(self, name: str, api_base: Optional[str], api_key: Optional[str]):
+        self.name = name
+        self.api_base = api_base
+        self.api_key = api_key
+        self.breaker = CircuitBreaker()
+        self.latencies = deque(maxlen=LLM_STATS_WINDOW)
+        self.stats = {
+            "calls": 0,
+            "failures": 0,
+            "attempt_errors": 0,
+            "timeouts": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "breaker_opens": 0,
+            "rejected": 0,
+        }
+
+    async def create(self, **kwargs):
+        if self.api_base is not None:
+            kwargs["api_base"] = self.api_base
+        if self.api_key is not None:
+            kwargs["api_key"] = self.api_key
+        return await openai.ChatCompletion.acreate(**kwargs)
+
+    def hedge_delay(self) -> Optional[float]:
+        if not LLM_HEDGE_AFTER:
+            return None
+        if LLM_HEDGE_AFTER.startswith("p"):
+            if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            return percentile(self.latencies, float(LLM_HEDGE_AFTER[1:]))
+        return float(LLM_HEDGE_AFTER) or None
+
+    def get_stats(self) -> dict:
+        latencies = list(self.latencies)
+
+        def ms(value):
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            **self.stats,
+            "api_base": self.api_base or openai.api_base,
+            "breaker": self.breaker.state,
+            "p50_ms": ms(percentile(latencies, 50)),
+            "p95_ms": ms(percentile(latencies, 95)),
+            "p99_ms": ms(percentile(latencies, 99)),
+            "max_ms": ms(max(latencies) if latencies else None),
+        }
+
+
+providers: Dict[str, Provider] = {}
+
+
+def register_provider(provider: Provider) -> None:
+    providers[provider.name] = provider
+
+
+register_provider(Provider("openai", None, None))
+register_provider(Provider("stub", LLM_STUB_URL, "stub"))
+
+
+async def hedged(provider: Provider, attempt: Callable[[], Awaitable], timeout: float, delay: float):
+    """attempt(), plus a second attempt() if the first is still running after delay."""
+    tasks = [asyncio.ensure_future(attempt())]
+    deadline = asyncio.get_running_loop().time() + timeout
+    errors = []
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            provider.stats["hedges"] += 1
+            tasks.append(asyncio.ensure_future(attempt()))
+        while True:
+            pending = [task for task in tasks if not task.done()]
+            if pending:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for i, task in enumerate(tasks):
+                if task.done() and task not in errors:
+                    if task.exception() is None:
+                        if i:
+                            provider.stats["hedge_wins"] += 1
+                        return task.result()
+                    errors.append(task)
+            if len(errors) == len(tasks):
+                raise errors[0].exception()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+class LLMClient:
+    def __init__(self, provider_names: List[str]):
+        self.provider_names = provider_names
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop = None
+
+    def use_session(self) -> None:
+        """Makes openai calls in the current task go through the pooled session."""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=LLM_MAX_CONNECTIONS))
+            self._session_loop = loop
+        openai.aiosession.set(self._session)
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def pick_provider(self) -> Provider:
+        for name in self.provider_names:
+            provider = providers[name]
+            if provider.breaker.allow():
+                return provider
+            provider.stats["rejected"] += 1
+        raise LLMUnavailableError(f"LLM provider {self.provider_names[0]} is unavailable, try again later")
+
+    async def call(self, attempt: Callable[[Provider], Awaitable], hedge: bool):
+        self.use_session()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + LLM_DEADLINE
+        provider = None
+        last_error: Optional[BaseException] = None
+
+        for retry in range(LLM_MAX_RETRIES + 1):
+            if provider is not None:
+                provider.stats["retries"] += 1
+            provider = self.pick_provider()
+            timeout = min(LLM_ATTEMPT_TIMEOUT, deadline - loop.time())
+            delay = provider.hedge_delay() if hedge else None
+            started = time.perf_counter()
+            try:
+                if delay is not None and delay < timeout:
+                    result = await hedged(provider, lambda: attempt(provider), timeout, delay)
+                else:
+                    result = await asyncio.wait_for(attempt(provider), timeout)
+            except asyncio.CancelledError:
+                # The caller went away; that says nothing about the provider,
+                # but a half-open trial must not stay in flight forever.
+                provider.breaker.release()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # The request itself is wrong; the provider is fine.
+                    provider.breaker.record_success()
+                    provider.stats["calls"] += 1
+                    provider.stats["failures"] += 1
+                    raise
+                last_error = e
+                provider.stats["attempt_errors"] += 1
+                if isinstance(e, asyncio.TimeoutError):
+                    provider.stats["timeouts"] += 1
+                if provider.breaker.record_failure():
+                    provider.stats["breaker_opens"] += 1
+                    print(f"LLM provider {provider.name} circuit opened after {provider.breaker.failures} failures")
+                pause = retry_delay(retry, e)
+                if retry == LLM_MAX_RETRIES or loop.time() + pause >= deadline:
+                    break
+                print(f"LLM call to {provider.name} failed ({type(e).__name__}: {e}), retrying in {pause:.2f}s")
+                await asyncio.sleep(pause)
+                continue
+
+            provider.breaker.record_success()
+            provider.stats["calls"] += 1
+            provider.latencies.append(time.perf_counter() - started)
+            return result
+
+        provider.stats["calls"] += 1
+        provider.stats["failures"] += 1
+        if isinstance(last_error, asyncio.TimeoutError):
+            raise openai.error.Timeout(f"LLM call to {provider.name} timed out") from last_error
+        raise last_error
+
+    async def chat(self, **kwargs):
+        """A chat completion; kwargs are those of openai.ChatCompletion.acreate."""
+        return await self.call(lambda provider: provider.create(**kwargs), hedge=True)
+
+    async def stream(self, **kwargs) -> AsyncIterator:
+        """
+        A streamed chat completion. Retries only cover the time to the first
+        chunk; once chunks have been handed out a failure is raised.
+        """
+        async def open_stream(provider: Provider):
+            response = await provider.create(stream=True, **kwargs)
+            iterator = response.__aiter__()
+            try:
+                first = await iterator.__anext__()
+            except StopAsyncIteration:
+                first = None
+            return iterator, first
+
+        iterator, first = await self.call(open_stream, hedge=False)
+        return self._chunks(iterator, first)
+
+    @staticmethod
+    async def _chunks(iterator, first) -> AsyncIterator:
+        if first is None:
+            return
+        yield first
+        while True:
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), LLM_STREAM_IDLE_TIMEOUT)
+            except StopAsyncIteration:
+                return
+            yield chunk
+
+
+llm_client = LLMClient([LLM_PROVIDER] + ([LLM_FALLBACK_PROVIDER] if LLM_FALLBACK_PROVIDER else []))
+
+
+def get_llm_stats() -> dict:
+    return {name: providers[name].get_stats() for name in llm_client.provider_names}
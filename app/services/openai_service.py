@@ -1,28 +1,227 @@
+import asyncio
+import hashlib
+import logging
 import os
+from typing import AsyncIterator, List
+
 import openai
 
 from app.common import SummaryLength
+from app.services.llm_client import llm_client
+from app.services.redis_service import redis_client
+from app.utils.executor import run_in_cpu_executor
+from app.utils.metrics import METRICS_ENABLED, record_llm_tokens, record_prompt_compaction, stage, timed
+from app.utils.text_compaction import compact_for_prompt
+from app.utils.tokens import chunk_text, count_tokens
+
+logger = logging.getLogger(__name__)
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-async def summarize_text(text: str, summary_length: SummaryLength) -> str:
+SUMMARY_MODEL = "gpt-4o-mini"
+# Bump when the summary prompts change; it is part of the summary cache key,
+# so cached summaries are invalidated while cached extractions are kept.
+SUMMARY_PROMPT_VERSION = "1"
+
+MAX_TOKENS_MAP = {
+    "short": 150,
+    "medium": 200,
+    "long": 350,
+}
+
+# Most document tokens read for one summary, after compaction; longer texts
+# keep their start and end. Long documents are still map-reduced below, so
+# the budget bounds the cost of a single upload rather than fitting one call.
+INPUT_TOKEN_BUDGET = {
+    "short": int(os.getenv("INPUT_TOKEN_BUDGET_SHORT", 32000)),
+    "medium": int(os.getenv("INPUT_TOKEN_BUDGET_MEDIUM", 64000)),
+    "long": int(os.getenv("INPUT_TOKEN_BUDGET_LONG", 128000)),
+}
+PROMPT_COMPACTION_ENABLED = os.getenv("PROMPT_COMPACTION_ENABLED", "true").lower() == "true"
+# Longer texts are compacted in the process pool.
+COMPACTION_INLINE_CHARS = int(os.getenv("COMPACTION_INLINE_CHARS", 20000))
+
+# Documents longer than one chunk are summarized map-reduce style: every chunk
+# is summarized on its own (at most SUMMARY_CHUNK_CONCURRENCY calls at once)
+# and the chunk summaries are then summarized to the requested length.
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", 12000))
+SUMMARY_CHUNK_CONCURRENCY = int(os.getenv("SUMMARY_CHUNK_CONCURRENCY", 8))
+CHUNK_SUMMARY_MAX_TOKENS = int(os.getenv("CHUNK_SUMMARY_MAX_TOKENS", 300))
+CHUNK_SUMMARY_CACHE_TTL = 604800  # one week
+CHUNK_PROMPT_VERSION = "1"
+
+
+def build_summary_messages(text: str, summary_length: SummaryLength) -> list:
     prompt = (
         "You are a helpful assistant. "
         f"Please provide a **{summary_length.value}** summary of the following document text:\n\n"
         f"{text}\n\n"
         "Summary:"
     )
+    return [{"role": "user", "content": prompt}]
+
 
-    max_tokens_map = {
-        "short": 150,
-        "medium": 200,
-        "long": 350,
-    }
-
-    response = await openai.ChatCompletion.acreate(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=max_tokens_map[summary_length.value],
-        temperature=0.3,
+def build_chunk_messages(chunk: str) -> list:
+    prompt = (
+        "You are a helpful assistant. "
+        "The following text is one section of a longer document. "
+        "Summarize it concisely, keeping names, figures and dates:\n\n"
+        f"{chunk}\n\n"
+        "Summary:"
+    )
+    return [{"role": "user", "content": prompt}]
+
+
+def build_reduce_messages(chunk_summaries: List[str], summary_length: SummaryLength) -> list:
+    sections = "\n\n".join(f"Section {i + 1}:\n{s}" for i, s in enumerate(chunk_summaries))
+    prompt = (
+        "You are a helpful assistant. "
+        "The following are summaries of consecutive sections of one document. "
+        f"Please provide a **{summary_length.value}** summary of the whole document:\n\n"
+        f"{sections}\n\n"
+        "Summary:"
     )
-    return response.choices[0].message.content.strip()
+    return [{"role": "user", "content": prompt}]
+
+
+def record_usage(messages: list, response, completion: str) -> None:
+    # Non-streaming responses report usage; streamed ones do not, so the
+    # prompt is counted locally and the completion is whatever was received.
+    if not METRICS_ENABLED:
+        return
+    usage = response.get("usage") if isinstance(response, dict) else None
+    if usage:
+        record_llm_tokens(SUMMARY_MODEL, usage["prompt_tokens"], usage["completion_tokens"])
+    else:
+        prompt = "\n".join(message["content"] for message in messages)
+        record_llm_tokens(SUMMARY_MODEL, count_tokens(prompt), count_tokens(completion))
+
+
+def chunk_summary_cache_key(chunk: str) -> str:
+    digest = hashlib.sha256(f"{SUMMARY_MODEL}:{CHUNK_PROMPT_VERSION}:{chunk}".encode()).hexdigest()
+    return f"chunk_summary:{digest}"
+
+
+async def summarize_chunk(chunk: str) -> str:
+    cache_key = chunk_summary_cache_key(chunk)
+    cached = await redis_client.get(cache_key)
+    if cached:
+        return cached.decode()
+
+    messages = build_chunk_messages(chunk)
+    with timed("llm"):
+        response = await llm_client.chat(
+            model=SUMMARY_MODEL,
+            messages=messages,
+            max_tokens=CHUNK_SUMMARY_MAX_TOKENS,
+            temperature=0.3,
+        )
+    summary = response.choices[0].message.content.strip()
+    record_usage(messages, response, summary)
+    await redis_client.set(cache_key, summary, ex=CHUNK_SUMMARY_CACHE_TTL)
+    return summary
+
+
+async def summarize_chunks(chunks: List[str]) -> List[str]:
+    semaphore = asyncio.Semaphore(SUMMARY_CHUNK_CONCURRENCY)
+
+    async def bounded(chunk: str) -> str:
+        async with semaphore:
+            return await summarize_chunk(chunk)
+
+    return await asyncio.gather(*(bounded(chunk) for chunk in chunks))
+
+
+async def compact_prompt_text(text: str, summary_length: SummaryLength) -> str:
+    """
+    The document text as it goes into the prompt: repeated page headers and
+    footers, hyphenated line breaks and blank-line runs removed, and cut to
+    the input token budget of the summary length.
+    """
+    if not PROMPT_COMPACTION_ENABLED:
+        return text
+    budget = INPUT_TOKEN_BUDGET[summary_length.value]
+    with timed("compact"):
+        if len(text) <= COMPACTION_INLINE_CHARS:
+            compacted = compact_for_prompt(text, budget)
+        else:
+            compacted = await run_in_cpu_executor(compact_for_prompt, text, budget)
+
+    before, after = compacted["tokens_before"], compacted["tokens_after"]
+    truncated = compacted["tokens_compacted"] - after
+    record_prompt_compaction(before - compacted["tokens_compacted"], truncated)
+    if before:
+        logger.debug(
+            "Prompt compaction saved %d of %d tokens (%.0f%%), %d over the %s budget",
+            before - after, before, (before - after) / before * 100, truncated, summary_length.value,
+        )
+    return compacted["text"]
+
+
+async def prepare_summary_messages(text: str, summary_length: SummaryLength) -> list:
+    text = await compact_prompt_text(text, summary_length)
+    chunks = chunk_text(text, SUMMARY_CHUNK_TOKENS)
+    if len(chunks) <= 1:
+        return build_summary_messages(text, summary_length)
+
+    chunk_summaries = await summarize_chunks(chunks)
+    # Very long documents can produce more summary text than fits in one
+    # call; keep folding until the reduce input fits in a single chunk.
+    combined_tokens = count_tokens("\n\n".join(chunk_summaries))
+    while combined_tokens > SUMMARY_CHUNK_TOKENS:
+        chunk_summaries = await summarize_chunks(chunk_text("\n\n".join(chunk_summaries), SUMMARY_CHUNK_TOKENS))
+        folded_tokens = count_tokens("\n\n".join(chunk_summaries))
+        if folded_tokens >= combined_tokens:
+            break
+        combined_tokens = folded_tokens
+    return build_reduce_messages(chunk_summaries, summary_length)
+
+
+def estimate_summary_tokens(text: str, summary: str, summary_length: SummaryLength) -> int:
+    """
+    Roughly what summarizing text cost: the document is read once (by the
+    single call, or chunk by chunk), chunk summaries are written and read
+    back when it was split, and the summary is written. Only the input token
+    budget of the summary length is read of a longer document.
+    """
+    text_tokens = count_tokens(text)
+    if PROMPT_COMPACTION_ENABLED:
+        text_tokens = min(text_tokens, INPUT_TOKEN_BUDGET[summary_length.value])
+    chunks = -(-text_tokens // SUMMARY_CHUNK_TOKENS) if text_tokens > SUMMARY_CHUNK_TOKENS else 0
+    return text_tokens + 2 * chunks * CHUNK_SUMMARY_MAX_TOKENS + count_tokens(summary)
+
+
+@stage("summarize")
+async def summarize_text(text: str, summary_length: SummaryLength) -> str:
+    messages = await prepare_summary_messages(text, summary_length)
+    with timed("llm"):
+        response = await llm_client.chat(
+            model=SUMMARY_MODEL,
+            messages=messages,
+            max_tokens=MAX_TOKENS_MAP[summary_length.value],
+            temperature=0.3,
+        )
+    summary = response.choices[0].message.content.strip()
+    record_usage(messages, response, summary)
+    return summary
+
+
+async def summarize_text_stream(text: str, summary_length: SummaryLength) -> AsyncIterator[str]:
+    """Yield summary tokens as the model produces them."""
+    messages = await prepare_summary_messages(text, summary_length)
+    # For a stream the llm stage ends at the first response byte; the rest
+    # is paced by the client reading the tokens.
+    with timed("llm"):
+        response = await llm_client.stream(
+            model=SUMMARY_MODEL,
+            messages=messages,
+            max_tokens=MAX_TOKENS_MAP[summary_length.value],
+            temperature=0.3,
+        )
+    received = []
+    async for chunk in response:
+        content = chunk.choices[0].delta.get("content")
+        if content:
+            received.append(content)
+            yield content
+    record_usage(messages, None, "".join(received))
@@ -1,21 +1,134 @@
-import boto3
 import hashlib
-from datetime import datetime
+import mimetypes
+import os
 from pathlib import Path
+from urllib.parse import quote
+
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+from app.services.ingest_service import INGEST_CHUNK_BYTES, IngestedFile
+from app.utils.aws import aws_clients, lazy_module_attributes
+from app.utils.executor import run_in_aws_executor
+from app.utils.metrics import stage
 
-s3_client = boto3.client("s3", region_name="us-east-1")
 BUCKET_NAME = "document-uploads-bucket-88389272"
 
+# Files above the threshold are sent as concurrent multipart uploads.
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", 16 * 1024 * 1024))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE", 8 * 1024 * 1024))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", 8))
+
+transfer_config = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD,
+    multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+    max_concurrency=S3_MAX_CONCURRENCY,
+)
+
+__getattr__ = lazy_module_attributes(__name__, {"s3_client": lambda: aws_clients.client("s3")})
+
+s3_stats = {
+    "uploads": 0,
+    "deduplicated": 0,
+    "bytes_uploaded": 0,
+    "bytes_deduplicated": 0,
+}
+
+
+def build_s3_key(file_hash: str) -> str:
+    """
+    Objects are stored under the sha256 of their content, so the same file
+    is stored once whatever it is called and whenever it is uploaded. The
+    name each user gave it is kept in their document history.
+    """
+    return f"documents/sha256/{file_hash}"
+
+
+def object_exists(s3_key: str) -> bool:
+    """
+    Whether the object is already stored. The HEAD needs s3:GetObject on the
+    bucket's objects, and s3:ListBucket on the bucket for a missing key to be
+    a 404: without it S3 answers 403, which is taken as "unknown" and the
+    file is uploaded again rather than failing the upload.
+    """
+    try:
+        aws_clients.client("s3").head_object(Bucket=BUCKET_NAME, Key=s3_key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound", "403", "AccessDenied", "Forbidden"):
+            return False
+        raise
+    return True
+
+
+def upload_extra_args(file_hash: str, original_filename: str) -> dict:
+    # Metadata values must be ASCII; the name is the one of the first upload.
+    extra_args = {"Metadata": {"sha256": file_hash, "original-filename": quote(original_filename)}}
+    content_type, _ = mimetypes.guess_type(original_filename)
+    if content_type:
+        extra_args["ContentType"] = content_type
+    return extra_args
+
+
+def put_content_addressed(fileobj, file_hash: str, size: int, original_filename: str) -> str:
+    s3_key = build_s3_key(file_hash)
+    if object_exists(s3_key):
+        s3_stats["deduplicated"] += 1
+        s3_stats["bytes_deduplicated"] += size
+    else:
+        aws_clients.client("s3").upload_fileobj(
+            fileobj,
+            BUCKET_NAME,
+            s3_key,
+            ExtraArgs=upload_extra_args(file_hash, original_filename),
+            Config=transfer_config,
+        )
+        s3_stats["uploads"] += 1
+        s3_stats["bytes_uploaded"] += size
+    return f"s3://{BUCKET_NAME}/{s3_key}"
+
+
 def upload_file_to_s3(file_path: Path, original_filename: str) -> str:
+    hasher = hashlib.sha256()
     with open(file_path, "rb") as f:
-        file_bytes = f.read()
-        file_hash = hashlib.sha256(file_bytes).hexdigest()[:8]
+        for chunk in iter(lambda: f.read(INGEST_CHUNK_BYTES), b""):
+            hasher.update(chunk)
+        f.seek(0)
+        return put_content_addressed(f, hasher.hexdigest(), os.fstat(f.fileno()).st_size, original_filename)
+
+
+def upload_ingested_to_s3(ingested: IngestedFile) -> str:
+    # The content hash was computed while the upload was streamed in, so the
+    # file is not read a second time just to build the key.
+    with ingested.open() as fileobj:
+        return put_content_addressed(fileobj, ingested.content_hash, ingested.size, ingested.filename)
+
+
+def s3_https_url(s3_url: str) -> str:
+    """https form of an s3:// url, for clients and the document history."""
+    bucket, key = s3_url.removeprefix("s3://").split("/", 1)
+    return f"https://{bucket}.s3.amazonaws.com/{quote(key)}"
+
+
+@stage("s3_upload")
+async def upload_ingested_to_s3_async(ingested: IngestedFile) -> str:
+    return await run_in_aws_executor(upload_ingested_to_s3, ingested)
+
+
+def download_s3_url_to_ingested(s3_url: str, filename: str) -> IngestedFile:
+    s3_key = s3_url.removeprefix(f"s3://{BUCKET_NAME}/")
+    response = aws_clients.client("s3").get_object(Bucket=BUCKET_NAME, Key=s3_key)
 
-    today = datetime.utcnow()
-    folder_path = f"uploads/{today.year}/{today.month:02d}/{today.day:02d}"
-    s3_key = f"{folder_path}/{file_hash}_{original_filename}"
+    ingested = IngestedFile(filename)
+    try:
+        for chunk in response["Body"].iter_chunks(INGEST_CHUNK_BYTES):
+            ingested.write(chunk)
+        ingested.finish()
+    except BaseException:
+        ingested.close()
+        raise
+    return ingested
 
-    s3_client.upload_file(str(file_path), BUCKET_NAME, s3_key)
 
-    s3_url = f"s3://{BUCKET_NAME}/{s3_key}"
-    return s3_url
+@stage("s3_download")
+async def download_s3_url_to_ingested_async(s3_url: str, filename: str) -> IngestedFile:
+    return await run_in_aws_executor(download_s3_url_to_ingested, s3_url, filename)
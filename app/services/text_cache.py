@@ -0,0 +1,189 @@
+"""
+Summary reuse by extracted text, checked after extraction and before the
+LLM. It catches the uploads the file-hash cache misses: re-exported or
+re-scanned PDFs and files with edited metadata.
+
+  textsummary:v{TEXT_CACHE_VERSION}:{text_hash}:{length}:{model}:{prompt version}
+      the summary of a text, keyed by the sha256 of its normalized form
+  neardup:v{TEXT_CACHE_VERSION}:sig:{text_hash}
+      numbers digest + packed MinHash of that text
+  neardup:v{TEXT_CACHE_VERSION}:{bands}:{band}:{digest}
+      set of text hashes whose MinHash has that LSH band digest
+
+A lookup is one pipelined round trip for the exact key and the band sets,
+then one MGET for the signatures and summaries of the candidates. A
+candidate is reused when its estimated similarity is at least
+NEAR_DUPLICATE_MIN_SIMILARITY and its text has exactly the same numbers,
+so invoices cut from one template never share a summary. See
+benchmarks/bench_near_duplicates.py for the detection and false-positive
+rates behind the defaults.
+"""
+import logging
+import os
+import time
+from typing import Optional
+
+from redis.exceptions import RedisError
+
+from app.common import SummaryLength
+from app.services.openai_service import SUMMARY_MODEL, SUMMARY_PROMPT_VERSION
+from app.services.redis_service import redis_client
+from app.utils.executor import run_in_cpu_executor
+from app.utils.fingerprint import TextSignature, lsh_bands, pack_minhash, similarity, text_signature, unpack_minhash
+from app.utils.metrics import record_cache_lookup, timed
+
+logger = logging.getLogger(__name__)
+
+TEXT_CACHE_VERSION = "1"
+TEXT_CACHE_TTL = 604800  # one week
+TEXT_CACHE_ENABLED = os.getenv("TEXT_CACHE_ENABLED", "true").lower() == "true"
+NEAR_DUPLICATE_ENABLED = os.getenv("NEAR_DUPLICATE_ENABLED", "true").lower() == "true"
+# Estimated Jaccard similarity of the 3-word shingles at which two texts
+# count as the same document.
+NEAR_DUPLICATE_MIN_SIMILARITY = float(os.getenv("NEAR_DUPLICATE_MIN_SIMILARITY", 0.8))
+# 16 bands of 4 bins make a text of similarity 0.8 a candidate with
+# probability 0.9998; candidates are then checked against the threshold.
+NEAR_DUPLICATE_BANDS = int(os.getenv("NEAR_DUPLICATE_BANDS", 16))
+# Short texts have too few shingles for a stable MinHash.
+NEAR_DUPLICATE_MIN_WORDS = int(os.getenv("NEAR_DUPLICATE_MIN_WORDS", 100))
+NEAR_DUPLICATE_MAX_CANDIDATES = int(os.getenv("NEAR_DUPLICATE_MAX_CANDIDATES", 50))
+# Longer texts are fingerprinted in the process pool.
+SIGNATURE_INLINE_CHARS = int(os.getenv("SIGNATURE_INLINE_CHARS", 20000))
+
+text_cache_stats = {
+    "exact_hits": 0,
+    "near_hits": 0,
+    "misses": 0,
+    "rejected_numbers": 0,
+    "candidates": 0,
+    "errors": 0,
+    "lookups": 0,
+    "lookup_seconds": 0.0,
+}
+
+
+def text_summary_key(text_hash: str, summary_length: SummaryLength) -> str:
+    return (
+        f"textsummary:v{TEXT_CACHE_VERSION}:{text_hash}:{summary_length.value}"
+        f":{SUMMARY_MODEL}:{SUMMARY_PROMPT_VERSION}"
+    )
+
+
+def signature_key(text_hash: str) -> str:
+    return f"neardup:v{TEXT_CACHE_VERSION}:sig:{text_hash}"
+
+
+def band_keys(signature: TextSignature) -> list:
+    return [
+        f"neardup:v{TEXT_CACHE_VERSION}:{NEAR_DUPLICATE_BANDS}:{band}:{digest}"
+        for band, digest in enumerate(lsh_bands(signature.minhash, NEAR_DUPLICATE_BANDS))
+    ]
+
+
+def uses_index(signature: TextSignature) -> bool:
+    return NEAR_DUPLICATE_ENABLED and signature.words >= NEAR_DUPLICATE_MIN_WORDS
+
+
+async def get_text_signature(text: str) -> TextSignature:
+    if len(text) <= SIGNATURE_INLINE_CHARS:
+        return text_signature(text)
+    return await run_in_cpu_executor(text_signature, text)
+
+
+def get_text_cache_stats() -> dict:
+    lookups = text_cache_stats["lookups"]
+    return {
+        **text_cache_stats,
+        "avg_lookup_ms": round(text_cache_stats["lookup_seconds"] / lookups * 1000, 3) if lookups else None,
+    }
+
+
+async def find_near_duplicate(
+    signature: TextSignature, summary_length: SummaryLength, candidates: set
+) -> Optional[bytes]:
+    candidates.discard(signature.text_hash.encode())
+    candidates = [c.decode() for c in candidates][:NEAR_DUPLICATE_MAX_CANDIDATES]
+    if not candidates:
+        return None
+    text_cache_stats["candidates"] += len(candidates)
+
+    values = await redis_client.mget(
+        [signature_key(c) for c in candidates] + [text_summary_key(c, summary_length) for c in candidates]
+    )
+    signatures, summaries = values[:len(candidates)], values[len(candidates):]
+
+    best = None
+    for candidate, stored, summary in zip(candidates, signatures, summaries):
+        if stored is None or summary is None:
+            continue
+        score = similarity(signature.minhash, unpack_minhash(stored[16:]))
+        if score < NEAR_DUPLICATE_MIN_SIMILARITY:
+            continue
+        if stored[:16].decode() != signature.numbers:
+            text_cache_stats["rejected_numbers"] += 1
+            continue
+        if best is None or score > best[0]:
+            best = (score, candidate, summary)
+
+    if best is None:
+        return None
+    logger.debug("Reusing the summary of near-duplicate text %s (similarity %.2f)", best[1][:12], best[0])
+    return best[2]
+
+
+async def get_reusable_summary(signature: TextSignature, summary_length: SummaryLength) -> Optional[str]:
+    """A summary of the same or a near-identical text, or None."""
+    if not TEXT_CACHE_ENABLED:
+        return None
+
+    started = time.perf_counter()
+    try:
+        with timed("text_cache_lookup"):
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.get(text_summary_key(signature.text_hash, summary_length))
+            indexed = uses_index(signature)
+            if indexed:
+                for key in band_keys(signature):
+                    pipe.smembers(key)
+            exact, *bands = await pipe.execute()
+
+            summary = exact
+            if summary is not None:
+                text_cache_stats["exact_hits"] += 1
+            elif indexed:
+                summary = await find_near_duplicate(signature, summary_length, set().union(*bands))
+                if summary is not None:
+                    text_cache_stats["near_hits"] += 1
+    except RedisError as e:
+        text_cache_stats["errors"] += 1
+        print(f"Text cache lookup failed, summarizing: {e}")
+        return None
+    finally:
+        text_cache_stats["lookups"] += 1
+        text_cache_stats["lookup_seconds"] += time.perf_counter() - started
+
+    if summary is None:
+        text_cache_stats["misses"] += 1
+    record_cache_lookup("text", summary is not None)
+    return summary.decode() if summary is not None else None
+
+
+async def remember_summary(signature: TextSignature, summary_length: SummaryLength, summary: str) -> None:
+    if not TEXT_CACHE_ENABLED:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.set(text_summary_key(signature.text_hash, summary_length), summary, ex=TEXT_CACHE_TTL)
+        if uses_index(signature):
+            pipe.set(
+                signature_key(signature.text_hash),
+                signature.numbers.encode() + pack_minhash(signature.minhash),
+                ex=TEXT_CACHE_TTL,
+            )
+            for key in band_keys(signature):
+                pipe.sadd(key, signature.text_hash)
+                pipe.expire(key, TEXT_CACHE_TTL)
+        await pipe.execute()
+    except RedisError as e:
+        text_cache_stats["errors"] += 1
+        print(f"Could not store the text cache entry: {e}")
@@ -1,13 +1,50 @@
-import boto3
+import asyncio
+import os
+import re
+import time
 from pathlib import Path
 
-textract = boto3.client("textract", region_name="us-east-1")
+from app.services.ingest_service import IngestedFile
+from app.utils.aws import aws_clients, lazy_module_attributes
+from app.utils.document_parsing import extract_docx_text
+from app.utils.executor import run_in_aws_executor
+from app.utils.metrics import stage
 
-def extract_text_from_file(file_path: Path) -> str:
-    with open(file_path, "rb") as f:
-        file_bytes = f.read()
 
-    file_ext = file_path.suffix.lower()
+def get_textract():
+    return aws_clients.client("textract")
+
+
+__getattr__ = lazy_module_attributes(__name__, {"textract": get_textract})
+
+TEXTRACT_POLL_INITIAL_DELAY = float(os.getenv("TEXTRACT_POLL_INITIAL_DELAY", 1))
+TEXTRACT_POLL_MAX_DELAY = float(os.getenv("TEXTRACT_POLL_MAX_DELAY", 5))
+TEXTRACT_JOB_TIMEOUT = float(os.getenv("TEXTRACT_JOB_TIMEOUT", 600))
+
+PDF_PAGE_OBJECT = re.compile(rb"/Type\s*/Page\b")
+
+
+class MultiPageDocumentError(Exception):
+    """The synchronous Textract APIs only accept single-page documents."""
+
+
+def count_pdf_pages(file_bytes: bytes) -> int:
+    # Page objects inside compressed object streams are not visible here, so
+    # 0 means "unknown", not "empty".
+    return len(PDF_PAGE_OBJECT.findall(file_bytes))
+
+
+def lines_from_blocks(blocks: list) -> str:
+    # sorted() is stable, so reading order within each page is preserved
+    lines = sorted(
+        (block for block in blocks if block["BlockType"] == "LINE"),
+        key=lambda block: block.get("Page", 1),
+    )
+    return "\n".join(block["Text"] for block in lines)
+
+
+def extract_text_from_bytes(file_bytes: bytes, file_ext: str) -> str:
+    textract = get_textract()
     if file_ext in [".jpg", ".jpeg", ".png"]:
         response = textract.detect_document_text(Document={'Bytes': file_bytes})
         blocks = response.get("Blocks", [])
@@ -15,18 +52,85 @@ def extract_text_from_file(file_path: Path) -> str:
         return "\n".join(lines)
 
     elif file_ext == ".pdf":
-        response = textract.analyze_document(
-            Document={'Bytes': file_bytes},
-            FeatureTypes=["TABLES", "FORMS"]
-        )
+        if count_pdf_pages(file_bytes) > 1:
+            raise MultiPageDocumentError()
+        try:
+            response = textract.analyze_document(
+                Document={'Bytes': file_bytes},
+                FeatureTypes=["TABLES", "FORMS"]
+            )
+        except textract.exceptions.UnsupportedDocumentException as e:
+            raise MultiPageDocumentError() from e
         blocks = response.get("Blocks", [])
         lines = [block["Text"] for block in blocks if block["BlockType"] == "LINE"]
         return "\n".join(lines)
 
     elif file_ext == ".docx":
-        from docx import Document
-        doc = Document(str(file_path))
-        return "\n".join(p.text for p in doc.paragraphs)
+        return extract_docx_text(file_bytes)
 
     else:
         raise ValueError("Unsupported file type for Textract")
+
+
+def extract_text_from_file(file_path: Path) -> str:
+    with open(file_path, "rb") as f:
+        file_bytes = f.read()
+
+    return extract_text_from_bytes(file_bytes, file_path.suffix.lower())
+
+
+@stage("textract")
+async def extract_text_from_ingested_async(ingested: IngestedFile) -> str:
+    # getvalue() may read a spooled upload back from disk, so it runs on the
+    # executor together with the Textract call.
+    return await run_in_aws_executor(
+        lambda: extract_text_from_bytes(ingested.getvalue(), ingested.ext)
+    )
+
+
+@stage("textract_async_job")
+async def extract_text_from_s3_url_async(s3_url: str) -> str:
+    """
+    Multi-page path: run an asynchronous Textract text detection job on a
+    document already in S3, poll it with exponential backoff and collect
+    every result page. Each AWS call runs on the executor; the waiting
+    between polls happens on the event loop so no executor thread is held
+    for the length of the job.
+    """
+    textract = get_textract()
+    bucket, key = s3_url.removeprefix("s3://").split("/", 1)
+    start = await run_in_aws_executor(
+        textract.start_document_text_detection,
+        DocumentLocation={"S3Object": {"Bucket": bucket, "Name": key}},
+    )
+    job_id = start["JobId"]
+
+    delay = TEXTRACT_POLL_INITIAL_DELAY
+    deadline = time.monotonic() + TEXTRACT_JOB_TIMEOUT
+    while True:
+        response = await run_in_aws_executor(textract.get_document_text_detection, JobId=job_id)
+        status = response["JobStatus"]
+        if status in ("SUCCEEDED", "PARTIAL_SUCCESS"):
+            break
+        if status == "FAILED":
+            raise RuntimeError(f"Textract job {job_id} failed: {response.get('StatusMessage', 'unknown error')}")
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f"Textract job {job_id} did not finish within {TEXTRACT_JOB_TIMEOUT}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, TEXTRACT_POLL_MAX_DELAY)
+
+    if status == "PARTIAL_SUCCESS":
+        print(f"Textract job {job_id} only partially succeeded: {response.get('StatusMessage')}")
+
+    # Result pages are chained by NextToken, so they can only be fetched one
+    # after another.
+    blocks = list(response.get("Blocks", []))
+    next_token = response.get("NextToken")
+    while next_token:
+        response = await run_in_aws_executor(
+            textract.get_document_text_detection, JobId=job_id, NextToken=next_token
+        )
+        blocks.extend(response.get("Blocks", []))
+        next_token = response.get("NextToken")
+
+    return lines_from_blocks(blocks)
@@ -0,0 +1,86 @@
+"""
+Cache of user lookups for authenticated requests, keyed by username:
+
+  user:v{USER_CACHE_VERSION}:{username}
+      {"uuid", "username", "disabled"} or null for unknown users
+
+Entries never contain the password hash; logins always read DynamoDB.
+Writers (registration, disabling) overwrite the Redis entry and the local
+tier of their own process; other processes see the change once their short
+local TTL runs out.
+"""
+import json
+import os
+from typing import Awaitable, Callable, Optional
+
+from redis.exceptions import RedisError
+
+from app.models.user import User
+from app.services.redis_service import redis_client
+from app.utils.lru_cache import LRUCache
+
+USER_CACHE_VERSION = "1"
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 300))
+# Unknown usernames (deleted users, forged-but-signed tokens) are cached too,
+# for less time.
+USER_CACHE_NEGATIVE_TTL = int(os.getenv("USER_CACHE_NEGATIVE_TTL", 30))
+USER_LOCAL_CACHE_TTL = int(os.getenv("USER_LOCAL_CACHE_TTL", 5))
+USER_LOCAL_CACHE_MAX_BYTES = int(os.getenv("USER_LOCAL_CACHE_MAX_BYTES", 4 * 1024 * 1024))
+
+MISSING_USER = b"null"
+
+user_local_cache = LRUCache(max_bytes=USER_LOCAL_CACHE_MAX_BYTES, ttl=USER_LOCAL_CACHE_TTL)
+
+
+def user_cache_key(username: str) -> str:
+    return f"user:v{USER_CACHE_VERSION}:{username}"
+
+
+def encode_user(user: Optional[User]) -> bytes:
+    if user is None:
+        return MISSING_USER
+    return json.dumps({"uuid": str(user.uuid), "username": user.username, "disabled": user.disabled}).encode()
+
+
+def decode_user(value: bytes) -> Optional[User]:
+    data = json.loads(value)
+    if data is None:
+        return None
+    return User(**data)
+
+
+async def cache_user(username: str, user: Optional[User]) -> bytes:
+    key = user_cache_key(username)
+    value = encode_user(user)
+    user_local_cache.set(key, value)
+    try:
+        await redis_client.set(key, value, ex=USER_CACHE_TTL if user else USER_CACHE_NEGATIVE_TTL)
+    except RedisError as e:
+        print(f"Redis user cache write failed: {e}")
+    return value
+
+
+async def get_user_cached(
+    username: str, load: Callable[[str], Awaitable[Optional[User]]]
+) -> Optional[User]:
+    """
+    The user from the local tier, then Redis, then load(username). load
+    returns None only for an unknown user and raises on errors, so a failed
+    lookup is never cached as a missing user.
+    """
+    key = user_cache_key(username)
+    value = user_local_cache.get(key)
+    if value is None:
+        try:
+            value = await redis_client.get(key)
+        except RedisError as e:
+            # Authentication must keep working without the cache.
+            print(f"Redis user cache read failed: {e}")
+        if value is not None:
+            user_local_cache.set(key, value)
+
+    if value is None:
+        value = await cache_user(username, await load(username))
+    # Round-tripping a fresh load as well means callers always get a plain
+    # User, never the UserInDB with its password hash.
+    return decode_user(value)
@@ -1,9 +1,11 @@
+import base64
+import binascii
+import json
 import os
 from datetime import datetime, timedelta
 from typing import Optional, List
 from uuid import UUID, uuid4
 
-import boto3
 from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 
@@ -11,23 +13,44 @@ from dotenv import load_dotenv
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 
 from app.models.user import User, UserInDB, TokenData
-from app.models.documents import Document, DocumentCreate
+from app.models.documents import Document, DocumentCreate, DocumentListItem, DocumentPage
+from app.services.user_cache import cache_user, get_user_cached
+from app.utils.aws import aws_clients, lazy_module_attributes
+from app.utils.executor import run_in_auth_executor, run_in_aws_executor
+from app.utils.passwords import get_context, hash_password, verify_and_update_password
 
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+# Changing the cost takes effect for existing users at their next login,
+# when their hash is replaced with one at the new cost.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = get_context(BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# For endpoints guests can use too: no token means no user instead of a 401.
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
-dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
-users_table = dynamodb.Table("users")
-documents_table = dynamodb.Table("documents")
+USERS_TABLE = "users"
+DOCUMENTS_TABLE = "documents"
+
+__getattr__ = lazy_module_attributes(__name__, {
+    "dynamodb": lambda: aws_clients.resource("dynamodb"),
+    "users_table": lambda: aws_clients.table(USERS_TABLE),
+    "documents_table": lambda: aws_clients.table(DOCUMENTS_TABLE),
+})
+
+# users is keyed by uuid; username lookups go through this GSI (see db_setup).
+USERS_USERNAME_INDEX = "username-index"
+# documents is keyed by id; a user's history is read newest-first from this
+# GSI, which only projects the list-view fields.
+DOCUMENTS_USER_DATE_INDEX = "user_uuid-date-index"
+DOCUMENT_LIST_FIELDS = ["id", "summary_title", "document_url", "document_name", "document_size", "summary_length", "date"]
+DOCUMENT_CURSOR_KEYS = {"id", "user_uuid", "date"}
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -40,9 +63,14 @@ def get_password_hash(password: str) -> str:
 
 def get_user(username: str) -> Optional[UserInDB]:
     try:
-        response = users_table.get_item(Key={"username": username})
-        user_item = response.get("Item")
-        if user_item:
+        response = aws_clients.table(USERS_TABLE).query(
+            IndexName=USERS_USERNAME_INDEX,
+            KeyConditionExpression=Key("username").eq(username),
+            Limit=1,
+        )
+        items = response.get("Items", [])
+        if items:
+            user_item = items[0]
             return UserInDB(
                 uuid=user_item["uuid"],
                 username=user_item["username"],
@@ -52,16 +80,38 @@ def get_user(username: str) -> Optional[UserInDB]:
             )
         return None
     except ClientError as e:
+        # Raised rather than returned as None: a throttled lookup must not
+        # look like (and be cached as) an unknown user.
         print(f"DynamoDB get_user error: {e.response['Error']['Message']}")
-        return None
+        raise HTTPException(status_code=500, detail="Failed to get user")
 
 
-def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
-    user = get_user(username)
+def update_password_hash(user: UserInDB, new_hash: str) -> None:
+    # Conditional on the old hash so a password change that raced with the
+    # login is never overwritten.
+    try:
+        aws_clients.table(USERS_TABLE).update_item(
+            Key={"uuid": str(user.uuid)},
+            UpdateExpression="SET hashed_password = :new",
+            ConditionExpression="hashed_password = :old",
+            ExpressionAttributeValues={":new": new_hash, ":old": user.hashed_password},
+        )
+    except ClientError as e:
+        print(f"DynamoDB update_password_hash error: {e.response['Error']['Message']}")
+
+
+async def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
+    user = await run_in_aws_executor(get_user, username)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    verified, new_hash = await run_in_auth_executor(
+        verify_and_update_password, password, user.hashed_password, BCRYPT_ROUNDS
+    )
+    if not verified:
         return None
+    if new_hash:
+        await run_in_aws_executor(update_password_hash, user, new_hash)
+        user.hashed_password = new_hash
     return user
 
 
@@ -79,7 +129,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> Optional[UserInDB]:
+async def load_user(username: str) -> Optional[UserInDB]:
+    return await run_in_aws_executor(get_user, username)
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Optional[User]:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -95,25 +149,44 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Optional[User
     except JWTError:
         return None
 
-    user = get_user(token_data.username)
+    user = await get_user_cached(token_data.username, load_user)
     if user is None:
         return None
 
     return user
 
 
-async def get_current_active_user(current_user: UserInDB = Depends(get_current_user)) -> UserInDB:
+async def get_optional_current_user(token: Optional[str] = Depends(optional_oauth2_scheme)) -> Optional[User]:
+    if token is None:
+        return None
+    return await get_current_user(token)
+
+
+async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+    if current_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     if current_user.disabled:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
 
 def create_user(username: str, password: str) -> UserInDB:
+    """
+    Synchronous, for scripts and tests; it does not touch the user cache.
+    Request paths use register_user, which writes the new user through it.
+    """
     existing_user = get_user(username)
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already registered")
 
-    hashed_password = get_password_hash(password)
+    return put_new_user(username, get_password_hash(password))
+
+
+def put_new_user(username: str, hashed_password: str) -> UserInDB:
     new_user_uuid = str(uuid4())
 
     user_item = {
@@ -124,7 +197,7 @@ def create_user(username: str, password: str) -> UserInDB:
     }
 
     try:
-        users_table.put_item(Item=user_item)
+        aws_clients.table(USERS_TABLE).put_item(Item=user_item)
     except ClientError as e:
         print(f"DynamoDB create_user error: {e.response['Error']['Message']}")
         raise HTTPException(status_code=500, detail="Failed to create user")
@@ -138,6 +211,45 @@ def create_user(username: str, password: str) -> UserInDB:
     )
 
 
+async def register_user(username: str, password: str) -> UserInDB:
+    """create_user with the DynamoDB calls on the AWS executor and bcrypt on the auth pool."""
+    if await run_in_aws_executor(get_user, username):
+        raise HTTPException(status_code=400, detail="Username already registered")
+
+    hashed_password = await run_in_auth_executor(hash_password, password, BCRYPT_ROUNDS)
+    user = await run_in_aws_executor(put_new_user, username, hashed_password)
+    # Written straight into the cache rather than invalidated: the GSI is
+    # eventually consistent, so a lookup right after registering could still
+    # miss the new user and cache that as a negative entry.
+    await cache_user(username, user)
+    return user
+
+
+def set_user_disabled(username: str, disabled: bool) -> UserInDB:
+    user = get_user(username)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    try:
+        aws_clients.table(USERS_TABLE).update_item(
+            Key={"uuid": str(user.uuid)},
+            UpdateExpression="SET disabled = :disabled",
+            ExpressionAttributeValues={":disabled": disabled},
+        )
+    except ClientError as e:
+        print(f"DynamoDB set_user_disabled error: {e.response['Error']['Message']}")
+        raise HTTPException(status_code=500, detail="Failed to update user")
+
+    user.disabled = disabled
+    return user
+
+
+async def disable_user(username: str, disabled: bool = True) -> UserInDB:
+    user = await run_in_aws_executor(set_user_disabled, username, disabled)
+    await cache_user(username, user)
+    return user
+
+
 def get_uuid_by_username(username: str) -> Optional[str]:
     user = get_user(username)
     if user:
@@ -146,11 +258,9 @@ def get_uuid_by_username(username: str) -> Optional[str]:
 
 # Document functions
 
-def create_document(document_create: DocumentCreate) -> Document:
-    new_document_id = str(uuid4())
-
-    item = {
-        "id": new_document_id,
+def document_item(document_create: DocumentCreate, document_id: str) -> dict:
+    return {
+        "id": document_id,
         "user_uuid": str(document_create.user_uuid),
         "summary_title": document_create.summary_title,
         "summary": document_create.summary,
@@ -161,8 +271,12 @@ def create_document(document_create: DocumentCreate) -> Document:
         "date": document_create.date.isoformat(),
     }
 
+
+def create_document(document_create: DocumentCreate) -> Document:
+    item = document_item(document_create, str(uuid4()))
+
     try:
-        documents_table.put_item(Item=item)
+        aws_clients.table(DOCUMENTS_TABLE).put_item(Item=item)
     except ClientError as e:
         print(f"DynamoDB create_document error: {e.response['Error']['Message']}")
         raise HTTPException(status_code=500, detail="Failed to create document")
@@ -170,25 +284,96 @@ def create_document(document_create: DocumentCreate) -> Document:
     return Document(**item)
 
 
+def encode_document_cursor(last_evaluated_key: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key).encode()).decode()
+
+
+def decode_document_cursor(cursor: str, user_uuid: UUID) -> dict:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        key = None
+    # Only the query's own key shape for this user's partition is accepted,
+    # so a cursor cannot be used to start reading someone else's history.
+    if (
+        not isinstance(key, dict)
+        or set(key) != DOCUMENT_CURSOR_KEYS
+        or not all(isinstance(value, str) for value in key.values())
+        or key["user_uuid"] != str(user_uuid)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+
+def list_documents_for_user(user_uuid: UUID, limit: int, cursor: Optional[str] = None) -> DocumentPage:
+    query = {
+        "IndexName": DOCUMENTS_USER_DATE_INDEX,
+        "KeyConditionExpression": Key("user_uuid").eq(str(user_uuid)),
+        "ScanIndexForward": False,
+        "Limit": limit,
+        # "date" is a reserved word, so every field goes through a placeholder.
+        "ProjectionExpression": ", ".join(f"#f{i}" for i in range(len(DOCUMENT_LIST_FIELDS))),
+        "ExpressionAttributeNames": {f"#f{i}": field for i, field in enumerate(DOCUMENT_LIST_FIELDS)},
+    }
+    if cursor:
+        query["ExclusiveStartKey"] = decode_document_cursor(cursor, user_uuid)
+
+    try:
+        response = aws_clients.table(DOCUMENTS_TABLE).query(**query)
+    except ClientError as e:
+        print(f"DynamoDB list_documents_for_user error: {e.response['Error']['Message']}")
+        raise HTTPException(status_code=500, detail="Failed to get documents")
+
+    last_key = response.get("LastEvaluatedKey")
+    return DocumentPage(
+        items=[DocumentListItem(**item) for item in response.get("Items", [])],
+        next_cursor=encode_document_cursor(last_key) if last_key else None,
+    )
+
+
+def get_document_for_user(document_id: UUID, user_uuid: UUID) -> Optional[Document]:
+    try:
+        response = aws_clients.table(DOCUMENTS_TABLE).get_item(Key={"id": str(document_id)})
+    except ClientError as e:
+        print(f"DynamoDB get_document_for_user error: {e.response['Error']['Message']}")
+        raise HTTPException(status_code=500, detail="Failed to get document")
+
+    item = response.get("Item")
+    # Someone else's document looks exactly like a missing one.
+    if item is None or item["user_uuid"] != str(user_uuid):
+        return None
+    return Document(**item)
+
+
 def get_documents_for_user(user_uuid: UUID) -> List[Document]:
+    """Every document of a user with its summary, newest first."""
+    documents = []
+    cursor = None
     try:
-        response = documents_table.query(
-            IndexName="user_uuid-index",
-            KeyConditionExpression=Key("user_uuid").eq(str(user_uuid)),
-        )
-        items = response.get("Items", [])
-        documents = []
-        for item in items:
-            item["date"] = datetime.fromisoformat(item["date"])
-            documents.append(Document(**item))
-        return documents
+        while True:
+            page = list_documents_for_user(user_uuid, limit=100, cursor=cursor)
+            if page.items:
+                # The index does not project summaries; fetch full items by id.
+                keys = [{"id": str(item.id)} for item in page.items]
+                items = {}
+                while keys:
+                    response = aws_clients.resource("dynamodb").batch_get_item(
+                        RequestItems={DOCUMENTS_TABLE: {"Keys": keys}}
+                    )
+                    for item in response["Responses"].get(DOCUMENTS_TABLE, []):
+                        items[item["id"]] = item
+                    keys = response.get("UnprocessedKeys", {}).get(DOCUMENTS_TABLE, {}).get("Keys", [])
+                documents.extend(Document(**items[str(item.id)]) for item in page.items if str(item.id) in items)
+            cursor = page.next_cursor
+            if cursor is None:
+                return documents
     except ClientError as e:
         print(f"DynamoDB get_documents_for_user error: {e.response['Error']['Message']}")
         raise HTTPException(status_code=500, detail="Failed to get documents")
 
 
-def attach_documents_to_user(user: UserInDB) -> User:
-    documents = get_documents_for_user(UUID(user.uuid))
+def attach_documents_to_user(user: User) -> User:
+    documents = get_documents_for_user(user.uuid)
     return User(
         uuid=user.uuid,
         username=user.username,
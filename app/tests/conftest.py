@@ -0,0 +1,76 @@
+import os
+
+import pytest
+from fakeredis import FakeAsyncRedis
+# moto has to be imported before the app builds its boto3 clients so that
+# those clients are intercepted once a mock is started.
+from moto import mock_dynamodb, mock_s3
+
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+
+
+REDIS_CLIENT_IMPORTS = [
+    "app.services.cache_service.redis_client",
+    "app.services.document_pipeline.redis_client",
+    "app.services.job_service.redis_client",
+    "app.services.openai_service.redis_client",
+    "app.services.text_cache.redis_client",
+    "app.services.user_cache.redis_client",
+    "app.utils.limiter.redis_client",
+]
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    from app.services.cache_service import local_cache
+    from app.services.user_cache import user_local_cache
+
+    client = FakeAsyncRedis()
+    for target in REDIS_CLIENT_IMPORTS:
+        monkeypatch.setattr(target, client)
+    local_cache.clear()
+    user_local_cache.clear()
+    yield client
+    local_cache.clear()
+    user_local_cache.clear()
+
+
+@pytest.fixture
+def s3_bucket():
+    from app.services import s3_service
+
+    with mock_s3():
+        s3_service.s3_client.create_bucket(Bucket=s3_service.BUCKET_NAME)
+        yield s3_service.s3_client
+
+
+@pytest.fixture
+def dynamodb_tables():
+    from app.utils import db_setup
+
+    with mock_dynamodb():
+        db_setup.create_users_table()
+        db_setup.create_documents_table()
+        yield db_setup.dynamodb
+
+
+@pytest.fixture
+def no_rate_limit():
+    from app.utils.limiter import limiter
+
+    limiter.enabled = False
+    yield
+    limiter.enabled = True
+
+
+@pytest.fixture(autouse=True)
+def llm_providers(monkeypatch):
+    """Fresh circuit breakers and quick retries, so failed LLM calls in one test do not fail the next."""
+    from app.services import llm_client
+
+    monkeypatch.setattr(llm_client, "LLM_BACKOFF_BASE", 0.001)
+    for provider in llm_client.providers.values():
+        monkeypatch.setattr(provider, "breaker", llm_client.CircuitBreaker())
@@ -0,0 +1,22 @@
+from app.services import s3_service, user_documents
+from app.utils.aws import AWSClients, AWS_MAX_POOL_CONNECTIONS, aws_clients
+
+
+def test_clients_are_created_on_first_use_and_shared():
+    clients = AWSClients()
+    assert clients._clients == {}
+
+    s3 = clients.client("s3")
+    assert clients.client("s3") is s3
+    assert s3.meta.config.max_pool_connections == AWS_MAX_POOL_CONNECTIONS
+    assert s3.meta.config.retries["mode"] == "standard"
+
+    assert clients.table("users").meta.client is clients.resource("dynamodb").meta.client
+    clients.close()
+    assert clients.client("s3") is not s3
+
+
+def test_module_attributes_come_from_the_registry():
+    assert s3_service.s3_client is aws_clients.client("s3")
+    assert user_documents.users_table is aws_clients.table("users")
+    assert user_documents.dynamodb is aws_clients.resource("dynamodb")
@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from app.utils import cache_codec
+
+
+def test_small_values_are_stored_uncompressed():
+    payload = b'{"summary": "short"}'
+    encoded = cache_codec.encode(payload, min_bytes=1024)
+
+    assert encoded[:2] == cache_codec.MAGIC
+    assert encoded[3] == cache_codec.RawCodec.id
+    assert cache_codec.decode(encoded) == payload
+
+
+@pytest.mark.parametrize("codec", ["zlib", "zstd"])
+def test_large_values_are_compressed(codec):
+    payload = json.dumps({"extracted_text": "line of OCR text\n" * 1000}).encode()
+    encoded = cache_codec.encode(payload, codec_name=codec, min_bytes=1024)
+
+    assert encoded[3] == cache_codec.get_codec(codec).id
+    assert len(encoded) < len(payload) / 5
+    assert cache_codec.decode(encoded) == payload
+
+
+def test_legacy_json_entries_are_read_unchanged():
+    legacy = json.dumps({"summary": "written before the codec"}).encode()
+    assert cache_codec.decode(legacy) == legacy
+
+
+def test_unknown_format_version_is_rejected():
+    with pytest.raises(cache_codec.CacheCodecError):
+        cache_codec.decode(cache_codec.MAGIC + bytes([99, 0]) + b"{}")
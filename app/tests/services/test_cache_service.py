@@ -0,0 +1,124 @@
+import asyncio
+import io
+import json
+
+import pytest
+from httpx import AsyncClient
+from starlette.datastructures import UploadFile
+from unittest.mock import AsyncMock, patch
+
+from app.common import SummaryLength
+from app.main import app
+from app.services import cache_service, s3_service
+from app.services.cache_service import get_cached_extraction, get_cached_result, summary_cache_key
+from app.services.document_pipeline import process_document, process_document_once
+from app.services.ingest_service import ingest_upload
+
+
+async def ingest(content: bytes):
+    return await ingest_upload(UploadFile(file=io.BytesIO(content), filename="doc.pdf"))
+
+
+@pytest.mark.asyncio
+async def test_other_summary_length_reuses_extraction(fake_redis):
+    ingested = await ingest(b"layered")
+
+    with (
+        patch("app.services.textract_service.extract_text_from_bytes", return_value="text") as extract,
+        patch("app.services.s3_service.upload_ingested_to_s3", return_value="s3://bucket/doc.pdf") as upload,
+        patch("app.services.document_pipeline.summarize_text", new_callable=AsyncMock, side_effect=["short one", "long one"]),
+    ):
+        short, _ = await process_document(ingested, SummaryLength.short)
+        long, _ = await process_document(ingested, SummaryLength.long)
+
+    assert extract.call_count == 1
+    assert upload.call_count == 1
+    assert short["summary"] == "short one"
+    assert long["summary"] == "long one"
+    assert (await get_cached_result(ingested.content_hash, SummaryLength.short))["summary"] == "short one"
+    assert (await get_cached_result(ingested.content_hash, SummaryLength.long))["summary"] == "long one"
+
+
+@pytest.mark.asyncio
+async def test_prompt_version_bump_only_invalidates_summaries(fake_redis, monkeypatch):
+    ingested = await ingest(b"versioned")
+
+    with (
+        patch("app.services.textract_service.extract_text_from_bytes", return_value="text"),
+        patch("app.services.s3_service.upload_ingested_to_s3", return_value="s3://bucket/doc.pdf"),
+        patch("app.services.document_pipeline.summarize_text", new_callable=AsyncMock, return_value="v1 summary"),
+    ):
+        await process_document(ingested, SummaryLength.medium)
+
+    old_key = summary_cache_key(ingested.content_hash, SummaryLength.medium)
+    monkeypatch.setattr(cache_service, "SUMMARY_PROMPT_VERSION", "2")
+
+    assert summary_cache_key(ingested.content_hash, SummaryLength.medium) != old_key
+    assert await get_cached_result(ingested.content_hash, SummaryLength.medium) is None
+    assert await get_cached_extraction(ingested.content_hash) == {"extracted_text": "text", "s3_url": "s3://bucket/doc.pdf"}
+
+
+@pytest.mark.asyncio
+async def test_hot_entries_are_served_from_the_local_tier(fake_redis, no_rate_limit):
+
+    ingested = await ingest(b"hot document")
+    body = b'{"filename": "doc.pdf", "extracted_text": "t", "summary": "Hot", "s3_url": "s3://b/k"}'
+    await fake_redis.set(summary_cache_key(ingested.content_hash, SummaryLength.medium), body)
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        before = (await ac.get("/health/cache")).json()
+        first = await ac.post("/documents/upload", files={"file": ("doc.pdf", io.BytesIO(b"hot document"))})
+        await fake_redis.flushall()
+        second = await ac.post("/documents/upload", files={"file": ("doc.pdf", io.BytesIO(b"hot document"))})
+        stats = (await ac.get("/health/cache")).json()
+
+    assert first.content == body
+    assert second.content == body
+    assert stats["redis"]["hits"] - before["redis"]["hits"] == 1
+    assert stats["local"]["hits"] - before["local"]["hits"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_redis_values_are_encoded_and_read_back(fake_redis):
+    from app.services.cache_service import cache_result, local_cache
+    from app.utils import cache_codec
+
+    result = {"filename": "doc.pdf", "extracted_text": "ocr text " * 500, "summary": "s", "s3_url": "s3://b/k"}
+    await cache_result("abc", SummaryLength.short, result)
+
+    stored = await fake_redis.get(summary_cache_key("abc", SummaryLength.short))
+    assert stored.startswith(cache_codec.MAGIC)
+    assert len(stored) < len(json.dumps(result))
+
+    local_cache.clear()
+    assert await get_cached_result("abc", SummaryLength.short) == result
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_close_the_shared_upload(fake_redis, s3_bucket):
+    leader_file, follower_file = await ingest(b"shared bytes"), await ingest(b"shared bytes")
+
+    async def slow_extract(ingested):
+        await asyncio.sleep(0.2)
+        return ingested.getvalue().decode()
+
+    async def endpoint(ingested):
+        try:
+            return await process_document_once(ingested, SummaryLength.short)
+        finally:
+            ingested.close()
+
+    with (
+        patch("app.services.document_pipeline.extract_text", side_effect=slow_extract),
+        patch("app.services.document_pipeline.summarize_text", new_callable=AsyncMock, return_value="summary"),
+    ):
+        leader = asyncio.ensure_future(endpoint(leader_file))
+        follower = asyncio.ensure_future(endpoint(follower_file))
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        result, _ = await follower
+
+    assert result["extracted_text"] == "shared bytes"
+    key = result["s3_url"].split("/", 3)[3]
+    assert s3_bucket.get_object(Bucket=s3_service.BUCKET_NAME, Key=key)["Body"].read() == b"shared bytes"
+    assert leader_file.closed and follower_file.closed
@@ -0,0 +1,180 @@
+import asyncio
+import io
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from botocore.exceptions import ClientError
+from httpx import AsyncClient
+from unittest.mock import AsyncMock, patch
+
+from app.models.documents import DocumentCreate
+from app.services.document_writer import DocumentWriter
+from app.services.user_documents import create_access_token, documents_table, put_new_user
+from app.utils.passwords import hash_password
+
+USER_UUID = "7d4f8b9e-2a61-4c3e-9d0b-5f1a2e3c4d5e"
+
+
+def document(i):
+    return DocumentCreate(
+        user_uuid=USER_UUID,
+        summary_title=f"Doc {i}...",
+        summary=f"summary {i}",
+        document_url=f"https://bucket.s3.amazonaws.com/doc{i}.pdf",
+        document_name=f"doc{i}.pdf",
+        document_size=i,
+        summary_length="short",
+        date=datetime(2024, 1, 1) + timedelta(seconds=i),
+    )
+
+
+def stored_names():
+    return sorted(item["document_name"] for item in documents_table.scan()["Items"])
+
+
+async def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+def throttled():
+    return ClientError(
+        {"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "slow down"}}, "BatchWriteItem"
+    )
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_flushed_without_waiting_for_the_interval(dynamodb_tables):
+    writer = DocumentWriter(batch_size=3, flush_interval=30)
+    await writer.start()
+    for i in range(3):
+        writer.enqueue(document(i))
+
+    await wait_for(lambda: writer.stats["written"] == 3)
+    assert writer.stats["batches"] == 1
+    assert stored_names() == ["doc0.pdf", "doc1.pdf", "doc2.pdf"]
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_partial_batch_is_flushed_after_the_interval(dynamodb_tables):
+    writer = DocumentWriter(batch_size=25, flush_interval=0.05)
+    await writer.start()
+    writer.enqueue(document(0))
+    writer.enqueue(document(1))
+
+    await wait_for(lambda: writer.stats["written"] == 2)
+    assert writer.stats["batches"] == 1
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_unprocessed_items_are_resent(dynamodb_tables):
+    client = documents_table.meta.client
+    real = client.batch_write_item
+    calls = []
+
+    def flaky(RequestItems):
+        calls.append(RequestItems)
+        if len(calls) == 1:
+            # DynamoDB accepted nothing this time
+            return {"UnprocessedItems": RequestItems}
+        return real(RequestItems=RequestItems)
+
+    writer = DocumentWriter(batch_size=5, flush_interval=30)
+    with patch.object(client, "batch_write_item", side_effect=flaky):
+        for i in range(5):
+            writer.enqueue(document(i))
+        await writer.stop()
+
+    assert len(calls) == 2
+    assert len(stored_names()) == 5
+
+
+@pytest.mark.asyncio
+async def test_failed_batches_are_retried_with_backoff(dynamodb_tables):
+    client = documents_table.meta.client
+    real = client.batch_write_item
+    failures = [throttled(), throttled()]
+
+    def flaky(RequestItems):
+        if failures:
+            raise failures.pop()
+        return real(RequestItems=RequestItems)
+
+    writer = DocumentWriter(batch_size=2, flush_interval=30, retry_delay=0.01)
+    with patch.object(client, "batch_write_item", side_effect=flaky):
+        writer.enqueue(document(0))
+        writer.enqueue(document(1))
+        await writer.stop()
+
+    assert writer.stats["retries"] == 2
+    assert writer.stats["written"] == 2
+    assert stored_names() == ["doc0.pdf", "doc1.pdf"]
+
+
+@pytest.mark.asyncio
+async def test_batches_are_dropped_after_the_last_retry(dynamodb_tables):
+    writer = DocumentWriter(batch_size=2, flush_interval=30, max_retries=2, retry_delay=0.01)
+    with patch.object(documents_table.meta.client, "batch_write_item", side_effect=throttled()):
+        writer.enqueue(document(0))
+        await writer.stop()
+
+    assert writer.stats["retries"] == 2
+    assert writer.stats["failed"] == 1
+    assert stored_names() == []
+
+
+@pytest.mark.asyncio
+async def test_stop_drains_everything_queued(dynamodb_tables):
+    writer = DocumentWriter(batch_size=25, flush_interval=30)
+    await writer.start()
+    for i in range(60):
+        writer.enqueue(document(i))
+
+    start = time.perf_counter()
+    await writer.stop()
+
+    assert time.perf_counter() - start < 5
+    assert writer.stats["written"] == 60
+    assert writer.stats["batches"] == 3
+    assert len(stored_names()) == 60
+
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_instead_of_blocking():
+    writer = DocumentWriter(max_queue=1)
+    assert writer.enqueue(document(0)) is not None
+    assert writer.enqueue(document(1)) is None
+    assert writer.stats["dropped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_signed_in_uploads_are_recorded_in_the_history(dynamodb_tables, fake_redis, no_rate_limit):
+    from app.main import app
+
+    user = put_new_user("kim", hash_password("pw", 4))
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'kim'})}"}
+    writer = DocumentWriter(flush_interval=30)
+    result = {"filename": "my report.pdf", "extracted_text": "x", "summary": "short summary", "s3_url": "s3://b/uploads/my report.pdf"}
+
+    with (
+        patch("app.api.documents.document_writer", writer),
+        patch("app.api.documents.process_document_once", new_callable=AsyncMock, return_value=(result, False)),
+    ):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            guest = await ac.post("/documents/upload", files={"file": ("my report.pdf", io.BytesIO(b"a"), "application/pdf")})
+            signed_in = await ac.post(
+                "/documents/upload", files={"file": ("my report.pdf", io.BytesIO(b"a"), "application/pdf")}, headers=headers
+            )
+            assert writer.stats["enqueued"] == 1
+            await writer.stop()
+            history = (await ac.get("/documents", headers=headers)).json()
+
+    assert guest.status_code == signed_in.status_code == 200
+    assert [item["document_name"] for item in history["items"]] == ["my report.pdf"]
+    assert history["items"][0]["document_url"] == "https://b.s3.amazonaws.com/uploads/my%20report.pdf"
+    assert documents_table.scan()["Items"][0]["user_uuid"] == str(user.uuid)
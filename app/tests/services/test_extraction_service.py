@@ -0,0 +1,139 @@
+import io
+
+import pytest
+from docx import Document
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+from starlette.datastructures import UploadFile
+from unittest.mock import patch
+
+from app.services import extraction_service
+from app.services.extraction_service import extract_text, get_extraction_stats
+from app.services.ingest_service import IngestedFile, ingest_upload
+from app.services.textract_service import MultiPageDocumentError
+
+
+def make_pdf(pages):
+    """A PDF with one page per entry: a string becomes its text layer, None a page without one."""
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for text in pages:
+        page = writer.add_blank_page(612, 792)
+        if text:
+            stream = DecodedStreamObject()
+            stream.set_data(f"BT /F1 12 Tf 72 712 Td ({text}) Tj ET".encode())
+            page[NameObject("/Contents")] = writer._add_object(stream)
+            page[NameObject("/Resources")] = DictionaryObject({
+                NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+            })
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+async def ingest(data, filename, **kwargs):
+    return await ingest_upload(UploadFile(file=io.BytesIO(data), filename=filename), **kwargs)
+
+
+def ocr_response(text):
+    return {"Blocks": [{"BlockType": "LINE", "Text": text}]}
+
+
+@pytest.mark.asyncio
+async def test_born_digital_pdf_never_reaches_textract():
+    ingested = await ingest(make_pdf(["First page of the quarterly report", "Second page with the numbers"]), "a.pdf")
+    before = get_extraction_stats()["counters"]
+
+    with (
+        patch.object(extraction_service.textract, "detect_document_text") as detect,
+        patch.object(extraction_service.textract, "analyze_document") as analyze,
+    ):
+        text = await extract_text(ingested)
+
+    assert text == "First page of the quarterly report\nSecond page with the numbers"
+    detect.assert_not_called()
+    analyze.assert_not_called()
+    stats = get_extraction_stats()
+    assert stats["counters"]["pdf_text_layer"] == before["pdf_text_layer"] + 1
+    assert stats["counters"]["pages_text_layer"] == before["pages_text_layer"] + 2
+    assert stats["recent"][-1]["route"] == "text_layer"
+    assert [p["route"] for p in stats["recent"][-1]["pages"]] == ["text", "text"]
+
+
+@pytest.mark.asyncio
+async def test_only_pages_without_text_are_ocred_as_single_page_pdfs():
+    pdf = make_pdf(["Cover page with a real text layer", None, "Closing page with a real text layer"])
+    ingested = await ingest(pdf, "mixed.pdf")
+    sent = []
+
+    def detect(Document):
+        sent.append(Document["Bytes"])
+        return ocr_response("scanned middle page")
+
+    with patch.object(extraction_service.textract, "detect_document_text", side_effect=detect):
+        text = await extract_text(ingested)
+
+    assert text == (
+        "Cover page with a real text layer\nscanned middle page\nClosing page with a real text layer"
+    )
+    assert len(sent) == 1
+    assert len(PdfReader(io.BytesIO(sent[0])).pages) == 1
+    recent = get_extraction_stats()["recent"][-1]
+    assert recent["route"] == "mixed"
+    assert [p["route"] for p in recent["pages"]] == ["text", "ocr", "text"]
+
+
+@pytest.mark.asyncio
+async def test_mostly_scanned_pdf_goes_to_the_async_job(monkeypatch):
+    monkeypatch.setattr(extraction_service, "OCR_SYNC_MAX_PAGES", 2)
+    ingested = await ingest(make_pdf([None, None, None]), "scan.pdf")
+
+    with patch.object(extraction_service.textract, "detect_document_text") as detect:
+        with pytest.raises(MultiPageDocumentError):
+            await extract_text(ingested)
+
+    detect.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_unreadable_pdf_falls_back_to_textract():
+    ingested = await ingest(b"%PDF-1.4 not really a pdf", "broken.pdf")
+
+    with patch.object(extraction_service.textract, "analyze_document", return_value=ocr_response("from textract")) as analyze:
+        text = await extract_text(ingested)
+
+    assert text == "from textract"
+    analyze.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_spooled_pdf_is_parsed_from_disk():
+    pdf = make_pdf(["A page long enough to count as a text layer"])
+    ingested = await ingest(pdf, "big.pdf")
+    spooled = IngestedFile("big.pdf", spool_threshold=10)
+    spooled.write(pdf)
+    spooled.finish()
+    try:
+        assert spooled.path is not None
+        assert await extract_text(spooled) == await extract_text(ingested)
+    finally:
+        spooled.close()
+
+
+@pytest.mark.asyncio
+async def test_docx_is_parsed_in_the_process_pool():
+    doc = Document()
+    doc.add_paragraph("First paragraph")
+    doc.add_paragraph("Second paragraph")
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    ingested = await ingest(buffer.getvalue(), "notes.docx")
+
+    assert await extract_text(ingested) == "First paragraph\nSecond paragraph"
+    recent = get_extraction_stats()["recent"][-1]
+    assert recent["route"] == "docx"
+    assert recent["ext"] == ".docx" and "filename" not in recent
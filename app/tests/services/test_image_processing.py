@@ -0,0 +1,100 @@
+import io
+import random
+
+import pytest
+from PIL import Image, ImageDraw
+from starlette.datastructures import UploadFile
+from unittest.mock import patch
+
+from app.services import extraction_service
+from app.services.extraction_service import extract_text, get_extraction_stats
+from app.services.ingest_service import ingest_upload
+from app.utils.image_processing import ORIENTATION_TAG, prepare_image_for_ocr
+
+
+def photo(width=4000, height=3000, orientation=None, fmt="JPEG"):
+    """A noisy colour 'photo' of a page, like a phone camera produces."""
+    rng = random.Random(0)
+    image = Image.effect_noise((width, height), 40).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for y in range(100, height - 100, 60):
+        draw.text((100, y), f"line {y} " * 20, fill=(rng.randint(0, 60), 0, 0))
+    buffer = io.BytesIO()
+    kwargs = {"quality": 95} if fmt == "JPEG" else {}
+    if orientation is not None:
+        exif = Image.Exif()
+        exif[ORIENTATION_TAG] = orientation
+        kwargs["exif"] = exif
+    image.save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def open_image(data):
+    return Image.open(io.BytesIO(data))
+
+
+def test_photo_is_grayscaled_downscaled_and_smaller():
+    original = photo()
+    prepared = prepare_image_for_ocr(original, 2000, 85)
+
+    image = open_image(prepared["bytes"])
+    assert image.mode == "L"
+    assert image.size == (2000, 1500) == (prepared["width"], prepared["height"])
+    assert prepared["format"] == "JPEG"
+    assert len(prepared["bytes"]) < len(original) / 2
+
+
+def test_exif_orientation_is_applied():
+    # Orientation 6: the camera was held in portrait, pixels are stored landscape.
+    prepared = prepare_image_for_ocr(photo(800, 600, orientation=6), 2000, 85)
+
+    assert open_image(prepared["bytes"]).size == (600, 800)
+
+
+def test_png_stays_lossless():
+    prepared = prepare_image_for_ocr(photo(800, 600, fmt="PNG"), 2000, 85)
+
+    assert prepared["format"] == "PNG"
+    assert open_image(prepared["bytes"]).mode == "L"
+
+
+def test_already_small_image_is_sent_unchanged():
+    image = Image.effect_noise((200, 100), 60)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=20)
+    original = buffer.getvalue()
+
+    assert prepare_image_for_ocr(original, 2000, 85)["bytes"] == original
+
+
+@pytest.mark.asyncio
+async def test_textract_receives_the_prepared_image(monkeypatch):
+    monkeypatch.setattr(extraction_service, "IMAGE_OCR_MAX_SIDE", 1600)
+    original = photo()
+    ingested = await ingest_upload(UploadFile(file=io.BytesIO(original), filename="receipt.jpg"))
+    sent = []
+
+    def detect(Document):
+        sent.append(Document["Bytes"])
+        return {"Blocks": [{"BlockType": "LINE", "Text": "TOTAL 12.00"}]}
+
+    with patch.object(extraction_service.textract, "detect_document_text", side_effect=detect):
+        assert await extract_text(ingested) == "TOTAL 12.00"
+
+    assert max(open_image(sent[0]).size) == 1600
+    report = get_extraction_stats()["recent"][-1]
+    assert report["route"] == "image"
+    assert report["bytes_in"] == len(original)
+    assert report["bytes_out"] == len(sent[0])
+
+
+@pytest.mark.asyncio
+async def test_undecodable_image_is_sent_as_is():
+    ingested = await ingest_upload(UploadFile(file=io.BytesIO(b"not an image"), filename="scan.png"))
+
+    with patch.object(
+        extraction_service.textract, "detect_document_text", return_value={"Blocks": []}
+    ) as detect:
+        await extract_text(ingested)
+
+    assert detect.call_args.kwargs == {"Document": {"Bytes": b"not an image"}}
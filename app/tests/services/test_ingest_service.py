@@ -0,0 +1,146 @@
+import hashlib
+import io
+from tempfile import SpooledTemporaryFile
+
+import pytest
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from httpx import AsyncClient
+from starlette.datastructures import UploadFile as StarletteUploadFile
+
+from app.services.ingest_service import IngestedFile, ingest_upload
+from app.utils.body_limit import MaxBodySizeMiddleware
+
+
+def make_upload(content: bytes, filename: str = "doc.pdf") -> StarletteUploadFile:
+    return StarletteUploadFile(file=io.BytesIO(content), filename=filename)
+
+
+@pytest.mark.asyncio
+async def test_ingest_hashes_incrementally():
+    content = b"x" * 1_000_000
+    ingested = await ingest_upload(make_upload(content))
+
+    assert ingested.size == len(content)
+    assert ingested.content_hash == hashlib.sha256(content).hexdigest()
+    assert ingested.digest_with("short") == hashlib.sha256(content + b"short").hexdigest()
+    assert ingested.path is None
+    assert ingested.getvalue() == content
+    ingested.close()
+
+
+@pytest.mark.asyncio
+async def test_ingest_keeps_the_form_parsers_file_instead_of_copying_it():
+    content = bytes(range(256)) * 4096
+    spooled = SpooledTemporaryFile(max_size=1024)
+    spooled.write(content)
+    spooled.seek(0)
+    upload = StarletteUploadFile(file=spooled, filename="big.pdf")
+
+    ingested = await ingest_upload(upload)
+
+    assert ingested.content_hash == hashlib.sha256(content).hexdigest()
+    assert ingested.path is None
+    # the request closing its form no longer touches the adopted file
+    await upload.close()
+    with ingested.open() as first, ingested.open() as second:
+        assert first.read(10) == content[:10]
+        assert second.read() == content
+        assert first.read() == content[10:]
+    assert ingested.getvalue() == content
+    ingested.close()
+    assert spooled.closed
+
+
+def test_ingested_file_spools_above_threshold():
+    ingested = IngestedFile("big.pdf", spool_threshold=10)
+    ingested.write(b"0123456789")
+    assert ingested.path is None
+    ingested.write(b"abc")
+    ingested.finish()
+
+    assert ingested.path is not None and ingested.path.exists()
+    assert ingested.getvalue() == b"0123456789abc"
+    with ingested.open() as f:
+        assert f.read() == b"0123456789abc"
+
+    path = ingested.path
+    ingested.close()
+    assert not path.exists()
+
+
+def test_ingested_file_is_freed_by_its_last_reference():
+    ingested = IngestedFile("big.pdf", spool_threshold=1)
+    ingested.write(b"data")
+    ingested.finish()
+    path = ingested.retain().path
+
+    ingested.close()
+    assert path.exists() and ingested.getvalue() == b"data"
+
+    ingested.close()
+    assert not path.exists()
+    with pytest.raises(ValueError):
+        ingested.open()
+
+
+@pytest.mark.asyncio
+async def test_ingest_rejects_oversized_upload():
+    with pytest.raises(HTTPException) as exc:
+        await ingest_upload(make_upload(b"x" * 2048), max_bytes=1024)
+    assert exc.value.status_code == 413
+
+
+def make_limited_app(max_body_size: int) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(MaxBodySizeMiddleware, max_body_size=max_body_size)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    return app
+
+
+@pytest.mark.asyncio
+async def test_body_limit_rejects_declared_length():
+    app = make_limited_app(1024)
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        ok = await ac.post("/upload", files={"file": ("a.pdf", b"x" * 100)})
+        too_big = await ac.post("/upload", files={"file": ("a.pdf", b"x" * 4096)})
+
+    assert ok.status_code == 200
+    assert too_big.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_body_limit_rejects_chunked_body():
+    app = make_limited_app(1024)
+
+    async def body():
+        yield b'--abc\r\nContent-Disposition: form-data; name="file"; filename="a.pdf"\r\n\r\n'
+        for _ in range(10):
+            yield b"x" * 512
+        yield b"\r\n--abc--\r\n"
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        resp = await ac.post("/upload", content=body(), headers={"Content-Type": "multipart/form-data; boundary=abc"})
+
+    assert resp.status_code == 413
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("content_length", [b"abc", b"-1", b""])
+async def test_body_limit_rejects_malformed_content_length(content_length):
+    middleware = MaxBodySizeMiddleware(make_limited_app(1024), max_body_size=1024)
+    scope = {"type": "http", "method": "POST", "path": "/upload", "headers": [(b"content-length", content_length)]}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await middleware(scope, receive, send)
+
+    assert sent[0]["status"] == 400
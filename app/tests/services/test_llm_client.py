@@ -0,0 +1,177 @@
+import asyncio
+
+import openai
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from unittest.mock import AsyncMock, patch
+
+from app.services import llm_client as llm_module
+from app.services.llm_client import CircuitBreaker, LLMClient, LLMUnavailableError, Provider, providers
+from app.utils.fake_llm_server import DEFAULT_REPLY, create_app
+
+
+def completion(content):
+    return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(llm_module, "LLM_HEDGE_AFTER", "")
+    for name in ("primary", "fallback"):
+        monkeypatch.setitem(providers, name, Provider(name, f"http://{name}.invalid/v1", "key"))
+    return LLMClient(["primary"])
+
+
+@pytest.mark.asyncio
+async def test_rate_limits_are_retried(client):
+    acreate = AsyncMock(side_effect=[
+        openai.error.RateLimitError("slow down"),
+        openai.error.APIError("bad gateway", http_status=502),
+        completion("ok"),
+    ])
+    with patch("openai.ChatCompletion.acreate", acreate):
+        response = await client.chat(model="m", messages=[])
+
+    assert response["choices"][0]["message"]["content"] == "ok"
+    assert acreate.await_count == 3
+    assert acreate.await_args.kwargs["api_base"] == "http://primary.invalid/v1"
+    stats = providers["primary"].get_stats()
+    assert stats["retries"] == 2 and stats["calls"] == 1 and stats["failures"] == 0
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_bad_requests_are_not_retried(client):
+    acreate = AsyncMock(side_effect=openai.error.InvalidRequestError("context too long", "messages"))
+    with patch("openai.ChatCompletion.acreate", acreate), pytest.raises(openai.error.InvalidRequestError):
+        await client.chat(model="m", messages=[])
+
+    assert acreate.await_count == 1
+    assert providers["primary"].breaker.state == "closed"
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_slow_attempts_time_out(client, monkeypatch):
+    monkeypatch.setattr(llm_module, "LLM_ATTEMPT_TIMEOUT", 0.05)
+    monkeypatch.setattr(llm_module, "LLM_MAX_RETRIES", 1)
+
+    async def hang(**kwargs):
+        await asyncio.sleep(1)
+
+    with patch("openai.ChatCompletion.acreate", side_effect=hang), pytest.raises(openai.error.Timeout):
+        await client.chat(model="m", messages=[])
+
+    assert providers["primary"].stats["timeouts"] == 2
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_open_breaker_fails_fast_or_falls_back(client, monkeypatch):
+    monkeypatch.setattr(llm_module, "LLM_MAX_RETRIES", 0)
+    providers["primary"].breaker = CircuitBreaker(failures=2, reset_after=60)
+    acreate = AsyncMock(side_effect=openai.error.ServiceUnavailableError("down"))
+
+    with patch("openai.ChatCompletion.acreate", acreate):
+        for _ in range(2):
+            with pytest.raises(openai.error.ServiceUnavailableError):
+                await client.chat(model="m", messages=[])
+        with pytest.raises(LLMUnavailableError):
+            await client.chat(model="m", messages=[])
+    assert acreate.await_count == 2
+    assert providers["primary"].stats["breaker_opens"] == 1
+
+    client.provider_names.append("fallback")
+    with patch("openai.ChatCompletion.acreate", AsyncMock(return_value=completion("from fallback"))) as acreate:
+        response = await client.chat(model="m", messages=[])
+    assert response["choices"][0]["message"]["content"] == "from fallback"
+    assert acreate.await_args.kwargs["api_base"] == "http://fallback.invalid/v1"
+    await client.close()
+
+
+def test_breaker_lets_one_trial_through_after_reset(monkeypatch):
+    breaker = CircuitBreaker(failures=1, reset_after=10)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    monkeypatch.setattr(breaker, "opened_at", breaker.opened_at - 10)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_trial_does_not_keep_the_breaker_half_open(client):
+    breaker = providers["primary"].breaker = CircuitBreaker(failures=1, reset_after=0)
+    breaker.record_failure()
+    started = asyncio.Event()
+
+    async def hang(**kwargs):
+        started.set()
+        await asyncio.sleep(10)
+
+    with patch("openai.ChatCompletion.acreate", side_effect=hang):
+        task = asyncio.ensure_future(client.chat(model="m", messages=[]))
+        await started.wait()
+        assert breaker.state == "half_open"
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    with patch("openai.ChatCompletion.acreate", AsyncMock(return_value=completion("ok"))):
+        response = await client.chat(model="m", messages=[])
+    assert response["choices"][0]["message"]["content"] == "ok"
+    assert breaker.state == "closed"
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_slow_call_is_hedged(client, monkeypatch):
+    monkeypatch.setattr(llm_module, "LLM_HEDGE_AFTER", "0.05")
+    delays = [1.0, 0.0]
+
+    async def acreate(**kwargs):
+        delay = delays.pop(0)
+        await asyncio.sleep(delay)
+        return completion(f"after {delay}")
+
+    with patch("openai.ChatCompletion.acreate", side_effect=acreate):
+        response = await client.chat(model="m", messages=[])
+
+    assert response["choices"][0]["message"]["content"] == "after 0.0"
+    assert providers["primary"].stats["hedges"] == 1
+    assert providers["primary"].stats["hedge_wins"] == 1
+    await client.close()
+
+
+@pytest_asyncio.fixture
+async def stub_server():
+    app = create_app()
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield app, f"http://127.0.0.1:{port}/v1"
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_stub_provider_over_http(stub_server, monkeypatch):
+    app, url = stub_server
+    monkeypatch.setitem(providers, "stub", Provider("stub", url, "stub"))
+    client = LLMClient(["stub"])
+    messages = [{"role": "user", "content": "summarize"}]
+
+    response = await client.chat(model="m", messages=messages)
+    chunks = [chunk async for chunk in await client.stream(model="m", messages=messages)]
+
+    assert response.choices[0].message.content == DEFAULT_REPLY
+    assert "".join(c.choices[0].delta.get("content", "") for c in chunks) == DEFAULT_REPLY
+    assert len(app["requests"]) == 2
+    assert providers["stub"].get_stats()["p50_ms"] is not None
+    # Both calls went through the one pooled session.
+    assert openai.aiosession.get() is client._session
+    await client.close()
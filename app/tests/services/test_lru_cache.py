@@ -0,0 +1,36 @@
+import time
+
+from app.utils.lru_cache import LRUCache
+
+
+def test_lru_evicts_least_recently_used_when_over_size():
+    cache = LRUCache(max_bytes=10, ttl=60)
+    cache.set("a", b"aaaa")
+    cache.set("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+
+    cache.set("c", b"cccc")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa"
+    assert cache.get("c") == b"cccc"
+    assert cache.current_bytes == 8
+    assert cache.stats == {"hits": 3, "misses": 1, "evictions": 1, "expirations": 0}
+
+
+def test_lru_expires_entries(monkeypatch):
+    cache = LRUCache(max_bytes=100, ttl=5)
+    cache.set("a", b"value")
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 6)
+
+    assert cache.get("a") is None
+    assert cache.stats["expirations"] == 1
+    assert cache.current_bytes == 0
+
+
+def test_lru_skips_values_larger_than_the_cache():
+    cache = LRUCache(max_bytes=4, ttl=60)
+    cache.set("big", b"too large")
+    assert len(cache) == 0
@@ -1,14 +1,49 @@
-from pathlib import Path
-from unittest.mock import patch, mock_open
-from app.services.s3_service import upload_file_to_s3
-
-@patch("builtins.open", new_callable=mock_open, read_data=b"dummy content")
-@patch("app.services.s3_service.s3_client.upload_file")
-def test_upload_file_to_s3(mock_upload, mock_open_file):
-    path = Path("test.pdf")
-    filename = "original.pdf"
-    url = upload_file_to_s3(path, filename)
-
-    assert url.startswith("s3://document-uploads-bucket-")
-    assert path.name in url
-    mock_upload.assert_called_once()
+import hashlib
+from unittest.mock import patch
+
+from botocore.exceptions import ClientError
+
+from app.services import s3_service
+from app.services.ingest_service import IngestedFile
+from app.services.s3_service import BUCKET_NAME, upload_file_to_s3, upload_ingested_to_s3
+
+
+def test_upload_file_to_s3(s3_bucket, tmp_path):
+    path = tmp_path / "test.pdf"
+    path.write_bytes(b"dummy content")
+    file_hash = hashlib.sha256(b"dummy content").hexdigest()
+
+    url = upload_file_to_s3(path, "original.pdf")
+
+    assert url == f"s3://{BUCKET_NAME}/documents/sha256/{file_hash}"
+    head = s3_bucket.head_object(Bucket=BUCKET_NAME, Key=f"documents/sha256/{file_hash}")
+    assert head["Metadata"]["original-filename"] == "original.pdf"
+    assert head["ContentType"] == "application/pdf"
+
+
+def test_same_content_is_stored_once(s3_bucket):
+    def ingest(name):
+        ingested = IngestedFile(name)
+        ingested.write(b"same bytes")
+        ingested.finish()
+        return ingested
+
+    first = upload_ingested_to_s3(ingest("report.pdf"))
+    with patch.object(s3_service.s3_client, "upload_fileobj") as upload:
+        second = upload_ingested_to_s3(ingest("report (copy).pdf"))
+
+    assert second == first
+    upload.assert_not_called()
+    assert len(s3_bucket.list_objects_v2(Bucket=BUCKET_NAME)["Contents"]) == 1
+
+
+def test_upload_goes_ahead_when_the_existence_check_is_forbidden(s3_bucket, tmp_path):
+    path = tmp_path / "test.pdf"
+    path.write_bytes(b"dummy content")
+    forbidden = ClientError({"Error": {"Code": "403", "Message": "Forbidden"}}, "HeadObject")
+
+    with patch.object(s3_service.s3_client, "head_object", side_effect=forbidden):
+        url = upload_file_to_s3(path, "original.pdf")
+
+    key = url.split(f"s3://{BUCKET_NAME}/", 1)[1]
+    assert s3_bucket.get_object(Bucket=BUCKET_NAME, Key=key)["Body"].read() == b"dummy content"
@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+from fakeredis import FakeAsyncRedis
+
+from app.utils.single_flight import SingleFlight, SingleFlightError
+
+
+class FakePipeline:
+    """Counts executions and stores results where fetch can find them."""
+
+    def __init__(self, delay=0.2, fail=False):
+        self.calls = 0
+        self.cache = {}
+        self.delay = delay
+        self.fail = fail
+
+    def run(self, key):
+        async def fn():
+            self.calls += 1
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError("pipeline failed")
+            self.cache[key] = f"result for {key}"
+            return self.cache[key]
+        return fn
+
+    def fetch(self, key):
+        async def fetch():
+            return self.cache.get(key)
+        return fetch
+
+
+@pytest.mark.asyncio
+async def test_identical_calls_in_one_process_run_once():
+    redis = FakeAsyncRedis()
+    flight = SingleFlight("test", poll_interval=0.05)
+    pipeline = FakePipeline()
+
+    results = await asyncio.gather(*(
+        flight.do(redis, "doc", pipeline.run("doc"), pipeline.fetch("doc")) for _ in range(10)
+    ))
+
+    assert pipeline.calls == 1
+    assert results == ["result for doc"] * 10
+
+
+@pytest.mark.asyncio
+async def test_identical_calls_across_processes_run_once():
+    redis = FakeAsyncRedis()
+    # separate instances stand in for separate workers sharing one Redis
+    replicas = [SingleFlight("test", poll_interval=0.05) for _ in range(4)]
+    pipeline = FakePipeline()
+
+    results = await asyncio.gather(*(
+        flight.do(redis, "doc", pipeline.run("doc"), pipeline.fetch("doc")) for flight in replicas
+    ))
+
+    assert pipeline.calls == 1
+    assert results == ["result for doc"] * 4
+    assert not await redis.exists("test:lock:doc")
+
+
+@pytest.mark.asyncio
+async def test_waiter_takes_over_from_a_lost_lock_holder():
+    redis = FakeAsyncRedis()
+    # a holder that died without releasing: its lock only goes away by expiring
+    await redis.set("test:lock:doc", "dead-holder", px=300)
+    flight = SingleFlight("test", poll_interval=0.05)
+    pipeline = FakePipeline(delay=0)
+
+    result = await asyncio.wait_for(flight.do(redis, "doc", pipeline.run("doc"), pipeline.fetch("doc")), timeout=5)
+
+    assert result == "result for doc"
+    assert pipeline.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_leader_failure_is_propagated_to_waiters():
+    redis = FakeAsyncRedis()
+    leader, waiter = SingleFlight("test", poll_interval=0.05), SingleFlight("test", poll_interval=0.05)
+    pipeline = FakePipeline(fail=True)
+
+    results = await asyncio.gather(
+        leader.do(redis, "doc", pipeline.run("doc"), pipeline.fetch("doc")),
+        waiter.do(redis, "doc", pipeline.run("doc"), pipeline.fetch("doc")),
+        return_exceptions=True,
+    )
+
+    assert pipeline.calls == 1
+    assert isinstance(results[0], RuntimeError)
+    assert isinstance(results[1], SingleFlightError)
+    assert "pipeline failed" in str(results[1])
+
+
+@pytest.mark.asyncio
+async def test_lock_is_kept_alive_while_the_call_runs():
+    redis = FakeAsyncRedis()
+    flight = SingleFlight("test", lock_ttl=0.3, poll_interval=0.05)
+    other = SingleFlight("test", lock_ttl=0.3, poll_interval=0.05)
+    pipeline = FakePipeline(delay=1)
+
+    await asyncio.gather(
+        flight.do(redis, "doc", pipeline.run("doc"), pipeline.fetch("doc")),
+        other.do(redis, "doc", pipeline.run("doc"), pipeline.fetch("doc")),
+    )
+
+    assert pipeline.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_leaves_the_call_running_for_other_callers():
+    redis = FakeAsyncRedis()
+    flight = SingleFlight("test", poll_interval=0.05)
+    pipeline = FakePipeline()
+
+    leader = asyncio.ensure_future(flight.do(redis, "doc", pipeline.run("doc"), pipeline.fetch("doc")))
+    follower = asyncio.ensure_future(flight.do(redis, "doc", pipeline.run("doc"), pipeline.fetch("doc")))
+    await asyncio.sleep(0.05)
+    leader.cancel()
+
+    assert await follower == "result for doc"
+    assert leader.cancelled()
+    assert pipeline.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_call_is_cancelled_when_every_caller_is():
+    redis = FakeAsyncRedis()
+    flight = SingleFlight("test", poll_interval=0.05)
+    pipeline = FakePipeline()
+
+    caller = asyncio.ensure_future(flight.do(redis, "doc", pipeline.run("doc"), pipeline.fetch("doc")))
+    await asyncio.sleep(0.05)
+    caller.cancel()
+    await asyncio.sleep(0.3)
+
+    assert caller.cancelled()
+    assert "doc" not in pipeline.cache
+    assert not await redis.exists("test:lock:doc")
@@ -0,0 +1,118 @@
+import random
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.common import SummaryLength
+from app.services import text_cache
+from app.services.document_pipeline import summarize_extraction
+from app.services.text_cache import get_reusable_summary, remember_summary
+from app.utils.fingerprint import lsh_bands, similarity, text_signature
+
+WORDS = [
+    "revenue", "quarter", "customer", "contract", "delivery", "invoice", "payment", "service", "account",
+    "balance", "growth", "margin", "supplier", "order", "period", "report", "annual", "total", "region",
+    "market", "product", "team", "project", "budget", "forecast", "review", "policy", "risk", "asset",
+]
+
+
+def document(seed: int, words: int = 300) -> str:
+    rng = random.Random(seed)
+    lines = []
+    for line in range(words // 12):
+        lines.append(" ".join(rng.choice(WORDS) for _ in range(12)))
+    return "\n".join(lines) + "\nTotal due 1,250.00 on 2024-03-01"
+
+
+def test_signature_ignores_case_and_whitespace():
+    text = document(1)
+    reformatted = "  " + text.upper().replace("\n", "\n\n  ").replace(" ", "\t ")
+
+    assert text_signature(reformatted).text_hash == text_signature(text).text_hash
+
+
+def test_small_edits_keep_texts_similar():
+    text = document(2)
+    words = text.split(" ")
+    words[40] = "amended"
+    words[120] = "corrected"
+    edited = " ".join(words) + "\nPage 1 of 1"
+
+    original = text_signature(text).minhash
+    assert similarity(original, text_signature(edited).minhash) >= 0.85
+    assert similarity(original, text_signature(document(3)).minhash) < 0.2
+
+
+def test_similar_texts_share_a_band():
+    text = document(4)
+    edited = text.replace("invoice", "invoices", 1)
+
+    bands = lsh_bands(text_signature(text).minhash, 16)
+    assert any(a == b for a, b in zip(bands, lsh_bands(text_signature(edited).minhash, 16)))
+
+
+@pytest.mark.asyncio
+async def test_exact_text_is_reused(fake_redis):
+    await remember_summary(text_signature("Hello  World"), SummaryLength.short, "greeting")
+
+    assert await get_reusable_summary(text_signature("hello world"), SummaryLength.short) == "greeting"
+    assert await get_reusable_summary(text_signature("hello world"), SummaryLength.long) is None
+
+
+@pytest.mark.asyncio
+async def test_near_duplicate_text_is_reused(fake_redis):
+    text = document(5)
+    await remember_summary(text_signature(text), SummaryLength.medium, "stored summary")
+    rescanned = text.replace("revenue", "revenua", 1).replace("margin", "rnargin", 1)
+
+    before = text_cache.text_cache_stats["near_hits"]
+    assert await get_reusable_summary(text_signature(rescanned), SummaryLength.medium) == "stored summary"
+    assert text_cache.text_cache_stats["near_hits"] == before + 1
+
+
+@pytest.mark.asyncio
+async def test_different_numbers_are_never_near_duplicates(fake_redis):
+    text = document(6)
+    await remember_summary(text_signature(text), SummaryLength.medium, "invoice 1,250.00")
+
+    other_invoice = text.replace("1,250.00", "9,870.00")
+    assert await get_reusable_summary(text_signature(other_invoice), SummaryLength.medium) is None
+
+
+@pytest.mark.asyncio
+async def test_unrelated_text_is_not_reused(fake_redis):
+    await remember_summary(text_signature(document(7)), SummaryLength.medium, "seven")
+
+    assert await get_reusable_summary(text_signature(document(8)), SummaryLength.medium) is None
+
+
+@pytest.mark.asyncio
+async def test_short_texts_stay_out_of_the_index(fake_redis):
+    await remember_summary(text_signature("a short note about revenue"), SummaryLength.short, "note")
+
+    assert await fake_redis.keys("neardup:*") == []
+
+
+@pytest.mark.asyncio
+async def test_reexported_document_skips_the_llm(fake_redis):
+    text = document(9)
+    summarize = AsyncMock(return_value="the summary")
+    with patch("app.services.document_pipeline.summarize_text", summarize):
+        first, first_reused = await summarize_extraction("hash-a", "a.pdf", text, "s3://b/a.pdf", SummaryLength.short)
+        second, second_reused = await summarize_extraction(
+            "hash-b", "a-export.pdf", text.replace("\n", " \n"), "s3://b/a-export.pdf", SummaryLength.short
+        )
+
+    assert summarize.await_count == 1
+    assert second["summary"] == first["summary"] == "the summary"
+    assert second["s3_url"] == "s3://b/a-export.pdf"
+    assert second_reused and not first_reused
+    assert set(second) == set(first) == {"filename", "extracted_text", "summary", "s3_url"}
+
+
+@pytest.mark.asyncio
+async def test_lookups_fall_through_when_redis_is_down(fake_redis):
+    from redis.exceptions import ConnectionError
+
+    with patch.object(fake_redis, "pipeline", side_effect=ConnectionError("down")):
+        assert await get_reusable_summary(text_signature(document(10)), SummaryLength.short) is None
@@ -0,0 +1,112 @@
+import io
+
+import pytest
+from moto import mock_textract
+from moto.textract.models import TextractBackend
+from starlette.datastructures import UploadFile
+from unittest.mock import patch
+
+from app.services import textract_service
+from app.services.document_pipeline import extract_and_store
+from app.services.ingest_service import ingest_upload
+from app.services.textract_service import (
+    MultiPageDocumentError,
+    count_pdf_pages,
+    extract_text_from_bytes,
+    extract_text_from_s3_url_async,
+)
+
+TWO_PAGE_PDF = b"%PDF-1.4 1 0 obj << /Type /Pages /Count 2 >> 2 0 obj << /Type /Page >> 3 0 obj << /Type /Page >>"
+
+
+def line(text, page):
+    return {"BlockType": "LINE", "Text": text, "Page": page}
+
+
+@pytest.fixture
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(textract_service, "TEXTRACT_POLL_INITIAL_DELAY", 0.01)
+    monkeypatch.setattr(textract_service, "TEXTRACT_POLL_MAX_DELAY", 0.02)
+
+
+def test_count_pdf_pages_ignores_the_pages_tree():
+    assert count_pdf_pages(TWO_PAGE_PDF) == 2
+    assert count_pdf_pages(b"%PDF-1.4 << /Type /Pages >>") == 0
+
+
+def test_multi_page_pdf_is_refused_by_the_sync_path():
+    with pytest.raises(MultiPageDocumentError):
+        extract_text_from_bytes(TWO_PAGE_PDF, ".pdf")
+
+
+def test_unsupported_document_from_textract_means_multi_page():
+    error = textract_service.textract.exceptions.UnsupportedDocumentException(
+        {"Error": {"Code": "UnsupportedDocumentException", "Message": "multi page"}}, "AnalyzeDocument"
+    )
+    with patch.object(textract_service.textract, "analyze_document", side_effect=error):
+        with pytest.raises(MultiPageDocumentError):
+            extract_text_from_bytes(b"%PDF-1.7 compressed objects", ".pdf")
+
+
+@pytest.mark.asyncio
+async def test_async_job_against_moto(monkeypatch, fast_polling):
+    monkeypatch.setattr(TextractBackend, "BLOCKS", [line("second page", 2), line("first page", 1)])
+
+    with mock_textract():
+        text = await extract_text_from_s3_url_async("s3://bucket/uploads/doc.pdf")
+
+    assert text == "first page\nsecond page"
+
+
+@pytest.mark.asyncio
+async def test_async_job_polls_until_done_and_follows_next_token(fast_polling):
+    responses = [
+        {"JobStatus": "IN_PROGRESS"},
+        {"JobStatus": "IN_PROGRESS"},
+        {"JobStatus": "SUCCEEDED", "Blocks": [line("page 1 line", 1)], "NextToken": "t1"},
+        {"JobStatus": "SUCCEEDED", "Blocks": [line("page 2 line", 2)], "NextToken": "t2"},
+        {"JobStatus": "SUCCEEDED", "Blocks": [line("page 3 line", 3)]},
+    ]
+    with (
+        patch.object(textract_service.textract, "start_document_text_detection", return_value={"JobId": "job-1"}) as start,
+        patch.object(textract_service.textract, "get_document_text_detection", side_effect=responses) as get,
+    ):
+        text = await extract_text_from_s3_url_async("s3://bucket/uploads/2024/doc.pdf")
+
+    assert text == "page 1 line\npage 2 line\npage 3 line"
+    start.assert_called_once_with(
+        DocumentLocation={"S3Object": {"Bucket": "bucket", "Name": "uploads/2024/doc.pdf"}}
+    )
+    assert get.call_count == 5
+    assert get.call_args_list[-1].kwargs == {"JobId": "job-1", "NextToken": "t2"}
+
+
+@pytest.mark.asyncio
+async def test_failed_async_job_raises(fast_polling):
+    with (
+        patch.object(textract_service.textract, "start_document_text_detection", return_value={"JobId": "job-1"}),
+        patch.object(
+            textract_service.textract,
+            "get_document_text_detection",
+            return_value={"JobStatus": "FAILED", "StatusMessage": "bad document"},
+        ),
+    ):
+        with pytest.raises(RuntimeError, match="bad document"):
+            await extract_text_from_s3_url_async("s3://bucket/doc.pdf")
+
+
+@pytest.mark.asyncio
+async def test_pipeline_extracts_multi_page_pdf_from_the_uploaded_object(fake_redis):
+    ingested = await ingest_upload(UploadFile(file=io.BytesIO(TWO_PAGE_PDF), filename="doc.pdf"))
+
+    async def from_s3(s3_url):
+        assert s3_url == "s3://bucket/doc.pdf"
+        return "all pages"
+
+    with (
+        patch("app.services.s3_service.upload_ingested_to_s3", return_value="s3://bucket/doc.pdf"),
+        patch("app.services.document_pipeline.extract_text_from_s3_url_async", side_effect=from_s3),
+    ):
+        text, s3_url = await extract_and_store(ingested)
+
+    assert (text, s3_url) == ("all pages", "s3://bucket/doc.pdf")
@@ -0,0 +1,119 @@
+import pytest
+from datetime import timedelta
+from fastapi import HTTPException
+from unittest.mock import patch
+
+from app.services import user_documents
+from app.services.user_cache import USER_CACHE_NEGATIVE_TTL, user_local_cache
+from app.services.user_documents import (
+    create_access_token,
+    disable_user,
+    get_current_active_user,
+    get_current_user,
+    get_user,
+    register_user,
+)
+
+
+def token_for(username):
+    return create_access_token({"sub": username}, expires_delta=timedelta(minutes=5))
+
+
+@pytest.fixture
+def counted_get_user():
+    with patch.object(user_documents, "get_user", wraps=get_user) as wrapped:
+        yield wrapped
+
+
+def test_get_user_resolves_usernames_through_the_index(dynamodb_tables):
+    created = user_documents.create_user("alice", "secret")
+
+    user = get_user("alice")
+
+    assert user.uuid == created.uuid
+    assert user_documents.verify_password("secret", user.hashed_password)
+    assert get_user("nobody") is None
+
+
+@pytest.mark.asyncio
+async def test_current_user_is_served_from_cache(dynamodb_tables, fake_redis, counted_get_user):
+    user_documents.create_user("alice", "secret")
+    counted_get_user.reset_mock()
+    token = token_for("alice")
+
+    first = await get_current_user(token)
+    second = await get_current_user(token)
+    user_local_cache.clear()
+    third = await get_current_user(token)
+
+    assert first == second == third
+    assert first.username == "alice"
+    assert not hasattr(first, "hashed_password")
+    assert counted_get_user.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_unknown_users_are_cached_negatively(dynamodb_tables, fake_redis, counted_get_user):
+    token = token_for("ghost")
+
+    assert await get_current_user(token) is None
+    assert await get_current_user(token) is None
+    assert counted_get_user.call_count == 1
+    assert 0 < await fake_redis.ttl("user:v1:ghost") <= USER_CACHE_NEGATIVE_TTL
+
+
+@pytest.mark.asyncio
+async def test_failed_lookups_are_not_cached(dynamodb_tables, fake_redis):
+    from botocore.exceptions import ClientError
+
+    user_documents.create_user("erin", "secret")
+    throttled = ClientError({"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "slow down"}}, "Query")
+    token = token_for("erin")
+
+    with patch.object(user_documents.users_table, "query", side_effect=throttled):
+        with pytest.raises(HTTPException) as error:
+            await get_current_user(token)
+    assert error.value.status_code == 500
+    assert not await fake_redis.exists("user:v1:erin")
+
+    assert (await get_current_user(token)).username == "erin"
+
+
+@pytest.mark.asyncio
+async def test_registration_replaces_a_negative_entry(dynamodb_tables, fake_redis, counted_get_user):
+    token = token_for("bob")
+    assert await get_current_user(token) is None
+
+    await register_user("bob", "secret")
+
+    user = await get_current_user(token)
+    assert user.username == "bob"
+    assert counted_get_user.call_count == 2  # the lookup before and create_user's duplicate check
+
+
+@pytest.mark.asyncio
+async def test_disabling_a_user_is_seen_on_the_next_request(dynamodb_tables, fake_redis):
+    await register_user("carol", "secret")
+    token = token_for("carol")
+    assert (await get_current_active_user(await get_current_user(token))).username == "carol"
+
+    await disable_user("carol")
+
+    assert get_user("carol").disabled is True
+    with pytest.raises(HTTPException) as error:
+        await get_current_active_user(await get_current_user(token))
+    assert error.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_lookups_fall_back_to_dynamodb_when_redis_is_down(dynamodb_tables, fake_redis):
+    from redis.exceptions import ConnectionError
+
+    user_documents.create_user("dave", "secret")
+    with (
+        patch.object(fake_redis, "get", side_effect=ConnectionError("down")),
+        patch.object(fake_redis, "set", side_effect=ConnectionError("down")),
+    ):
+        user = await get_current_user(token_for("dave"))
+
+    assert user.username == "dave"
@@ -0,0 +1,78 @@
+import pytest
+from httpx import AsyncClient
+
+from app.main import app
+from app.services import user_documents
+from app.utils.executor import auth_pool
+from app.utils.passwords import hash_password
+
+
+@pytest.fixture
+def fast_bcrypt(monkeypatch):
+    monkeypatch.setattr(user_documents, "BCRYPT_ROUNDS", 4)
+
+
+async def login(ac, username, password):
+    return await ac.post("/auth/login", data={"username": username, "password": password})
+
+
+@pytest.mark.asyncio
+async def test_register_and_login(dynamodb_tables, fake_redis, fast_bcrypt):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        registered = await ac.post("/auth/register", json={"username": "erin", "password": "pw"})
+        duplicate = await ac.post("/auth/register", json={"username": "erin", "password": "pw"})
+        good = await login(ac, "erin", "pw")
+        bad = await login(ac, "erin", "wrong")
+
+    assert registered.status_code == 200
+    assert registered.json()["username"] == "erin"
+    assert duplicate.status_code == 400
+    assert good.status_code == 200
+    assert good.json()["token_type"] == "bearer"
+    assert bad.status_code == 401
+    assert user_documents.get_user("erin").hashed_password.startswith("$2b$04$")
+
+
+@pytest.mark.asyncio
+async def test_login_rehashes_when_the_cost_changed(dynamodb_tables, fake_redis, monkeypatch):
+    user_documents.put_new_user("frank", hash_password("pw", 4))
+    monkeypatch.setattr(user_documents, "BCRYPT_ROUNDS", 5)
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        assert (await login(ac, "frank", "wrong")).status_code == 401
+        assert user_documents.get_user("frank").hashed_password.startswith("$2b$04$")
+
+        assert (await login(ac, "frank", "pw")).status_code == 200
+        rehashed = user_documents.get_user("frank").hashed_password
+        assert rehashed.startswith("$2b$05$")
+
+        assert (await login(ac, "frank", "pw")).status_code == 200
+        assert user_documents.get_user("frank").hashed_password == rehashed
+
+
+@pytest.mark.asyncio
+async def test_logins_are_refused_when_the_hash_queue_is_full(dynamodb_tables, fake_redis, fast_bcrypt, monkeypatch):
+    user_documents.put_new_user("gina", hash_password("pw", 4))
+    monkeypatch.setattr(auth_pool, "max_pending", 0)
+    rejected = auth_pool.stats["rejected"]
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        resp = await login(ac, "gina", "pw")
+
+    assert resp.status_code == 503
+    assert resp.headers["retry-after"] == "1"
+    assert auth_pool.stats["rejected"] == rejected + 1
+
+
+@pytest.mark.asyncio
+async def test_hashing_runs_on_the_auth_pool(dynamodb_tables, fake_redis, fast_bcrypt):
+    user_documents.put_new_user("hank", hash_password("pw", 4))
+    completed = auth_pool.stats["completed"]
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        assert (await login(ac, "hank", "pw")).status_code == 200
+        stats = (await ac.get("/health/executors")).json()
+
+    assert stats["auth"]["completed"] == completed + 1
+    assert stats["auth"]["pending"] == 0
+    assert stats["auth"]["queue_seconds"] >= 0
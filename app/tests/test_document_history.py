@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+
+import pytest
+from httpx import AsyncClient
+
+from app.main import app
+from app.models.documents import DocumentCreate
+from app.services import user_documents
+from app.services.user_documents import (
+    create_access_token,
+    create_document,
+    encode_document_cursor,
+    get_documents_for_user,
+    put_new_user,
+)
+from app.utils.passwords import hash_password
+
+START = datetime(2024, 5, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def users(dynamodb_tables, fake_redis):
+    return {name: put_new_user(name, hash_password("pw", 4)) for name in ("ivy", "jack")}
+
+
+def seed(user, count):
+    return [
+        create_document(DocumentCreate(
+            user_uuid=user.uuid,
+            summary_title=f"Doc {i}...",
+            summary=f"summary of document {i}",
+            document_url=f"https://bucket.s3.amazonaws.com/doc{i}.pdf",
+            document_name=f"doc{i}.pdf",
+            document_size=10 + i,
+            summary_length="medium",
+            date=START + timedelta(minutes=i),
+        ))
+        for i in range(count)
+    ]
+
+
+def auth(user):
+    return {"Authorization": f"Bearer {create_access_token({'sub': user.username})}"}
+
+
+@pytest.mark.asyncio
+async def test_history_is_paginated_newest_first_without_summaries(users):
+    seed(users["ivy"], 5)
+    seed(users["jack"], 2)
+
+    pages = []
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        params = {"limit": 2}
+        while True:
+            resp = await ac.get("/documents", params=params, headers=auth(users["ivy"]))
+            assert resp.status_code == 200
+            pages.append(resp.json())
+            if not pages[-1]["next_cursor"]:
+                break
+            params["cursor"] = pages[-1]["next_cursor"]
+
+    names = [item["document_name"] for page in pages for item in page["items"]]
+    assert names == ["doc4.pdf", "doc3.pdf", "doc2.pdf", "doc1.pdf", "doc0.pdf"]
+    assert all("summary" not in item for page in pages for item in page["items"])
+    assert all(len(page["items"]) <= 2 for page in pages)
+
+
+@pytest.mark.asyncio
+async def test_cursors_cannot_be_forged_or_reused_across_users(users):
+    seed(users["ivy"], 3)
+    foreign = encode_document_cursor({
+        "id": "x", "user_uuid": str(users["ivy"].uuid), "date": START.isoformat(),
+    })
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        garbage = await ac.get("/documents", params={"cursor": "not-a-cursor"}, headers=auth(users["jack"]))
+        stolen = await ac.get("/documents", params={"cursor": foreign}, headers=auth(users["jack"]))
+        too_many = await ac.get("/documents", params={"limit": 500}, headers=auth(users["jack"]))
+
+    assert garbage.status_code == 400
+    assert stolen.status_code == 400
+    assert too_many.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_document_detail_returns_the_summary_to_its_owner_only(users):
+    document = seed(users["ivy"], 1)[0]
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        own = await ac.get(f"/documents/{document.id}", headers=auth(users["ivy"]))
+        other = await ac.get(f"/documents/{document.id}", headers=auth(users["jack"]))
+        anonymous = await ac.get(f"/documents/{document.id}")
+        bad_token = await ac.get("/documents", headers={"Authorization": "Bearer nope"})
+
+    assert own.status_code == 200
+    assert own.json()["summary"] == "summary of document 0"
+    assert other.status_code == 404
+    assert anonymous.status_code == 401
+    assert bad_token.status_code == 401
+
+
+def test_full_history_follows_every_page(users, monkeypatch):
+    seed(users["ivy"], 5)
+    original = user_documents.list_documents_for_user
+    monkeypatch.setattr(
+        user_documents, "list_documents_for_user",
+        lambda user_uuid, limit, cursor=None: original(user_uuid, 2, cursor),
+    )
+
+    documents = get_documents_for_user(users["ivy"].uuid)
+
+    assert [d.summary for d in documents] == [f"summary of document {i}" for i in range(4, -1, -1)]
@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import io
+import json
+
+import pytest
+from httpx import AsyncClient
+from unittest.mock import AsyncMock, patch
+
+from app.common import SummaryLength
+from app.main import app
+from app.services.cache_service import summary_cache_key
+from app.services.job_service import (
+    JOB_PROCESSING_KEY,
+    JOB_QUEUE_KEY,
+    ack_job,
+    claim_next_job,
+    create_job,
+    requeue_stale_jobs,
+    unleased_jobs,
+)
+from app.worker import consume, requeue_stale, run_job
+
+TEXTRACT_RESPONSE = {"Blocks": [{"BlockType": "LINE", "Text": "Job line"}]}
+
+
+async def post_job(ac, content=b"job document", filename="doc.pdf"):
+    return await ac.post(
+        "/documents/jobs",
+        files={"file": (filename, io.BytesIO(content), "application/pdf")},
+        params={"summary_length": "short"},
+    )
+
+
+@pytest.mark.asyncio
+async def test_job_is_queued_and_processed_by_worker(fake_redis, s3_bucket, no_rate_limit):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        resp = await post_job(ac)
+        assert resp.status_code == 202
+        job_id = resp.json()["job_id"]
+        assert resp.json()["status"] == "queued"
+
+        status = (await ac.get(f"/documents/jobs/{job_id}")).json()
+        assert status["status"] == "queued"
+
+        assert await claim_next_job(timeout=1) == job_id
+        with (
+            patch("app.services.textract_service.textract.analyze_document", return_value=TEXTRACT_RESPONSE),
+            patch("app.services.document_pipeline.summarize_text", new_callable=AsyncMock, return_value="Job summary"),
+        ):
+            await run_job(job_id)
+
+        status = (await ac.get(f"/documents/jobs/{job_id}")).json()
+
+    assert status["status"] == "completed"
+    assert status["result"]["summary"] == "Job summary"
+    assert status["result"]["extracted_text"] == "Job line"
+    assert status["result"]["s3_url"].startswith("s3://")
+    assert await fake_redis.llen(JOB_PROCESSING_KEY) == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_document_completes_job_immediately(fake_redis, s3_bucket, no_rate_limit):
+    cached = {"filename": "doc.pdf", "extracted_text": "x", "summary": "Cached", "s3_url": "s3://b/k"}
+    content_hash = hashlib.sha256(b"cached document").hexdigest()
+    await fake_redis.set(summary_cache_key(content_hash, SummaryLength.short), json.dumps(cached))
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        resp = await post_job(ac, content=b"cached document")
+        job_id = resp.json()["job_id"]
+        status = (await ac.get(f"/documents/jobs/{job_id}")).json()
+
+    assert resp.json()["status"] == "completed"
+    assert status["result"] == cached
+    assert await fake_redis.llen(JOB_QUEUE_KEY) == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_job_reports_error(fake_redis, s3_bucket, no_rate_limit):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        job_id = (await post_job(ac)).json()["job_id"]
+        with patch("app.services.textract_service.textract.analyze_document", side_effect=Exception("Textract fail")):
+            await run_job(job_id)
+        status = (await ac.get(f"/documents/jobs/{job_id}")).json()
+
+    assert status["status"] == "failed"
+    assert "Textract fail" in status["error"]
+
+
+@pytest.mark.asyncio
+async def test_job_events_stream_ends_with_terminal_state(fake_redis, s3_bucket, no_rate_limit):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        job_id = (await post_job(ac)).json()["job_id"]
+        with (
+            patch("app.services.textract_service.textract.analyze_document", return_value=TEXTRACT_RESPONSE),
+            patch("app.services.document_pipeline.summarize_text", new_callable=AsyncMock, return_value="Job summary"),
+        ):
+            await run_job(job_id)
+
+        resp = await ac.get(f"/documents/jobs/{job_id}/events")
+
+    events = [json.loads(line[len("data: "):]) for line in resp.text.splitlines() if line.startswith("data: ")]
+    assert events[-1]["status"] == "completed"
+    assert events[-1]["result"]["summary"] == "Job summary"
+
+
+@pytest.mark.asyncio
+async def test_unknown_job_returns_404(fake_redis):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        resp = await ac.get("/documents/jobs/does-not-exist")
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_job_for_cached_extraction_skips_download(fake_redis, s3_bucket, no_rate_limit):
+    content_hash = hashlib.sha256(b"extracted before").hexdigest()
+    await fake_redis.set(
+        f"extract:v1:{content_hash}", json.dumps({"extracted_text": "Known text", "s3_url": "s3://bucket/known"})
+    )
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        job_id = (await post_job(ac, content=b"extracted before")).json()["job_id"]
+        with (
+            patch("app.worker.download_s3_url_to_ingested_async") as download,
+            patch("app.services.document_pipeline.summarize_text", new_callable=AsyncMock, return_value="Resummarized"),
+        ):
+            await run_job(job_id)
+        status = (await ac.get(f"/documents/jobs/{job_id}")).json()
+
+    download.assert_not_called()
+    assert status["result"]["summary"] == "Resummarized"
+    assert status["result"]["s3_url"] == "s3://bucket/known"
+
+
+@pytest.mark.asyncio
+async def test_requeue_skips_jobs_a_live_worker_holds(fake_redis):
+    running = await create_job({"status": "queued"})
+    abandoned = await create_job({"status": "queued"})
+    assert await claim_next_job(timeout=1) == running
+    assert await claim_next_job(timeout=1) == abandoned
+    # the worker that claimed it died: its lease ran out
+    await fake_redis.delete(f"job:{abandoned}:lease")
+
+    assert await unleased_jobs() == {abandoned}
+    assert await requeue_stale_jobs([running, abandoned]) == 1
+    assert await fake_redis.lrange(JOB_QUEUE_KEY, 0, -1) == [abandoned.encode()]
+    assert await fake_redis.lrange(JOB_PROCESSING_KEY, 0, -1) == [running.encode()]
+
+    await ack_job(running)
+    assert not await fake_redis.exists(f"job:{running}:lease")
+
+
+@pytest.mark.asyncio
+async def test_consumer_survives_errors_outside_a_job(fake_redis, monkeypatch):
+    monkeypatch.setattr("app.worker.WORKER_ERROR_BACKOFF", 0.01)
+    first = await create_job({"status": "queued"})
+    second = await create_job({"status": "queued"})
+    stop = asyncio.Event()
+    ran = []
+
+    async def run(job_id):
+        ran.append(job_id)
+        if job_id == first:
+            raise ConnectionError("redis went away")
+        stop.set()
+
+    with patch("app.worker.run_job", side_effect=run):
+        await asyncio.wait_for(consume(stop), timeout=5)
+
+    assert ran == [first, second]
+    assert await fake_redis.llen(JOB_PROCESSING_KEY) == 0
+
+
+@pytest.mark.asyncio
+async def test_worker_requeues_abandoned_jobs_on_its_own(fake_redis, monkeypatch):
+    monkeypatch.setattr("app.worker.JOB_LEASE_TTL", 0.05)
+    job_id = await create_job({"status": "running"})
+    assert await claim_next_job(timeout=1) == job_id
+    await fake_redis.delete(f"job:{job_id}:lease")
+    stop = asyncio.Event()
+
+    task = asyncio.ensure_future(requeue_stale(stop))
+    await asyncio.sleep(0.2)
+    stop.set()
+    await asyncio.wait_for(task, timeout=1)
+
+    assert await fake_redis.lrange(JOB_QUEUE_KEY, 0, -1) == [job_id.encode()]
+    assert await fake_redis.llen(JOB_PROCESSING_KEY) == 0
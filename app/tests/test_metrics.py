@@ -0,0 +1,104 @@
+import io
+
+import openai
+import pytest
+import pytest_asyncio
+from aiohttp.test_utils import TestServer
+from httpx import AsyncClient
+from prometheus_client import REGISTRY
+from unittest.mock import patch
+
+from app.main import app
+from app.services.openai_service import SUMMARY_MODEL
+from app.utils import metrics
+from app.utils.fake_llm_server import create_app
+
+REPLY = "Summary for the metrics test."
+TEXTRACT_RESPONSE = {"Blocks": [{"BlockType": "LINE", "Text": "Metrics line"}]}
+
+
+@pytest_asyncio.fixture
+async def fake_llm(monkeypatch):
+    server = TestServer(create_app(reply=REPLY))
+    await server.start_server()
+    monkeypatch.setattr(openai, "api_base", str(server.make_url("/v1")))
+    monkeypatch.setattr(openai, "api_key", "test-key")
+    yield server
+    await server.close()
+
+
+@pytest.fixture(autouse=True)
+def textract_only(monkeypatch):
+    monkeypatch.setattr("app.services.extraction_service.LOCAL_PDF_EXTRACTION", False)
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+async def upload(ac: AsyncClient, content: bytes):
+    return await ac.post(
+        "/documents/upload",
+        files={"file": ("doc.pdf", io.BytesIO(content), "application/pdf")},
+        params={"summary_length": "short"},
+    )
+
+
+@pytest.mark.asyncio
+async def test_upload_records_every_pipeline_stage(fake_llm, fake_redis, s3_bucket, no_rate_limit):
+    stages = ["ingest", "cache_lookup", "extract", "textract", "s3_upload", "summarize", "llm"]
+    before = {name: sample("pipeline_stage_seconds_count", stage=name) for name in stages}
+    misses = sample("cache_lookups_total", cache="summary", result="miss")
+    hits = sample("cache_lookups_total", cache="summary", result="hit")
+    completion = sample("llm_tokens_total", model=SUMMARY_MODEL, direction="completion")
+    sizes = sample("document_size_bytes_count", ext=".pdf")
+
+    with patch("app.services.textract_service.textract.analyze_document", return_value=TEXTRACT_RESPONSE):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            assert (await upload(ac, b"metrics upload")).status_code == 200
+            assert (await upload(ac, b"metrics upload")).status_code == 200
+
+    for name in stages:
+        assert sample("pipeline_stage_seconds_count", stage=name) > before[name], name
+    assert sample("cache_lookups_total", cache="summary", result="miss") == misses + 1
+    assert sample("cache_lookups_total", cache="summary", result="hit") == hits + 1
+    assert sample("llm_tokens_total", model=SUMMARY_MODEL, direction="completion") == completion + len(REPLY.split(" "))
+    assert sample("document_size_bytes_count", ext=".pdf") == sizes + 2
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_serves_prometheus_text(fake_redis):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        await ac.get("/documents/jobs/some-job-id")
+        resp = await ac.get("/metrics")
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    body = resp.text
+    assert "pipeline_stage_seconds_bucket" in body
+    assert 'cache_tier_events_total{event="hits",tier="local"}' in body
+    assert 'executor_tasks_total{event="submitted",pool="cpu"}' in body
+    # Routes are labelled by their template, not by the requested path.
+    assert 'route="/documents/jobs/{job_id}"' in body
+    assert "some-job-id" not in body
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_is_hidden_when_disabled(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        resp = await ac.get("/metrics")
+
+    assert resp.status_code == 404
+
+
+def test_timed_is_a_shared_no_op_when_disabled(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    before = sample("pipeline_stage_seconds_count", stage="disabled")
+
+    assert metrics.timed("disabled") is metrics.timed("other")
+    with metrics.timed("disabled"):
+        pass
+
+    assert sample("pipeline_stage_seconds_count", stage="disabled") == before
@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import io
+from datetime import timedelta
+
+import pytest
+from httpx import AsyncClient
+from redis.exceptions import ConnectionError
+from unittest.mock import AsyncMock, patch
+
+from app.common import SummaryLength
+from app.main import app
+from app.services.cache_service import cache_result
+from app.services.user_documents import create_access_token
+from app.utils.limiter import SlidingWindowLimiter, limiter, parse_rate, token_budget
+
+
+def bad_upload():
+    # Rejected by the endpoint (400) after the limiter has counted it.
+    return {"file": ("notes.txt", io.BytesIO(b"x"), "text/plain")}
+
+
+def bearer(username):
+    token = create_access_token({"sub": username}, expires_delta=timedelta(minutes=5))
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_parse_rate():
+    assert parse_rate("5/minute") == (5, 60_000)
+    assert parse_rate("1000 / 2 hours") == (1000, 7_200_000)
+    with pytest.raises(ValueError):
+        parse_rate("5 per minute")
+
+
+@pytest.mark.asyncio
+async def test_sixth_upload_in_a_minute_is_refused(fake_redis):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        statuses = [(await ac.post("/documents/upload", files=bad_upload())).status_code for _ in range(5)]
+        refused = await ac.post("/documents/upload", files=bad_upload())
+
+    assert statuses == [400] * 5
+    assert refused.status_code == 429
+    # The counter treats a full window's requests as spread evenly over it,
+    # so the wait runs past the window's end until enough has slid out.
+    assert 1 <= int(refused.headers["retry-after"]) <= 120
+    assert refused.headers["x-ratelimit-limit"] == "5"
+
+
+@pytest.mark.asyncio
+async def test_signed_in_users_are_limited_separately_from_their_ip(fake_redis, dynamodb_tables):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        for _ in range(5):
+            await ac.post("/documents/upload", files=bad_upload(), headers=bearer("lena"))
+        lena = await ac.post("/documents/upload", files=bad_upload(), headers=bearer("lena"))
+        mark = await ac.post("/documents/upload", files=bad_upload(), headers=bearer("mark"))
+        guest = await ac.post("/documents/upload", files=bad_upload())
+
+    assert lena.status_code == 429
+    assert mark.status_code == guest.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_forwarded_client_address_is_taken_from_the_trusted_proxy(fake_redis):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        # The leftmost entries are whatever the client sent, so rotating them
+        # does not get around the limit.
+        for i in range(5):
+            await ac.post("/documents/upload", files=bad_upload(), headers={"X-Forwarded-For": f"10.0.0.{i}, 203.0.113.7"})
+        spoofed = await ac.post("/documents/upload", files=bad_upload(), headers={"X-Forwarded-For": "10.9.9.9, 203.0.113.7"})
+        other_client = await ac.post("/documents/upload", files=bad_upload(), headers={"X-Forwarded-For": "203.0.113.8"})
+
+    assert spoofed.status_code == 429
+    assert other_client.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_counts_are_shared_between_processes(fake_redis):
+    # Two limiter instances stand in for two workers sharing one Redis.
+    first, second = SlidingWindowLimiter("ratelimit"), SlidingWindowLimiter("ratelimit")
+    assert await first.hit("scope", "ip:1", "3/minute") is None
+    assert await second.hit("scope", "ip:1", "3/minute") is None
+    assert await first.hit("scope", "ip:1", "3/minute") is None
+    assert await second.hit("scope", "ip:1", "3/minute") is not None
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_when_the_window_has_slid_far_enough(fake_redis):
+    assert await limiter.hit("scope", "ip:2", "2/second") is None
+    assert await limiter.hit("scope", "ip:2", "2/second") is None
+    exceeded = await limiter.hit("scope", "ip:2", "2/second")
+    retry_ms = int(exceeded.headers["Retry-After"]) * 1000
+
+    await asyncio.sleep(retry_ms / 1000 + 0.05)
+    assert await limiter.hit("scope", "ip:2", "2/second") is None
+
+
+@pytest.mark.asyncio
+async def test_requests_are_allowed_when_redis_is_down(fake_redis):
+    with (
+        patch.object(fake_redis, "evalsha", side_effect=ConnectionError("down")),
+        patch.object(fake_redis, "eval", side_effect=ConnectionError("down")),
+    ):
+        assert await limiter.hit("scope", "ip:3", "1/minute") is None
+        assert await limiter.hit("scope", "ip:3", "1/minute") is None
+
+
+@pytest.mark.asyncio
+async def test_llm_token_budget_refuses_uploads_once_spent(fake_redis, monkeypatch):
+    monkeypatch.setattr(token_budget, "rate", "100/hour")
+    result = {"filename": "a.pdf", "extracted_text": "word " * 150, "summary": "short", "s3_url": "s3://b/a.pdf"}
+
+    with patch(
+        "app.api.documents.process_document_once", new_callable=AsyncMock, return_value=(result, False)
+    ) as process:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            first = await ac.post("/documents/upload", files={"file": ("a.pdf", io.BytesIO(b"one"), "application/pdf")})
+            second = await ac.post("/documents/upload", files={"file": ("b.pdf", io.BytesIO(b"two"), "application/pdf")})
+            await cache_result(hashlib.sha256(b"three").hexdigest(), SummaryLength.medium, result)
+            cached = await ac.post("/documents/upload", files={"file": ("c.pdf", io.BytesIO(b"three"), "application/pdf")})
+
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert second.json()["detail"] == "LLM token budget exhausted"
+    assert cached.status_code == 200
+    assert process.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_reused_summaries_are_not_charged(fake_redis, monkeypatch):
+    monkeypatch.setattr(token_budget, "rate", "100/hour")
+    result = {"filename": "a.pdf", "extracted_text": "word " * 150, "summary": "short", "s3_url": "s3://b/a.pdf"}
+
+    with patch(
+        "app.api.documents.process_document_once", new_callable=AsyncMock, return_value=(result, True)
+    ) as process:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            for content in (b"one", b"two"):
+                response = await ac.post(
+                    "/documents/upload", files={"file": ("a.pdf", io.BytesIO(content), "application/pdf")}
+                )
+                assert response.status_code == 200
+                assert response.json() == result
+
+    assert process.call_count == 2
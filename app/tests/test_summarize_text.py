@@ -11,3 +11,151 @@ async def test_summarize_text_calls_openai_correctly():
     with patch("openai.ChatCompletion.acreate", return_value=fake_response):
         result = await summarize_text("some text", SummaryLength.SHORT)
         assert result == "Summary!"
+
+
+def fake_completion(content):
+    message = type("msg", (object,), {"content": content})
+    return type("obj", (object,), {"choices": [type("choice", (object,), {"message": message})]})
+
+
+def long_document(sections=8, lines_per_section=20):
+    return "\n".join(
+        f"Section {s} line {l} with some words about the topic" for s in range(sections) for l in range(lines_per_section)
+    )
+
+
+def test_chunk_text_respects_token_budget():
+    from app.utils.tokens import chunk_text, count_tokens
+
+    chunks = chunk_text(long_document(), 200)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 200 for chunk in chunks)
+    assert "\n".join(chunks) == long_document()
+
+
+@pytest.mark.asyncio
+async def test_long_text_is_summarized_map_reduce(monkeypatch, fake_redis):
+    import asyncio
+    from app.services import openai_service
+    from app.utils.tokens import chunk_text
+
+    monkeypatch.setattr(openai_service, "SUMMARY_CHUNK_TOKENS", 200)
+    monkeypatch.setattr(openai_service, "SUMMARY_CHUNK_CONCURRENCY", 2)
+    calls = []
+    in_flight = 0
+    max_in_flight = 0
+
+    async def acreate(**kwargs):
+        nonlocal in_flight, max_in_flight
+        calls.append(kwargs["messages"][0]["content"])
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return fake_completion(f"summary {len(calls)}")
+
+    text = long_document()
+    expected_chunks = len(chunk_text(text, 200))
+
+    with patch("openai.ChatCompletion.acreate", side_effect=acreate):
+        result = await summarize_text(text, SummaryLength.short)
+
+    assert result.startswith("summary")
+    assert len(calls) == expected_chunks + 1
+    assert "summaries of consecutive sections" in calls[-1]
+    assert max_in_flight == 2
+
+    calls.clear()
+    with patch("openai.ChatCompletion.acreate", side_effect=acreate):
+        await summarize_text(text, SummaryLength.long)
+
+    # chunk summaries are cached by content, only the reduce pass runs again
+    assert len(calls) == 1
+
+
+def scanned_pages(pages=5):
+    return "\n\n\n".join(
+        "ACME Corporation - Quarterly Report\n"
+        f"The revenue of region {p} grew steadily this quar-\nter, driven by new\ncustomers   and renewals.\n"
+        f"Page {p + 1} of {pages}"
+        for p in range(pages)
+    )
+
+
+def test_compaction_drops_page_furniture_and_line_breaks():
+    from app.utils.text_compaction import compact_text
+
+    compacted = compact_text(scanned_pages())
+
+    assert compacted.count("ACME Corporation - Quarterly Report") == 1
+    assert "Page " not in compacted
+    assert "The revenue of region 3 grew steadily this quarter, driven by new customers and renewals." in compacted
+    assert "\n\n\n" not in compacted
+
+
+def test_compaction_keeps_short_repeated_lines():
+    from app.utils.text_compaction import compact_text
+
+    table = "\n".join(f"Item {i}\nYes\n0.00" for i in range(5))
+    assert compact_text(table) == table
+
+
+def test_budget_keeps_start_and_end():
+    from app.utils.text_compaction import TRUNCATION_MARKER, compact_for_prompt
+    from app.utils.tokens import count_tokens
+
+    text = long_document(sections=20)
+    compacted = compact_for_prompt(text, 300)
+
+    assert compacted["tokens_after"] <= 300 < compacted["tokens_before"]
+    assert compacted["tokens_after"] == count_tokens(compacted["text"])
+    lines = compacted["text"].split("\n")
+    assert lines[0] == text.split("\n")[0]
+    assert lines[-1] == text.split("\n")[-1]
+    assert TRUNCATION_MARKER in lines
+
+
+def test_budget_cuts_inside_a_single_long_line():
+    from app.utils.text_compaction import TRUNCATION_MARKER, compact_for_prompt
+
+    text = " ".join(f"word{i}" for i in range(2000))
+    compacted = compact_for_prompt(text, 300)
+
+    assert compacted["tokens_after"] <= 300 < compacted["tokens_before"]
+    head, marker, tail = compacted["text"].split("\n")
+    assert marker == TRUNCATION_MARKER
+    assert head and text.startswith(head)
+    assert tail and text.endswith(tail)
+
+
+@pytest.mark.asyncio
+async def test_prompt_is_compacted_to_the_length_budget(monkeypatch):
+    from prometheus_client import REGISTRY
+    from app.services import openai_service
+    from app.utils.text_compaction import TRUNCATION_MARKER
+
+    def compacted_tokens(reason):
+        return REGISTRY.get_sample_value("prompt_compaction_tokens_total", {"reason": reason}) or 0
+
+    before = {reason: compacted_tokens(reason) for reason in ("compaction", "budget")}
+    monkeypatch.setitem(openai_service.INPUT_TOKEN_BUDGET, "short", 100)
+    with patch("openai.ChatCompletion.acreate", new=AsyncMock(return_value=fake_completion("ok"))) as acreate:
+        await summarize_text(scanned_pages(20), SummaryLength.short)
+
+    prompt = acreate.await_args.kwargs["messages"][0]["content"]
+    assert "Page 2 of 20" not in prompt
+    assert prompt.count("ACME Corporation") == 1
+    assert TRUNCATION_MARKER in prompt
+    assert compacted_tokens("compaction") > before["compaction"]
+    assert compacted_tokens("budget") > before["budget"]
+
+
+def test_charge_is_capped_at_the_input_token_budget():
+    from app.services.openai_service import INPUT_TOKEN_BUDGET, estimate_summary_tokens
+    from app.utils.tokens import count_tokens
+
+    text = "word " * 1_000_000
+    charged = estimate_summary_tokens(text, "summary", SummaryLength.short)
+
+    assert charged < count_tokens(text)
+    assert INPUT_TOKEN_BUDGET["short"] <= charged < 2 * INPUT_TOKEN_BUDGET["short"]
@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import io
+import json
+
+import pytest
+from httpx import AsyncClient
+from unittest.mock import AsyncMock, patch
+
+from app.common import SummaryLength
+from app.main import app
+from app.services import batch_service
+from app.services.cache_service import cache_result, local_cache
+
+
+@pytest.fixture(autouse=True)
+def textract_path(monkeypatch):
+    monkeypatch.setattr("app.services.extraction_service.LOCAL_PDF_EXTRACTION", False)
+
+
+def extract(file_bytes, file_ext):
+    if file_bytes == b"broken":
+        raise RuntimeError("unreadable document")
+    return f"text of {file_bytes.decode()}"
+
+
+def pdf(name, content):
+    return ("files", (name, io.BytesIO(content), "application/pdf"))
+
+
+def parse_events(body: str) -> list:
+    return [json.loads(line) for line in body.splitlines() if line]
+
+
+async def post_batch(files, summarize):
+    with (
+        patch("app.services.textract_service.extract_text_from_bytes", side_effect=extract),
+        patch("app.services.document_pipeline.summarize_text", summarize),
+    ):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            resp = await ac.post("/documents/upload/batch", files=files, params={"summary_length": "short"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    return parse_events(resp.text)
+
+
+def by_index(events, event_type):
+    return {e["index"]: e for e in events if e["type"] == event_type}
+
+
+@pytest.mark.asyncio
+async def test_batch_processes_each_distinct_document_once(fake_redis, s3_bucket, no_rate_limit):
+    summarize = AsyncMock(return_value="summary")
+    events = await post_batch(
+        [pdf("a.pdf", b"alpha"), pdf("b.pdf", b"beta"), pdf("a-copy.pdf", b"alpha"), ("files", ("notes.txt", b"x"))],
+        summarize,
+    )
+
+    assert events[0] == {"type": "batch", "files": 4, "unique": 2, "cached": 0, "rejected": 1}
+    results = by_index(events, "result")
+    assert sorted(results) == [0, 1, 2]
+    assert results[0]["result"]["extracted_text"] == "text of alpha"
+    assert results[2]["result"]["extracted_text"] == "text of alpha"
+    assert results[2]["result"]["filename"] == "a-copy.pdf"
+    assert [results[i]["duplicate"] for i in (0, 1, 2)] == [False, False, True]
+    assert by_index(events, "error")[3]["filename"] == "notes.txt"
+    assert events[-1] == {"type": "done", "succeeded": 3, "failed": 1}
+    assert summarize.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_cached_documents_come_from_one_mget(fake_redis, s3_bucket, no_rate_limit):
+    cached = {"filename": "old.pdf", "extracted_text": "cached text", "summary": "cached", "s3_url": "s3://b/k"}
+    for content in (b"one", b"two"):
+        await cache_result(hashlib.sha256(content).hexdigest(), SummaryLength.short, cached)
+    local_cache.clear()
+    summarize = AsyncMock(return_value="fresh")
+    with patch.object(fake_redis, "mget", wraps=fake_redis.mget) as mget:
+        events = await post_batch([pdf("1.pdf", b"one"), pdf("2.pdf", b"two"), pdf("3.pdf", b"three")], summarize)
+
+    assert events[0]["cached"] == 2
+    results = by_index(events, "result")
+    assert results[0]["cached"] and results[1]["cached"]
+    assert results[0]["result"]["summary"] == "cached"
+    assert results[2]["result"]["summary"] == "fresh"
+    # One MGET for the whole batch, one more from the single-flight check of the miss.
+    assert len(mget.call_args_list[0].args[0]) == 3
+    assert summarize.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_one_bad_file_does_not_fail_the_batch(fake_redis, s3_bucket, no_rate_limit):
+    events = await post_batch(
+        [pdf("good.pdf", b"good"), pdf("bad.pdf", b"broken")], AsyncMock(return_value="summary")
+    )
+
+    assert by_index(events, "result")[0]["result"]["summary"] == "summary"
+    assert "unreadable document" in by_index(events, "error")[1]["detail"]
+    stages = [e["stage"] for e in events if e["type"] == "stage" and e["index"] == 0]
+    assert stages == ["queued", "extracting", "summarizing"]
+    assert events[-1] == {"type": "done", "succeeded": 1, "failed": 1}
+
+
+@pytest.mark.asyncio
+async def test_batch_parallelism_is_bounded(fake_redis, s3_bucket, no_rate_limit, monkeypatch):
+    monkeypatch.setattr(batch_service, "BATCH_CONCURRENCY", 2)
+    running = 0
+    peak = 0
+
+    async def summarize(text, summary_length):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+        return "summary"
+
+    events = await post_batch([pdf(f"{i}.pdf", f"doc {i}".encode()) for i in range(6)], summarize)
+
+    assert events[-1] == {"type": "done", "succeeded": 6, "failed": 0}
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_rejects_too_many_files(fake_redis, no_rate_limit, monkeypatch):
+    monkeypatch.setattr("app.api.documents.BATCH_MAX_FILES", 2)
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        resp = await ac.post(
+            "/documents/upload/batch", files=[pdf(f"{i}.pdf", f"doc {i}".encode()) for i in range(3)]
+        )
+
+    assert resp.status_code == 400
@@ -0,0 +1,93 @@
+import asyncio
+import io
+import time
+
+import pytest
+from httpx import AsyncClient
+from unittest.mock import AsyncMock, patch
+
+from app.main import app
+
+STAGE_LATENCY = 0.3
+
+
+def slow_extract(file_bytes, file_ext):
+    time.sleep(STAGE_LATENCY)
+    return "extracted"
+
+
+def slow_upload(ingested):
+    time.sleep(STAGE_LATENCY)
+    return f"s3://bucket/{ingested.filename}"
+
+
+@pytest.fixture(autouse=True)
+def textract_path(monkeypatch):
+    # These tests time the Textract and S3 stages; keep the local PDF parser
+    # (and the process pool start-up on its first use) out of the way.
+    monkeypatch.setattr("app.services.extraction_service.LOCAL_PDF_EXTRACTION", False)
+
+
+@pytest.mark.asyncio
+async def test_upload_runs_extraction_and_s3_concurrently(fake_redis, no_rate_limit):
+    with (
+        patch("app.services.textract_service.extract_text_from_bytes", side_effect=slow_extract),
+        patch("app.services.s3_service.upload_ingested_to_s3", side_effect=slow_upload),
+        patch("app.services.document_pipeline.summarize_text", new_callable=AsyncMock, return_value="summary"),
+    ):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            start = time.perf_counter()
+            resp = await ac.post(
+                "/documents/upload",
+                files={"file": ("doc.pdf", io.BytesIO(b"concurrent"), "application/pdf")},
+            )
+            elapsed = time.perf_counter() - start
+
+    assert resp.status_code == 200
+    assert resp.json()["s3_url"] == "s3://bucket/doc.pdf"
+    assert elapsed < 2 * STAGE_LATENCY
+
+
+@pytest.mark.asyncio
+async def test_health_stays_responsive_during_upload(fake_redis, no_rate_limit):
+    with (
+        patch("app.services.textract_service.extract_text_from_bytes", side_effect=slow_extract),
+        patch("app.services.s3_service.upload_ingested_to_s3", side_effect=slow_upload),
+        patch("app.services.document_pipeline.summarize_text", new_callable=AsyncMock, return_value="summary"),
+    ):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            upload = asyncio.create_task(ac.post(
+                "/documents/upload",
+                files={"file": ("doc.pdf", io.BytesIO(b"health"), "application/pdf")},
+            ))
+            await asyncio.sleep(0.05)
+            start = time.perf_counter()
+            health = await ac.get("/health")
+            health_latency = time.perf_counter() - start
+            await upload
+
+    assert health.status_code == 200
+    assert health_latency < STAGE_LATENCY / 2
+
+
+@pytest.mark.asyncio
+async def test_simultaneous_identical_uploads_run_the_pipeline_once(fake_redis, no_rate_limit):
+    summarize = AsyncMock(return_value="summary")
+    with (
+        patch("app.services.textract_service.extract_text_from_bytes", side_effect=slow_extract) as extract,
+        patch("app.services.s3_service.upload_ingested_to_s3", side_effect=slow_upload),
+        patch("app.services.document_pipeline.summarize_text", summarize),
+    ):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            responses = await asyncio.gather(*(
+                ac.post(
+                    "/documents/upload",
+                    files={"file": ("doc.pdf", io.BytesIO(b"popular document"), "application/pdf")},
+                )
+                for _ in range(8)
+            ))
+
+    assert [r.status_code for r in responses] == [200] * 8
+    assert all(r.json()["summary"] == "summary" for r in responses)
+    assert extract.call_count == 1
+    assert summarize.await_count == 1
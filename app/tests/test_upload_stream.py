@@ -0,0 +1,92 @@
+import hashlib
+import io
+import json
+
+import openai
+import pytest
+import pytest_asyncio
+from aiohttp.test_utils import TestServer
+from httpx import AsyncClient
+from unittest.mock import patch
+
+from app.common import SummaryLength
+from app.main import app
+from app.services.cache_service import get_cached_result, local_cache
+from app.utils.fake_llm_server import create_app
+
+REPLY = "Streamed summary of the document."
+TEXTRACT_RESPONSE = {"Blocks": [{"BlockType": "LINE", "Text": "Streamed line"}]}
+
+
+@pytest_asyncio.fixture
+async def fake_llm(monkeypatch):
+    server = TestServer(create_app(reply=REPLY, token_interval=0.01))
+    await server.start_server()
+    monkeypatch.setattr(openai, "api_base", str(server.make_url("/v1")))
+    monkeypatch.setattr(openai, "api_key", "test-key")
+    yield server
+    await server.close()
+
+
+def parse_events(body: str) -> list:
+    return [json.loads(line) for line in body.splitlines() if line]
+
+
+@pytest.mark.asyncio
+async def test_upload_stream_emits_metadata_then_tokens(fake_llm, fake_redis, s3_bucket, no_rate_limit):
+    with patch("app.services.textract_service.textract.analyze_document", return_value=TEXTRACT_RESPONSE):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            resp = await ac.post(
+                "/documents/upload/stream",
+                files={"file": ("doc.pdf", io.BytesIO(b"stream me"), "application/pdf")},
+                params={"summary_length": "short"},
+            )
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    events = parse_events(resp.text)
+
+    assert events[0]["type"] == "metadata"
+    assert events[0]["extracted_text"] == "Streamed line"
+    tokens = [e["content"] for e in events if e["type"] == "token"]
+    assert len(tokens) == len(REPLY.split(" "))
+    assert "".join(tokens) == REPLY
+    assert events[-1] == {"type": "done", "summary": REPLY}
+
+    content_hash = hashlib.sha256(b"stream me").hexdigest()
+    local_cache.clear()
+    cached = await get_cached_result(content_hash, SummaryLength.short)
+    assert cached["summary"] == REPLY
+    assert fake_llm.app["requests"][0]["stream"] is True
+
+
+@pytest.mark.asyncio
+async def test_upload_stream_serves_legacy_cached_summary(fake_llm, fake_redis, no_rate_limit):
+    cached = {"filename": "doc.pdf", "extracted_text": "x", "summary": "Cached", "s3_url": "s3://b/k"}
+    doc_hash = hashlib.sha256(b"cached" + b"medium").hexdigest()
+    await fake_redis.set(f"summary:{doc_hash}", json.dumps(cached))
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        resp = await ac.post(
+            "/documents/upload/stream",
+            files={"file": ("doc.pdf", io.BytesIO(b"cached"), "application/pdf")},
+        )
+
+    events = parse_events(resp.text)
+    assert events[0]["type"] == "metadata"
+    assert events[-1] == {"type": "done", "summary": "Cached", "cached": True}
+    assert fake_llm.app["requests"] == []
+
+
+@pytest.mark.asyncio
+async def test_upload_stream_reports_errors_in_band(fake_llm, fake_redis, s3_bucket, no_rate_limit):
+    with patch("app.services.textract_service.textract.analyze_document", side_effect=Exception("Textract fail")):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            resp = await ac.post(
+                "/documents/upload/stream",
+                files={"file": ("doc.pdf", io.BytesIO(b"broken"), "application/pdf")},
+            )
+
+    events = parse_events(resp.text)
+    assert events[-1]["type"] == "error"
+    assert "Textract fail" in events[-1]["detail"]
@@ -0,0 +1,121 @@
+"""
+One place that builds the boto3 clients and resources, lazily and once per
+process. Building them at import cost about a quarter of a second and
+17MB per process, paid by every uvicorn worker, the job worker and every
+script or test that imported a service, whether it used AWS or not.
+
+All clients share one botocore Config. Its connection pool is sized for
+the AWS executor plus concurrent multipart parts; the botocore default of
+10 would make the 16 executor threads queue for connections.
+"""
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+from app.utils.executor import AWS_EXECUTOR_WORKERS
+
+AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", AWS_EXECUTOR_WORKERS * 2))
+# "standard" retries throttling and transient errors with backoff;
+# "adaptive" also rate-limits the client side once it is throttled.
+AWS_RETRY_MODE = os.getenv("AWS_RETRY_MODE", "standard")
+AWS_MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", 5))
+AWS_CONNECT_TIMEOUT = float(os.getenv("AWS_CONNECT_TIMEOUT", 5))
+AWS_READ_TIMEOUT = float(os.getenv("AWS_READ_TIMEOUT", 60))
+
+botocore_config = Config(
+    region_name=AWS_REGION,
+    max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+    retries={"mode": AWS_RETRY_MODE, "max_attempts": AWS_MAX_ATTEMPTS},
+    connect_timeout=AWS_CONNECT_TIMEOUT,
+    read_timeout=AWS_READ_TIMEOUT,
+)
+
+
+class AWSClients:
+    """
+    Clients and resources by service name, created on first use. boto3
+    sessions are not thread-safe, and first uses come from executor threads,
+    so creation is serialized; created clients are thread-safe.
+    """
+
+    def __init__(self, config: Config = botocore_config):
+        self.config = config
+        self._lock = threading.Lock()
+        self._session = None
+        self._clients = {}
+        self._resources = {}
+        self._tables = {}
+
+    def _get_session(self) -> boto3.session.Session:
+        if self._session is None:
+            self._session = boto3.session.Session()
+        return self._session
+
+    def client(self, service: str):
+        client = self._clients.get(service)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(service)
+                if client is None:
+                    client = self._get_session().client(service, config=self.config)
+                    self._clients[service] = client
+        return client
+
+    def resource(self, service: str):
+        resource = self._resources.get(service)
+        if resource is None:
+            with self._lock:
+                resource = self._resources.get(service)
+                if resource is None:
+                    resource = self._get_session().resource(service, config=self.config)
+                    self._resources[service] = resource
+        return resource
+
+    def table(self, name: str):
+        """A DynamoDB Table of the shared dynamodb resource."""
+        table = self._tables.get(name)
+        if table is None:
+            table = self._tables.setdefault(name, self.resource("dynamodb").Table(name))
+        return table
+
+    def warm(self, clients=(), resources=()) -> None:
+        """Create clients ahead of the first request that needs them."""
+        for service in clients:
+            self.client(service)
+        for service in resources:
+            self.resource(service)
+
+    def close(self) -> None:
+        """Close the connection pools; later uses create new clients."""
+        with self._lock:
+            clients = list(self._clients.values())
+            clients += [resource.meta.client for resource in self._resources.values()]
+            self._clients.clear()
+            self._resources.clear()
+            self._tables.clear()
+        for client in clients:
+            client.close()
+
+
+aws_clients = AWSClients()
+
+
+def lazy_module_attributes(module_name: str, factories: dict):
+    """
+    A module __getattr__ serving module-level names such as s3_client from
+    the registry, so `s3_service.s3_client` keeps working without the client
+    being built at import. The name is only an alias: the services call
+    aws_clients directly, so replacing the module attribute with
+    patch("...s3_service.s3_client") has no effect on them. Patch methods of
+    the shared client instead, e.g. patch.object(s3_service.s3_client,
+    "upload_fileobj").
+    """
+    def __getattr__(name: str):
+        factory = factories.get(name)
+        if factory is None:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        return factory()
+    return __getattr__
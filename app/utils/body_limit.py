@@ -0,0 +1,50 @@
+from typing import Dict, Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+
+
+class MaxBodySizeMiddleware:
+    """
+    Rejects request bodies larger than max_body_size before they are parsed.
+    A declared Content-Length is checked up front; chunked bodies are counted
+    as they arrive and aborted as soon as they cross the limit. path_limits
+    overrides the limit for specific paths.
+    """
+
+    def __init__(self, app, max_body_size: int, path_limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_body_size = self.path_limits.get(scope["path"], self.max_body_size)
+        detail = f"Request body exceeds the maximum size of {max_body_size} bytes"
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and not content_length.isdigit():
+            response = JSONResponse({"detail": "Invalid Content-Length header"}, status_code=status.HTTP_400_BAD_REQUEST)
+            await response(scope, receive, send)
+            return
+        if content_length is not None and int(content_length) > max_body_size:
+            response = JSONResponse({"detail": detail}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_size:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
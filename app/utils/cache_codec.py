@@ -0,0 +1,111 @@
+"""
+Encoding for values stored in the Redis document cache.
+
+Encoded values start with a four byte header: MAGIC, a format version and a
+codec id. The payload itself is always the JSON document, so a decoded value
+can still be sent as a response body without parsing it. Values below
+CACHE_COMPRESSION_MIN_BYTES are stored uncompressed (codec "raw") because
+compression does not pay off for them.
+
+Values without the header are entries written before the codec existed and
+are returned unchanged.
+"""
+import os
+import zlib
+
+MAGIC = b"\xc7C"
+FORMAT_VERSION = 1
+
+CACHE_CODEC = os.getenv("CACHE_CODEC", "zstd")
+CACHE_COMPRESSION_MIN_BYTES = int(os.getenv("CACHE_COMPRESSION_MIN_BYTES", 1024))
+CACHE_COMPRESSION_LEVEL = int(os.getenv("CACHE_COMPRESSION_LEVEL", 3))
+
+
+class CacheCodecError(Exception):
+    pass
+
+
+class RawCodec:
+    id = 0
+    name = "raw"
+
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def decompress(self, data: bytes) -> bytes:
+        return data
+
+
+class ZlibCodec:
+    id = 1
+    name = "zlib"
+
+    def __init__(self, level: int = CACHE_COMPRESSION_LEVEL):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class ZstdCodec:
+    id = 2
+    name = "zstd"
+
+    def __init__(self, level: int = CACHE_COMPRESSION_LEVEL):
+        # optional dependency, only needed when CACHE_CODEC=zstd or when
+        # reading values written by a process configured that way
+        import zstandard
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressor.decompress(data)
+
+
+CODECS = {codec.name: codec for codec in (RawCodec, ZlibCodec, ZstdCodec)}
+CODECS_BY_ID = {codec.id: codec for codec in (RawCodec, ZlibCodec, ZstdCodec)}
+
+_instances = {}
+
+
+def get_codec(name_or_id):
+    codec_class = CODECS.get(name_or_id) or CODECS_BY_ID.get(name_or_id)
+    if codec_class is None:
+        raise CacheCodecError(f"Unknown cache codec: {name_or_id}")
+    if codec_class.name not in _instances:
+        _instances[codec_class.name] = codec_class()
+    return _instances[codec_class.name]
+
+
+def get_default_codec():
+    try:
+        return get_codec(CACHE_CODEC)
+    except ImportError:
+        print(f"Cache codec {CACHE_CODEC} is not installed, falling back to zlib")
+        return get_codec("zlib")
+
+
+def encode(payload: bytes, codec_name: str = None, min_bytes: int = CACHE_COMPRESSION_MIN_BYTES) -> bytes:
+    if len(payload) < min_bytes:
+        codec = get_codec("raw")
+    elif codec_name is None:
+        codec = get_default_codec()
+    else:
+        codec = get_codec(codec_name)
+    return MAGIC + bytes([FORMAT_VERSION, codec.id]) + codec.compress(payload)
+
+
+def decode(value: bytes) -> bytes:
+    if not value.startswith(MAGIC):
+        return value
+
+    version, codec_id = value[2], value[3]
+    if version != FORMAT_VERSION:
+        raise CacheCodecError(f"Unsupported cache format version: {version}")
+    return get_codec(codec_id).decompress(value[4:])
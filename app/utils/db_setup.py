@@ -1,19 +1,48 @@
-import boto3
+from app.utils.aws import aws_clients, lazy_module_attributes
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+__getattr__ = lazy_module_attributes(__name__, {"dynamodb": lambda: aws_clients.resource("dynamodb")})
 
 def create_users_table():
-    return dynamodb.create_table(
+    return aws_clients.resource('dynamodb').create_table(
         TableName='users',
         KeySchema=[{'AttributeName': 'uuid', 'KeyType': 'HASH'}],
-        AttributeDefinitions=[{'AttributeName': 'uuid', 'AttributeType': 'S'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'uuid', 'AttributeType': 'S'},
+            {'AttributeName': 'username', 'AttributeType': 'S'},
+        ],
+        # get_user resolves usernames through this index; it projects every
+        # attribute because logins need the password hash.
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'username-index',
+            'KeySchema': [{'AttributeName': 'username', 'KeyType': 'HASH'}],
+            'Projection': {'ProjectionType': 'ALL'},
+        }],
         BillingMode='PAY_PER_REQUEST'
     )
 
 def create_documents_table():
-    return dynamodb.create_table(
+    return aws_clients.resource('dynamodb').create_table(
         TableName='documents',
         KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
-        AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'id', 'AttributeType': 'S'},
+            {'AttributeName': 'user_uuid', 'AttributeType': 'S'},
+            {'AttributeName': 'date', 'AttributeType': 'S'},
+        ],
+        # History pages are read newest-first from this index. It projects
+        # the list-view fields only; summaries are read from the table by id.
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'user_uuid-date-index',
+            'KeySchema': [
+                {'AttributeName': 'user_uuid', 'KeyType': 'HASH'},
+                {'AttributeName': 'date', 'KeyType': 'RANGE'},
+            ],
+            'Projection': {
+                'ProjectionType': 'INCLUDE',
+                'NonKeyAttributes': [
+                    'summary_title', 'document_url', 'document_name', 'document_size', 'summary_length',
+                ],
+            },
+        }],
         BillingMode='PAY_PER_REQUEST'
     )
@@ -0,0 +1,61 @@
+"""
+CPU-bound document parsing. Everything here runs inside the process pool
+from app.utils.executor, so functions are module-level, take bytes or a file
+path and return plain picklable values. Keep imports light: each pool worker
+imports this module on start-up.
+"""
+import io
+import time
+from typing import List, Union
+
+DocumentSource = Union[bytes, str]
+
+
+def _open_source(source: DocumentSource):
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    return open(source, "rb")
+
+
+def extract_pdf_pages(source: DocumentSource) -> List[dict]:
+    """
+    Embedded text of every page of a PDF, with the time spent on each page:
+    [{"page": 1, "text": "...", "seconds": 0.003}, ...]. Raises whatever
+    pypdf raises for encrypted or unreadable files.
+    """
+    from pypdf import PdfReader
+
+    with _open_source(source) as f:
+        reader = PdfReader(f)
+        if reader.is_encrypted:
+            raise ValueError("Encrypted PDF")
+        pages = []
+        for number, page in enumerate(reader.pages, start=1):
+            started = time.perf_counter()
+            text = page.extract_text() or ""
+            pages.append({"page": number, "text": text, "seconds": time.perf_counter() - started})
+        return pages
+
+
+def split_pdf_pages(source: DocumentSource, page_numbers: List[int]) -> List[bytes]:
+    """One single-page PDF per requested (1-based) page, in the same order."""
+    from pypdf import PdfReader, PdfWriter
+
+    with _open_source(source) as f:
+        reader = PdfReader(f)
+        documents = []
+        for number in page_numbers:
+            writer = PdfWriter()
+            writer.add_page(reader.pages[number - 1])
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            documents.append(buffer.getvalue())
+        return documents
+
+
+def extract_docx_text(source: DocumentSource) -> str:
+    from docx import Document
+
+    with _open_source(source) as f:
+        doc = Document(f)
+        return "\n".join(p.text for p in doc.paragraphs)
@@ -0,0 +1,135 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Optional
+
+AWS_EXECUTOR_WORKERS = int(os.getenv("AWS_EXECUTOR_WORKERS", 16))
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", os.cpu_count() or 1))
+AUTH_EXECUTOR_WORKERS = int(os.getenv("AUTH_EXECUTOR_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+# Logins beyond this many queued hashes are refused instead of waiting
+# behind a burst they cannot get ahead of.
+AUTH_EXECUTOR_MAX_PENDING = int(os.getenv("AUTH_EXECUTOR_MAX_PENDING", 64))
+
+# boto3 is blocking; every AWS call made from a coroutine goes through this
+# bounded pool so a slow Textract/S3/DynamoDB call never stalls the event loop.
+aws_executor = ThreadPoolExecutor(max_workers=AWS_EXECUTOR_WORKERS, thread_name_prefix="aws")
+
+
+class ExecutorBusyError(Exception):
+    """More work is already queued on a process pool than it accepts."""
+
+
+def _timed_call(func, submitted_at, *args):
+    # Runs in the worker: wall-clock time is comparable across processes on
+    # one host, monotonic time is not.
+    started_at = time.time()
+    return func(*args), started_at - submitted_at, time.time() - started_at
+
+
+class ProcessPool:
+    """
+    A lazily created process pool for CPU-bound work that holds the GIL.
+    Created on first use, so processes that never need it never pay for it,
+    and uses spawn: forking a process that already runs the event loop and
+    the AWS threads can deadlock on locks held by those threads.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: Optional[int] = None):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "queue_seconds": 0.0,
+            "max_queue_seconds": 0.0,
+            "run_seconds": 0.0,
+        }
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def get(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def run(self, func, *args):
+        """func and its arguments are pickled, so func must be module-level."""
+        if self.max_pending is not None and self.pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise ExecutorBusyError(f"{self.name} pool has {self.pending} tasks pending")
+
+        loop = asyncio.get_running_loop()
+        executor = self.get()
+        self.pending += 1
+        self.stats["submitted"] += 1
+        try:
+            result, queued, ran = await loop.run_in_executor(executor, _timed_call, func, time.time(), *args)
+        except BrokenProcessPool:
+            # A worker died (OOM, segfault in a parser). Drop the pool so the
+            # next call starts a fresh one instead of failing forever.
+            self.stats["failed"] += 1
+            if self._executor is executor:
+                self._executor = None
+            raise
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            self.pending -= 1
+
+        self.stats["completed"] += 1
+        self.stats["queue_seconds"] += queued
+        self.stats["max_queue_seconds"] = max(self.stats["max_queue_seconds"], queued)
+        self.stats["run_seconds"] += ran
+        return result
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "workers": self.max_workers,
+            "pending": self.pending,
+            "queued": max(0, self.pending - self.max_workers),
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+cpu_pool = ProcessPool("cpu", CPU_EXECUTOR_WORKERS)
+# bcrypt gets its own pool: a login burst must not queue document parsing,
+# and uploads must not slow down logins.
+auth_pool = ProcessPool("auth", AUTH_EXECUTOR_WORKERS, max_pending=AUTH_EXECUTOR_MAX_PENDING)
+
+
+async def run_in_aws_executor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(aws_executor, partial(func, *args, **kwargs))
+
+
+async def run_in_cpu_executor(func, *args):
+    return await cpu_pool.run(func, *args)
+
+
+async def run_in_auth_executor(func, *args):
+    return await auth_pool.run(func, *args)
+
+
+def shutdown_process_pools() -> None:
+    for pool in (cpu_pool, auth_pool):
+        pool.shutdown()
+
+
+def get_executor_stats() -> dict:
+    return {pool.name: pool.get_stats() for pool in (cpu_pool, auth_pool)}
@@ -0,0 +1,84 @@
+"""
+OpenAI-compatible chat completions server for tests and load runs.
+
+Serves POST /v1/chat/completions, streaming (SSE) and non-streaming, with a
+canned reply and configurable latency. It backs the "stub" LLM provider:
+
+    python -m app.utils.fake_llm_server --port 8080 --first-token-latency 0.5
+    LLM_PROVIDER=stub LLM_STUB_URL=http://localhost:8080/v1 uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+DEFAULT_REPLY = "This is a summary produced by the fake LLM server."
+
+
+def create_app(reply: str = DEFAULT_REPLY, first_token_latency: float = 0.0, token_interval: float = 0.0) -> web.Application:
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        request.app["requests"].append(body)
+        completion_id = f"chatcmpl-fake-{len(request.app['requests'])}"
+        created = int(time.time())
+        model = body.get("model", "fake")
+        tokens = [token + " " for token in reply.split(" ")]
+        tokens[-1] = tokens[-1].rstrip()
+
+        await asyncio.sleep(first_token_latency)
+
+        if not body.get("stream"):
+            await asyncio.sleep(token_interval * len(tokens))
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        def chunk(delta, finish_reason=None):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(payload)}\n\n".encode()
+
+        await response.write(chunk({"role": "assistant"}))
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(token_interval)
+            await response.write(chunk({"content": token}))
+        await response.write(chunk({}, finish_reason="stop"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app["requests"] = []
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--reply", default=DEFAULT_REPLY)
+    parser.add_argument("--first-token-latency", type=float, default=0.0)
+    parser.add_argument("--token-interval", type=float, default=0.0)
+    args = parser.parse_args()
+    web.run_app(
+        create_app(args.reply, args.first_token_latency, args.token_interval),
+        host=args.host,
+        port=args.port,
+    )
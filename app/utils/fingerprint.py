@@ -0,0 +1,93 @@
+"""
+Text fingerprints for finding documents whose extracted text is the same or
+nearly the same: a hash of the normalized text for exact matches and a
+MinHash of its word shingles for near matches. Plain functions so they can
+run in the process pool for long texts.
+
+The MinHash is the one-permutation variant: every shingle is hashed once
+and the hash space is split into MINHASH_SIZE bins, each keeping its
+smallest value. The share of equal bins between two signatures estimates
+the Jaccard similarity of their shingle sets.
+"""
+import hashlib
+import re
+import struct
+import unicodedata
+from typing import List, NamedTuple, Tuple
+
+MINHASH_SIZE = 64
+SHINGLE_WORDS = 3
+EMPTY_BIN = (1 << 58) - 1
+
+WHITESPACE = re.compile(r"\s+")
+NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+SIGNATURE_FORMAT = f"<{MINHASH_SIZE}Q"
+
+
+class TextSignature(NamedTuple):
+    text_hash: str
+    minhash: Tuple[int, ...]
+    numbers: str
+    words: int
+
+
+def normalize_text(text: str) -> str:
+    """Case, whitespace and Unicode-form differences removed."""
+    return WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text).lower()).strip()
+
+
+def minhash(words: List[str], shingle_words: int = SHINGLE_WORDS) -> Tuple[int, ...]:
+    mins = [EMPTY_BIN] * MINHASH_SIZE
+    for i in range(max(1, len(words) - shingle_words + 1)):
+        shingle = " ".join(words[i:i + shingle_words]).encode()
+        value = int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), "little")
+        # Low 6 bits pick the bin, the rest is the value.
+        bin_, value = value & (MINHASH_SIZE - 1), value >> 6
+        if value < mins[bin_]:
+            mins[bin_] = value
+    return tuple(mins)
+
+
+def numbers_digest(normalized: str) -> str:
+    """The numbers of the text in order; documents that differ in them are never near duplicates."""
+    return hashlib.sha256("\x00".join(NUMBER.findall(normalized)).encode()).hexdigest()[:16]
+
+
+def text_signature(text: str) -> TextSignature:
+    normalized = normalize_text(text)
+    words = normalized.split(" ") if normalized else []
+    return TextSignature(
+        text_hash=hashlib.sha256(normalized.encode()).hexdigest(),
+        minhash=minhash(words) if words else (EMPTY_BIN,) * MINHASH_SIZE,
+        numbers=numbers_digest(normalized),
+        words=len(words),
+    )
+
+
+def similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two MinHashes."""
+    filled = [(x, y) for x, y in zip(a, b) if x != EMPTY_BIN or y != EMPTY_BIN]
+    if not filled:
+        return 1.0
+    return sum(x == y for x, y in filled) / len(filled)
+
+
+def lsh_bands(signature: Tuple[int, ...], bands: int) -> List[str]:
+    """
+    One digest per group of MINHASH_SIZE / bands bins. Two texts of
+    similarity s share at least one band with probability
+    1 - (1 - s ** rows) ** bands.
+    """
+    rows = MINHASH_SIZE // bands
+    return [
+        hashlib.blake2b(struct.pack(f"<{rows}Q", *signature[i:i + rows]), digest_size=8).hexdigest()
+        for i in range(0, rows * bands, rows)
+    ]
+
+
+def pack_minhash(signature: Tuple[int, ...]) -> bytes:
+    return struct.pack(SIGNATURE_FORMAT, *signature)
+
+
+def unpack_minhash(data: bytes) -> Tuple[int, ...]:
+    return struct.unpack(SIGNATURE_FORMAT, data)
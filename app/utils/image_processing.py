@@ -0,0 +1,55 @@
+"""
+Image clean-up before OCR, run in the process pool next to document_parsing.
+Phone photos arrive as 8-12MB colour JPEGs at 12MP and above; Textract
+reads text just as well from a grayscale image at a few megapixels.
+"""
+import io
+from typing import Union
+
+ImageSource = Union[bytes, str]
+
+ORIENTATION_TAG = 0x0112
+
+
+def prepare_image_for_ocr(source: ImageSource, max_side: int, jpeg_quality: int) -> dict:
+    """
+    EXIF-rotate, convert to grayscale, downscale so the longest side is at
+    most max_side and re-encode. Returns {"bytes", "width", "height",
+    "format"}; the original bytes come back unchanged when re-encoding would
+    not make them smaller and no rotation was needed.
+    """
+    from PIL import Image, ImageOps
+
+    if isinstance(source, bytes):
+        original = source
+    else:
+        with open(source, "rb") as f:
+            original = f.read()
+
+    with Image.open(io.BytesIO(original)) as image:
+        source_format = image.format
+        was_rotated = image.getexif().get(ORIENTATION_TAG, 1) != 1
+        # For JPEGs draft() has the decoder produce grayscale and skip detail
+        # we are about to throw away; it only scales by powers of two, so
+        # thumbnail() does the exact resize afterwards.
+        image.draft("L", (max_side, max_side))
+        gray = ImageOps.exif_transpose(image).convert("L")
+        if max(gray.size) > max_side:
+            gray.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        if source_format == "PNG":
+            # Screenshots and scans: keep them lossless, text edges matter.
+            gray.save(buffer, format="PNG", optimize=True)
+            out_format = "PNG"
+        else:
+            gray.save(buffer, format="JPEG", quality=jpeg_quality, optimize=True)
+            out_format = "JPEG"
+        processed = buffer.getvalue()
+
+    if len(processed) >= len(original) and not was_rotated:
+        with Image.open(io.BytesIO(original)) as image:
+            width, height = image.size
+        return {"bytes": original, "width": width, "height": height, "format": source_format}
+
+    return {"bytes": processed, "width": gray.width, "height": gray.height, "format": out_format}
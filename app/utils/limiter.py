@@ -1,4 +1,219 @@
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+"""
+Rate limiting shared by every worker and replica through Redis.
 
-limiter = Limiter(key_func=get_remote_address)
+Both the request limits and the LLM token budget use a sliding-window
+counter: a count for the current fixed window plus the previous window's
+count weighted by how much of it still overlaps the sliding window. Each
+check-and-increment is one Lua script, so concurrent requests can never
+both take the last slot, and the window clock is Redis' own TIME so
+replicas with skewed clocks agree.
+"""
+import os
+import re
+from functools import wraps
+from typing import Optional
+
+from fastapi import HTTPException, Request, status
+from jose import JWTError, jwt
+from redis.exceptions import RedisError
+
+from app.services.redis_service import redis_client
+
+# How many proxies (API Gateway, load balancer) append to X-Forwarded-For in
+# front of us. The client address is the entry that many places from the
+# right; anything further left was sent by the client and can be forged.
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", 1))
+# Estimated prompt + completion tokens a user (or guest IP) may spend.
+LLM_TOKEN_BUDGET = os.getenv("LLM_TOKEN_BUDGET", "200000/day")
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+RATE_PATTERN = re.compile(r"^\s*(\d+)\s*/\s*(\d+)?\s*(second|minute|hour|day)s?\s*$")
+
+# ARGV: window ms, limit, cost, mode. "hit" adds cost unless that would pass
+# the limit, "check" only reports whether cost would still fit, "charge"
+# always adds it. Returns {allowed, used after this call, retry after ms}.
+SLIDING_WINDOW_SCRIPT = """
+local now = redis.call("TIME")
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local mode = ARGV[4]
+
+local index = math.floor(now_ms / window)
+local state = redis.call("HMGET", KEYS[1], "index", "current", "previous")
+local stored = tonumber(state[1]) or index
+local current = tonumber(state[2]) or 0
+local previous = tonumber(state[3]) or 0
+if stored == index - 1 then
+    previous = current
+    current = 0
+elseif stored < index - 1 then
+    previous = 0
+    current = 0
+end
+
+local left_in_window = window - (now_ms - index * window)
+local used = previous * left_in_window / window + current
+if mode ~= "charge" and used + cost > limit then
+    -- Either enough of the previous window slides out before this one ends,
+    -- or the caller waits for the next window and for enough of this one
+    -- to slide out after that.
+    local retry_ms = left_in_window
+    if current + cost <= limit then
+        if previous > 0 then
+            retry_ms = math.ceil((used + cost - limit) * window / previous)
+        end
+    elseif current > 0 then
+        retry_ms = left_in_window + math.max(0, math.ceil((current + cost - limit) * window / current))
+    end
+    return {0, math.ceil(used), retry_ms}
+end
+if mode == "check" then
+    return {1, math.ceil(used), 0}
+end
+
+current = current + cost
+redis.call("HSET", KEYS[1], "index", index, "current", current, "previous", previous)
+redis.call("PEXPIRE", KEYS[1], window * 2)
+return {1, math.ceil(used + cost), 0}
+"""
+
+
+# EVALSHA after the first call instead of sending the script every time.
+sliding_window = redis_client.register_script(SLIDING_WINDOW_SCRIPT)
+
+
+class RateLimitExceeded(HTTPException):
+    def __init__(self, limit: int, retry_after_ms: int, detail: str = "Rate limit exceeded"):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={
+                "Retry-After": str(max(1, -(-retry_after_ms // 1000))),
+                "X-RateLimit-Limit": str(limit),
+                "X-RateLimit-Remaining": "0",
+            },
+        )
+
+
+def parse_rate(rate: str) -> tuple:
+    """'5/minute' or '1000/2 hours' -> (limit, window in ms)."""
+    match = RATE_PATTERN.match(rate)
+    if match is None:
+        raise ValueError(f"Invalid rate: {rate!r}")
+    limit, multiplier, period = match.groups()
+    return int(limit), int(multiplier or 1) * PERIODS[period] * 1000
+
+
+def client_ip(request: Request) -> str:
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded and RATE_LIMIT_TRUSTED_PROXIES > 0:
+        addresses = [address.strip() for address in forwarded.split(",") if address.strip()]
+        if addresses:
+            return addresses[max(0, len(addresses) - RATE_LIMIT_TRUSTED_PROXIES)]
+    return request.client.host if request.client else "unknown"
+
+
+def rate_limit_identity(request: Request) -> str:
+    """user:{jwt sub} for a valid bearer token, ip:{client address} otherwise."""
+    # Imported here: user_documents pulls in boto3 and the auth stack, which
+    # the limiter module itself does not need.
+    from app.services.user_documents import ALGORITHM, SECRET_KEY
+
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            subject = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+            if subject:
+                return f"user:{subject}"
+        except JWTError:
+            pass
+    return f"ip:{client_ip(request)}"
+
+
+class SlidingWindowLimiter:
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.enabled = True
+        self.stats = {"allowed": 0, "limited": 0, "errors": 0}
+
+    async def hit(
+        self, scope: str, identity: str, rate: str, cost: int = 1, mode: str = "hit"
+    ) -> Optional[RateLimitExceeded]:
+        """
+        Count cost against identity's rate for scope (see
+        SLIDING_WINDOW_SCRIPT for the modes). Returns the exception to raise
+        when over the limit. When Redis is unreachable requests are let
+        through rather than failing the API.
+        """
+        if not self.enabled:
+            return None
+        limit, window_ms = parse_rate(rate)
+        try:
+            allowed, _, retry_ms = await sliding_window(
+                keys=[f"{self.prefix}:{scope}:{identity}"], args=[window_ms, limit, cost, mode], client=redis_client
+            )
+        except RedisError as e:
+            self.stats["errors"] += 1
+            print(f"Rate limiter unavailable, allowing request: {e}")
+            return None
+        if allowed:
+            self.stats["allowed"] += 1
+            return None
+        self.stats["limited"] += 1
+        return RateLimitExceeded(limit, int(retry_ms))
+
+    def limit(self, rate: str):
+        """
+        Endpoint decorator, used like slowapi's: the endpoint must take a
+        `request: Request` argument.
+        """
+        parse_rate(rate)
+
+        def decorator(endpoint):
+            scope = f"{endpoint.__module__}.{endpoint.__name__}"
+
+            @wraps(endpoint)
+            async def wrapper(*args, **kwargs):
+                request = kwargs.get("request")
+                if request is None:
+                    request = next(arg for arg in args if isinstance(arg, Request))
+                exceeded = await self.hit(scope, rate_limit_identity(request), rate)
+                if exceeded:
+                    raise exceeded
+                return await endpoint(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+class TokenBudget:
+    """
+    Estimated LLM tokens per identity per period. The real size of a
+    document is only known once it has been extracted, so tokens are
+    charged after they are spent and a request is refused once the budget
+    is used up; the last request of a period may overshoot it.
+    """
+
+    scope = "llm_tokens"
+
+    def __init__(self, limiter: SlidingWindowLimiter, rate: str = LLM_TOKEN_BUDGET):
+        self.limiter = limiter
+        self.rate = rate
+
+    async def check(self, identity: str) -> None:
+        exceeded = await self.limiter.hit(self.scope, identity, self.rate, cost=1, mode="check")
+        if exceeded:
+            exceeded.detail = "LLM token budget exhausted"
+            raise exceeded
+
+    async def charge(self, identity: str, tokens: int) -> None:
+        if tokens > 0:
+            await self.limiter.hit(self.scope, identity, self.rate, cost=tokens, mode="charge")
+
+
+limiter = SlidingWindowLimiter("ratelimit")
+token_budget = TokenBudget(limiter)
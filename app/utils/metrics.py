@@ -0,0 +1,262 @@
+"""
+Prometheus metrics for the upload pipeline, served by app.api.metrics:
+
+  pipeline_stage_seconds{stage}          ingest (read + sha256), cache_lookup, extract,
+                                         local_parse, image_prepare, textract,
+                                         textract_async_job, s3_upload, s3_download,
+                                         summarize (whole map-reduce), llm (one call)
+  cache_lookups_total{cache, result}     summary/extraction cache hits and misses
+  document_size_bytes{ext}               size of ingested uploads
+  llm_tokens_total{model, direction}     prompt and completion tokens
+  http_requests_in_progress{method}      requests currently being served
+  http_request_duration_seconds{method, route, status}
+
+The counters the services already keep (local cache, executors, extraction
+routes, history writer, rate limiter) are exported as they are at scrape
+time, so they cost nothing on the request path.
+
+METRICS_ENABLED=false turns all of it off: stage() leaves functions
+unwrapped, timed() hands back a shared no-op context manager and the
+middleware is not installed. With OTEL_ENABLED=true (and opentelemetry
+installed) every stage is also recorded as a span.
+
+Run with PROMETHEUS_MULTIPROC_DIR set when serving with several worker
+processes so a scrape covers all of them; the in-process counters then
+describe only the worker that answered the scrape.
+"""
+import functools
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "false").lower() == "true"
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = tuple(2 ** power * 1024 for power in range(0, 16, 2))  # 1KiB .. 16MiB
+
+stage_seconds = Histogram(
+    "pipeline_stage_seconds", "Time spent in each upload pipeline stage", ["stage"], buckets=STAGE_BUCKETS
+)
+cache_lookups = Counter("cache_lookups_total", "Result cache lookups", ["cache", "result"])
+document_size = Histogram("document_size_bytes", "Size of ingested uploads", ["ext"], buckets=SIZE_BUCKETS)
+llm_tokens = Counter("llm_tokens_total", "LLM tokens sent and received", ["model", "direction"])
+prompt_compaction_tokens = Counter(
+    "prompt_compaction_tokens_total", "Document tokens removed before summarizing", ["reason"]
+)
+requests_in_progress = Gauge(
+    "http_requests_in_progress", "HTTP requests being served", ["method"], multiprocess_mode="livesum"
+)
+request_duration = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=STAGE_BUCKETS,
+)
+
+tracer = None
+if OTEL_ENABLED:
+    try:
+        from opentelemetry import trace
+
+        tracer = trace.get_tracer("fastapi-llm-agent")
+    except ImportError:
+        print("OTEL_ENABLED is set but opentelemetry is not installed; spans are disabled")
+
+_disabled = nullcontext()
+
+
+@contextmanager
+def _timed(name: str):
+    started = time.perf_counter()
+    try:
+        if tracer is not None:
+            with tracer.start_as_current_span(name):
+                yield
+        else:
+            yield
+    finally:
+        stage_seconds.labels(name).observe(time.perf_counter() - started)
+
+
+def timed(name: str):
+    """Context manager recording the enclosed block as pipeline stage name."""
+    if not METRICS_ENABLED:
+        return _disabled
+    return _timed(name)
+
+
+def stage(name: str):
+    """Decorator recording every call of an async function as pipeline stage name."""
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with _timed(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    if METRICS_ENABLED:
+        cache_lookups.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_document_size(ext: str, size: int) -> None:
+    if METRICS_ENABLED:
+        document_size.labels(ext or "none").observe(size)
+
+
+def record_llm_tokens(model: str, prompt_tokens: int, completion_tokens: int) -> None:
+    if METRICS_ENABLED:
+        llm_tokens.labels(model, "prompt").inc(prompt_tokens)
+        llm_tokens.labels(model, "completion").inc(completion_tokens)
+
+
+def record_prompt_compaction(compacted: int, truncated: int) -> None:
+    if METRICS_ENABLED:
+        prompt_compaction_tokens.labels("compaction").inc(compacted)
+        prompt_compaction_tokens.labels("budget").inc(truncated)
+
+
+class MetricsMiddleware:
+    """
+    In-flight gauge and latency histogram per route. The route label is the
+    matched path template (/documents/jobs/{job_id}), never the raw path, so
+    ids do not turn into label values; unmatched requests share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = requests_in_progress.labels(method)
+        in_progress.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_progress.dec()
+            # The router stores the matched route in the scope on the way in.
+            route = scope.get("route")
+            request_duration.labels(
+                method, getattr(route, "path", "unmatched"), str(status_code)
+            ).observe(time.perf_counter() - started)
+
+
+class ServiceStatsCollector:
+    """Exports the counters kept by the services themselves at scrape time."""
+
+    def describe(self):
+        # Registered at import time, before the services can be imported.
+        return []
+
+    def collect(self):
+        from app.services.cache_service import get_cache_stats
+        from app.services.document_writer import document_writer
+        from app.services.extraction_service import extraction_stats
+        from app.services.llm_client import get_llm_stats
+        from app.services.s3_service import s3_stats
+        from app.utils.executor import get_executor_stats
+        from app.utils.limiter import limiter
+
+        cache_stats = get_cache_stats()
+        cache_events = CounterMetricFamily("cache_tier_events", "Cache tier events", labels=["tier", "event"])
+        for tier, stats in cache_stats.items():
+            for event in ("hits", "misses", "evictions", "expirations"):
+                if event in stats:
+                    cache_events.add_metric([tier, event], stats[event])
+        yield cache_events
+        yield GaugeMetricFamily("local_cache_bytes", "Bytes held by the local cache tier", cache_stats["local"]["bytes"])
+
+        executor_tasks = CounterMetricFamily("executor_tasks", "Process pool tasks", labels=["pool", "event"])
+        executor_queue = CounterMetricFamily(
+            "executor_queue_seconds", "Time tasks waited for a pool worker", labels=["pool"]
+        )
+        executor_pending = GaugeMetricFamily("executor_pending", "Tasks submitted but not finished", labels=["pool"])
+        for pool, stats in get_executor_stats().items():
+            for event in ("submitted", "completed", "failed", "rejected"):
+                executor_tasks.add_metric([pool, event], stats[event])
+            executor_queue.add_metric([pool], stats["queue_seconds"])
+            executor_pending.add_metric([pool], stats["pending"])
+        yield executor_tasks
+        yield executor_queue
+        yield executor_pending
+
+        extraction = CounterMetricFamily("extraction_events", "Extraction routes and pages", labels=["event"])
+        for event, value in extraction_stats.items():
+            extraction.add_metric([event], value)
+        yield extraction
+
+        writer = CounterMetricFamily("document_writer_events", "Document history writes", labels=["event"])
+        for event, value in document_writer.stats.items():
+            writer.add_metric([event], value)
+        yield writer
+
+        s3_events = CounterMetricFamily("s3_upload_events", "Content-addressed S3 uploads", labels=["event"])
+        for event, value in s3_stats.items():
+            s3_events.add_metric([event], value)
+        yield s3_events
+
+        llm_events = CounterMetricFamily("llm_provider_events", "LLM client events", labels=["provider", "event"])
+        llm_latency = GaugeMetricFamily(
+            "llm_provider_latency_ms", "LLM attempt latency over the recent window", labels=["provider", "quantile"]
+        )
+        for provider, stats in get_llm_stats().items():
+            for event in ("calls", "failures", "attempt_errors", "timeouts", "retries", "hedges", "hedge_wins",
+                          "breaker_opens", "rejected"):
+                llm_events.add_metric([provider, event], stats[event])
+            for quantile in ("p50", "p95", "p99"):
+                if stats[f"{quantile}_ms"] is not None:
+                    llm_latency.add_metric([provider, quantile], stats[f"{quantile}_ms"])
+        yield llm_events
+        yield llm_latency
+
+        rate_limit = CounterMetricFamily("rate_limit_events", "Rate limiter decisions", labels=["event"])
+        for event, value in limiter.stats.items():
+            rate_limit.add_metric([event], value)
+        yield rate_limit
+
+
+if METRICS_ENABLED:
+    REGISTRY.register(ServiceStatsCollector())
+
+
+def render_metrics() -> bytes:
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(ServiceStatsCollector())
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
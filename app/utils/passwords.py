@@ -0,0 +1,32 @@
+"""
+bcrypt hashing, run in the auth process pool from app.utils.executor. The
+rounds are passed in by the caller so the pool workers and the API process
+always agree on the configured cost.
+"""
+from functools import lru_cache
+from typing import Optional, Tuple
+
+
+@lru_cache(maxsize=None)
+def get_context(rounds: int):
+    from passlib.context import CryptContext
+
+    # Pinning min and max to the configured cost makes hashes with any other
+    # cost (higher or lower) need an update, so verify_and_update() hands
+    # back a rehash.
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+def hash_password(password: str, rounds: int) -> str:
+    return get_context(rounds).hash(password)
+
+
+def verify_and_update_password(password: str, hashed_password: str, rounds: int) -> Tuple[bool, Optional[str]]:
+    """(matches, new hash or None); the new hash is set when the cost changed."""
+    return get_context(rounds).verify_and_update(password, hashed_password)
@@ -0,0 +1,159 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+from uuid import uuid4
+
+T = TypeVar("T")
+
+SINGLE_FLIGHT_LOCK_TTL = float(os.getenv("SINGLE_FLIGHT_LOCK_TTL", 30))
+SINGLE_FLIGHT_POLL_INTERVAL = float(os.getenv("SINGLE_FLIGHT_POLL_INTERVAL", 1))
+
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+EXTEND_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class SingleFlightError(Exception):
+    """The call this one was waiting on failed in another process."""
+
+
+class _Call:
+    """A call in progress and the number of callers waiting for it."""
+
+    def __init__(self, coro: Awaitable):
+        self.task = asyncio.ensure_future(coro)
+        # Nobody may be waiting on the call any more; don't warn about that.
+        self.task.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time, across processes and replicas.
+
+    Callers in the same process share one task running the call; a caller
+    that is cancelled stops waiting for it, and the call itself is only
+    cancelled once no caller is left. Across processes, the caller that wins a
+    short Redis lock runs the call and keeps the lock alive with a heartbeat;
+    everyone else subscribes for its completion and then reads the result
+    through `fetch` (normally the cache the call writes to). If the lock
+    holder dies, its lock expires and one of the waiters takes over.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        lock_ttl: float = SINGLE_FLIGHT_LOCK_TTL,
+        poll_interval: float = SINGLE_FLIGHT_POLL_INTERVAL,
+    ):
+        self.prefix = prefix
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self._calls: Dict[str, _Call] = {}
+
+    async def do(
+        self,
+        redis,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        fetch: Callable[[], Awaitable[Optional[T]]],
+        release: Optional[Callable[[], None]] = None,
+    ) -> T:
+        """
+        release, if given, frees what fn needs. The call may outlive the
+        caller that started it, so it is run when the call ends; a caller that
+        joins a call already running has fn ignored and release run at once.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = _Call(self._do_distributed(redis, key, fn, fetch))
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            if release is not None:
+                call.task.add_done_callback(lambda _: release())
+        elif release is not None:
+            release()
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if not call.waiters and not call.task.done():
+                # The last caller was cancelled; nobody wants the result.
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: str, call: "_Call") -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def _do_distributed(self, redis, key, fn, fetch):
+        lock_key = f"{self.prefix}:lock:{key}"
+        channel = f"{self.prefix}:done:{key}"
+        token = uuid4().hex
+        pubsub = None
+
+        try:
+            while True:
+                if await redis.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)):
+                    # The previous holder may have finished just before the lock
+                    # became free.
+                    result = await fetch()
+                    if result is not None:
+                        await redis.eval(RELEASE_SCRIPT, 1, lock_key, token)
+                        return result
+                    return await self._lead(redis, lock_key, channel, token, fn)
+
+                if pubsub is None:
+                    pubsub = redis.pubsub()
+                    await pubsub.subscribe(channel)
+
+                result = await fetch()
+                if result is not None:
+                    return result
+
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=self.poll_interval)
+                if message is not None and message["data"].startswith(b"error:"):
+                    raise SingleFlightError(message["data"][len(b"error:"):].decode())
+        finally:
+            if pubsub is not None:
+                await pubsub.unsubscribe(channel)
+                await pubsub.reset()
+
+    async def _lead(self, redis, lock_key, channel, token, fn):
+        heartbeat = asyncio.create_task(self._heartbeat(redis, lock_key, token))
+        try:
+            result = await fn()
+        except Exception as e:
+            await self._release(redis, heartbeat, lock_key, token)
+            await redis.publish(channel, f"error:{e}")
+            raise
+        except BaseException:
+            await self._release(redis, heartbeat, lock_key, token)
+            raise
+
+        await self._release(redis, heartbeat, lock_key, token)
+        await redis.publish(channel, "done")
+        return result
+
+    async def _release(self, redis, heartbeat, lock_key, token):
+        heartbeat.cancel()
+        await redis.eval(RELEASE_SCRIPT, 1, lock_key, token)
+
+    async def _heartbeat(self, redis, lock_key, token):
+        while True:
+            await asyncio.sleep(self.lock_ttl / 3)
+            extended = await redis.eval(EXTEND_SCRIPT, 1, lock_key, token, int(self.lock_ttl * 1000))
+            if not extended:
+                print(f"Single-flight lock {lock_key} was lost while the call was still running")
+                return
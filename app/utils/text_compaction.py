@@ -0,0 +1,132 @@
+"""
+Prompt-side clean-up of extracted text. OCR and PDF text layers repeat
+page headers and footers, split words across lines and carry runs of blank
+lines; none of it helps a summary and all of it is paid for in tokens.
+Plain functions so long texts can be compacted in the process pool.
+"""
+import re
+from collections import Counter
+from typing import List
+
+from app.utils.tokens import count_tokens, truncate_tokens
+
+# A line repeated this often is page furniture (running header, footer,
+# confidentiality notice); its first occurrence is kept.
+BOILERPLATE_MIN_REPEATS = 3
+# Only lines at least this long count, so repeated table cells ("Yes",
+# "N/A", "0.00") are left alone.
+BOILERPLATE_MIN_CHARS = 20
+BOILERPLATE_MAX_CHARS = 120
+# Share of the token budget kept from the start of an over-long text; the
+# rest comes from its end, where conclusions and totals usually are.
+BUDGET_HEAD_SHARE = 0.8
+TRUNCATION_MARKER = "[...]"
+
+SPACES = re.compile(r"[ \t\f\v ]+")
+HYPHENATED_BREAK = re.compile(r"([a-z])-\n([a-z])")
+PAGE_NUMBER = re.compile(
+    r"^[\W_]*(?:page|pg\.?|p\.)\s*\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?[\W_]*$"
+    r"|^[\W_]*\d{1,4}\s*(?:of|/)\s*\d{1,4}[\W_]*$"
+    r"|^[-–—]\s*\d{1,4}\s*[-–—]$",
+    re.IGNORECASE,
+)
+SENTENCE_END = ".:;!?)]\"'"
+
+
+def remove_repeated_lines(lines: List[str]) -> List[str]:
+    counts = Counter(
+        line for line in lines if BOILERPLATE_MIN_CHARS <= len(line) <= BOILERPLATE_MAX_CHARS
+    )
+    repeated = {line for line, count in counts.items() if count >= BOILERPLATE_MIN_REPEATS}
+    seen = set()
+    kept = []
+    for line in lines:
+        if line in repeated:
+            if line in seen:
+                continue
+            seen.add(line)
+        kept.append(line)
+    return kept
+
+
+def join_broken_lines(lines: List[str]) -> List[str]:
+    """A line that stops mid-sentence and a next line starting in lower case are one line."""
+    joined: List[str] = []
+    for line in lines:
+        previous = joined[-1] if joined else ""
+        if previous and line and line[0].islower() and previous[-1] not in SENTENCE_END:
+            joined[-1] = f"{previous} {line}"
+        else:
+            joined.append(line)
+    return joined
+
+
+def compact_text(text: str) -> str:
+    text = HYPHENATED_BREAK.sub(r"\1\2", text.replace("\r\n", "\n").replace("\r", "\n"))
+    lines = [SPACES.sub(" ", line).strip() for line in text.split("\n")]
+    # Page numbers go first so they are not joined onto the text above them,
+    # repeats are found after joining so a wrapped sentence is not mistaken
+    # for a running header.
+    lines = [line for line in lines if not PAGE_NUMBER.match(line)]
+    lines = remove_repeated_lines(join_broken_lines(lines))
+
+    # Runs of blank lines become one blank line.
+    compacted: List[str] = []
+    for line in lines:
+        if line or (compacted and compacted[-1]):
+            compacted.append(line)
+    return "\n".join(compacted).strip()
+
+
+def fit_token_budget(text: str, max_tokens: int, tokens: int) -> str:
+    """
+    text cut to max_tokens, keeping its start and its end. Cuts fall on line
+    boundaries, except in a line that alone is longer than what is left of
+    its share of the budget, which is cut inside.
+    """
+    if tokens <= max_tokens:
+        return text
+    lines = text.split("\n")
+    head_budget = int(max_tokens * BUDGET_HEAD_SHARE)
+    tail_budget = max_tokens - head_budget - count_tokens(TRUNCATION_MARKER) - 2
+
+    head, used, full_lines = [], 0, 0
+    for line in lines:
+        line_tokens = count_tokens(line) + 1
+        if used + line_tokens > head_budget:
+            piece = truncate_tokens(line, head_budget - used - 1)
+            if piece:
+                head.append(piece)
+            break
+        head.append(line)
+        used += line_tokens
+        full_lines += 1
+
+    # The tail starts after the last whole line of the head, so the end of a
+    # line cut for the head can still open the tail.
+    tail, used = [], 0
+    for line in reversed(lines[full_lines:]):
+        line_tokens = count_tokens(line) + 1
+        if used + line_tokens > tail_budget:
+            piece = truncate_tokens(line, tail_budget - used - 1, keep_end=True)
+            if piece:
+                tail.append(piece)
+            break
+        tail.append(line)
+        used += line_tokens
+
+    return "\n".join(head + [TRUNCATION_MARKER] + tail[::-1])
+
+
+def compact_for_prompt(text: str, max_tokens: int) -> dict:
+    """Compacted and budget-trimmed text with the token counts before and after."""
+    tokens_before = count_tokens(text)
+    compacted = compact_text(text)
+    compacted_tokens = count_tokens(compacted)
+    trimmed = fit_token_budget(compacted, max_tokens, compacted_tokens)
+    return {
+        "text": trimmed,
+        "tokens_before": tokens_before,
+        "tokens_compacted": compacted_tokens,
+        "tokens_after": compacted_tokens if trimmed is compacted else count_tokens(trimmed),
+    }
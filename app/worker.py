@@ -0,0 +1,157 @@
+"""
+Document job worker.
+
+Runs separately from the API processes and can be scaled on its own:
+
+    python -m app.worker --concurrency 4
+
+Each worker process runs `concurrency` consumers that pull job ids from the
+Redis queue filled by POST /documents/jobs, and puts jobs left behind by dead
+workers back onto the queue.
+"""
+import argparse
+import asyncio
+import os
+import signal
+
+from app.common import SummaryLength
+from app.services.cache_service import get_cached_extraction
+from app.services.document_pipeline import coalesce_document, process_document_once, summarize_extraction
+from app.services.job_service import (
+    JOB_LEASE_TTL,
+    ack_job,
+    claim_next_job,
+    get_job,
+    keep_job_lease,
+    requeue_stale_jobs,
+    unleased_jobs,
+    update_job,
+)
+from app.services.lifecycle import close_clients, warm_clients
+from app.services.openai_service import estimate_summary_tokens
+from app.services.s3_service import download_s3_url_to_ingested_async
+from app.utils.limiter import token_budget
+
+# Pause after a consumer hits an error outside a job (Redis down, a job
+# that could not even be marked failed), doubling up to the maximum.
+WORKER_ERROR_BACKOFF = float(os.getenv("WORKER_ERROR_BACKOFF", 1))
+WORKER_ERROR_BACKOFF_MAX = float(os.getenv("WORKER_ERROR_BACKOFF_MAX", 30))
+
+
+async def run_job(job_id: str) -> None:
+    job = await get_job(job_id)
+    if job is None:
+        return
+
+    async def on_stage(stage: str):
+        await update_job(job_id, stage=stage)
+
+    summary_length = SummaryLength(job["summary_length"])
+    try:
+        extraction = await get_cached_extraction(job["content_hash"])
+        if extraction:
+            # Only the summary layer is missing, the file itself is not needed.
+            await update_job(job_id, status="running", stage="summarizing")
+            result, reused = await coalesce_document(
+                job["content_hash"],
+                summary_length,
+                lambda: summarize_extraction(
+                    job["content_hash"],
+                    job["filename"],
+                    extraction["extracted_text"],
+                    extraction["s3_url"],
+                    summary_length,
+                ),
+            )
+        else:
+            await update_job(job_id, status="running", stage="downloading")
+            ingested = await download_s3_url_to_ingested_async(job["s3_url"], job["filename"])
+            try:
+                result, reused = await process_document_once(
+                    ingested, summary_length, s3_url=job["s3_url"], on_stage=on_stage
+                )
+            finally:
+                ingested.close()
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+        await update_job(job_id, status="failed", stage="failed", error=str(e))
+    else:
+        await update_job(job_id, status="completed", stage="completed")
+        if job.get("rate_identity") and not reused:
+            await token_budget.charge(
+                job["rate_identity"],
+                estimate_summary_tokens(result["extracted_text"], result["summary"], summary_length),
+            )
+
+
+async def run_leased_job(job_id: str) -> None:
+    lease = asyncio.create_task(keep_job_lease(job_id))
+    try:
+        await run_job(job_id)
+    finally:
+        lease.cancel()
+        await ack_job(job_id)
+
+
+async def consume(stop: asyncio.Event) -> None:
+    errors = 0
+    while not stop.is_set():
+        try:
+            job_id = await claim_next_job(timeout=1)
+            if job_id is not None:
+                await run_leased_job(job_id)
+            errors = 0
+        except Exception as e:
+            # One bad job or a Redis outage must not take the other
+            # consumers of this process down with it.
+            pause = min(WORKER_ERROR_BACKOFF_MAX, WORKER_ERROR_BACKOFF * 2 ** errors)
+            errors += 1
+            print(f"Worker error ({type(e).__name__}: {e}), retrying in {pause:.1f}s")
+            try:
+                await asyncio.wait_for(stop.wait(), pause)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def requeue_stale(stop: asyncio.Event) -> None:
+    """
+    Requeue the jobs of dead workers (killed by a deploy, OOM, a crash),
+    checking every JOB_LEASE_TTL. Jobs of live workers hold a lease and stay
+    put, so every worker process can run this.
+    """
+    # An id is requeued once it has been seen without a lease twice, a lease
+    # TTL apart, so a job claimed just before its lease was written is not
+    # taken for an abandoned one.
+    suspects = set()
+    while not stop.is_set():
+        try:
+            moved = await requeue_stale_jobs(suspects)
+            suspects = await unleased_jobs()
+            if moved:
+                print(f"Requeued {moved} stale job(s)")
+        except Exception as e:
+            print(f"Requeueing stale jobs failed ({type(e).__name__}: {e})")
+        try:
+            await asyncio.wait_for(stop.wait(), JOB_LEASE_TTL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def main(concurrency: int) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await warm_clients()
+    try:
+        await asyncio.gather(requeue_stale(stop), *(consume(stop) for _ in range(concurrency)))
+    finally:
+        await close_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process queued document jobs")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", 4)))
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency))
@@ -0,0 +1,73 @@
+"""
+Size and latency of cached upload results per cache encoding.
+
+The documents are slices of the English text shipped in pydoc_data (about
+450KB, so no slice repeats itself), wrapped in the same result dict the
+upload endpoint caches. Stored bytes are the
+size of the Redis value (Redis adds a small fixed per-key overhead on top).
+
+    python -m benchmarks.bench_cache_codec
+"""
+import json
+import time
+
+from pydoc_data.topics import topics
+
+from app.utils import cache_codec
+
+CORPUS = "\n".join(topics.values())
+SIZES = [2 * 1024, 20 * 1024, 100 * 1024, 400 * 1024]
+
+
+def make_result(size: int) -> dict:
+    text = CORPUS[:size]
+    return {
+        "filename": "report.pdf",
+        "extracted_text": text,
+        "summary": text[:800],
+        "s3_url": "s3://document-uploads-bucket/objects/report.pdf",
+    }
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        value = fn()
+    return value, (time.perf_counter() - start) / repeat * 1000
+
+
+def formats():
+    yield "json (before)", lambda r: json.dumps(r).encode(), lambda v: json.loads(v)
+    for name, level in [("zlib", 1), ("zlib", 3), ("zlib", 6), ("zstd", 3)]:
+        codec = cache_codec.CODECS[name](level)
+
+        def encode(r, codec=codec):
+            return cache_codec.MAGIC + bytes([cache_codec.FORMAT_VERSION, codec.id]) + codec.compress(json.dumps(r).encode())
+
+        yield f"json+{name}-{level}", encode, lambda v: json.loads(cache_codec.decode(v))
+    try:
+        import msgpack
+        yield "msgpack", msgpack.packb, msgpack.unpackb
+    except ImportError:
+        pass
+
+
+def main():
+    print(f"{'format':<16} {'doc':>8} {'stored':>10} {'ratio':>6} {'encode_ms':>10} {'decode_ms':>10}")
+    for size in SIZES:
+        result = make_result(size)
+        baseline = len(json.dumps(result).encode())
+        repeat = max(3, 2_000_000 // size)
+        for name, encode, decode in formats():
+            value, encode_ms = timed(lambda: encode(result), repeat)
+            decoded, decode_ms = timed(lambda: decode(value), repeat)
+            assert decoded == result
+            print(
+                f"{name:<16} {size // 1024:>6}KB {len(value):>10} {baseline / len(value):>6.2f}"
+                f" {encode_ms:>10.3f} {decode_ms:>10.3f}"
+            )
+        print()
+
+
+if __name__ == "__main__":
+    main()
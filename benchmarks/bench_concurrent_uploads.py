@@ -0,0 +1,117 @@
+"""
+Concurrent /documents/upload benchmark against local stand-ins.
+
+S3 is served by moto, Textract by a stub that sleeps for TEXTRACT_LATENCY
+seconds, OpenAI by an async stub and Redis by fakeredis. While the uploads
+run, /health is probed in a loop to show whether the event loop is blocked.
+
+    python -m benchmarks.bench_concurrent_uploads --uploads 20 --concurrency 10
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import time
+from unittest.mock import patch
+
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from fakeredis import FakeAsyncRedis
+from httpx import AsyncClient
+from moto import mock_s3
+
+TEXTRACT_LATENCY = float(os.getenv("TEXTRACT_LATENCY", 0.5))
+OPENAI_LATENCY = float(os.getenv("OPENAI_LATENCY", 0.2))
+
+
+def fake_textract_call(**kwargs):
+    time.sleep(TEXTRACT_LATENCY)
+    return {"Blocks": [{"BlockType": "LINE", "Text": "benchmark line"}]}
+
+
+async def fake_acreate(**kwargs):
+    await asyncio.sleep(OPENAI_LATENCY)
+    message = type("Message", (), {"content": "benchmark summary"})
+    return type("Response", (), {"choices": [type("Choice", (), {"message": message})]})
+
+
+async def probe_health(client, stop, samples, interval=0.01):
+    # Includes the scheduling delay of the sleep, so a blocked loop shows up
+    # as /health latency exactly as a real client would experience it.
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        await client.get("/health")
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def run(uploads, concurrency):
+    from app.main import app
+    from app.services import s3_service
+    from app.utils.limiter import limiter
+
+    limiter.enabled = False
+    s3_service.s3_client.create_bucket(Bucket=s3_service.BUCKET_NAME)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    health_samples = []
+
+    async with AsyncClient(app=app, base_url="http://bench", timeout=None) as client:
+        async def one(i):
+            async with semaphore:
+                start = time.perf_counter()
+                resp = await client.post(
+                    "/documents/upload",
+                    files={"file": (f"doc{i}.pdf", io.BytesIO(f"document {i}".encode()), "application/pdf")},
+                    params={"summary_length": "medium"},
+                )
+                latencies.append(time.perf_counter() - start)
+                assert resp.status_code == 200, resp.text
+
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe_health(client, stop, health_samples))
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(uploads)))
+        wall = time.perf_counter() - start
+        stop.set()
+        await prober
+
+    return {
+        "uploads": uploads,
+        "concurrency": concurrency,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(uploads / wall, 2),
+        "upload_p50_s": round(statistics.median(latencies), 3),
+        "upload_max_s": round(max(latencies), 3),
+        "health_p50_ms": round(statistics.median(health_samples) * 1000, 1),
+        "health_max_ms": round(max(health_samples) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    with mock_s3():
+        from app.services import textract_service
+
+        with (
+            patch.object(textract_service.textract, "detect_document_text", side_effect=fake_textract_call),
+            patch.object(textract_service.textract, "analyze_document", side_effect=fake_textract_call),
+            patch("openai.ChatCompletion.acreate", side_effect=fake_acreate),
+            patch("app.api.documents.redis_client", FakeAsyncRedis()),
+        ):
+            result = asyncio.run(run(args.uploads, args.concurrency))
+
+    for key, value in result.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
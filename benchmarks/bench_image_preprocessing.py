@@ -0,0 +1,78 @@
+"""
+Bytes sent to Textract and extraction time for phone-style photos, with and
+without the OCR pre-processing stage.
+
+Photos are synthetic 12MP colour JPEGs (sensor noise plus text lines, saved
+at the quality phone cameras use). Without --live the Textract call is
+replaced by its upload time at --uplink-mbps, since request transfer is the
+part pre-processing changes; with --live the real detect_document_text is
+called (needs AWS credentials) and its wall time is measured.
+
+    python -m benchmarks.bench_image_preprocessing [--uplink-mbps 100] [--live]
+"""
+import argparse
+import io
+import statistics
+import time
+
+from PIL import Image, ImageDraw
+
+from app.services.extraction_service import IMAGE_OCR_JPEG_QUALITY, IMAGE_OCR_MAX_SIDE
+from app.utils.image_processing import prepare_image_for_ocr
+
+PHOTOS = [
+    ("12MP photo q95", (4032, 3024), 95),
+    ("12MP photo q85", (4032, 3024), 85),
+    ("8MP photo q92", (3264, 2448), 92),
+]
+REPEAT = 3
+
+
+def make_photo(size, quality) -> bytes:
+    image = Image.effect_noise(size, 30).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for y in range(150, size[1] - 150, 70):
+        draw.text((150, y), "Invoice line item  qty 1  unit price 12.00  " * 6, fill=(20, 20, 20))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def textract_call(image_bytes: bytes, args) -> float:
+    if args.live:
+        from app.services.textract_service import textract
+
+        start = time.perf_counter()
+        textract.detect_document_text(Document={"Bytes": image_bytes})
+        return time.perf_counter() - start
+    return len(image_bytes) * 8 / (args.uplink_mbps * 1_000_000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uplink-mbps", type=float, default=100)
+    parser.add_argument("--live", action="store_true")
+    args = parser.parse_args()
+
+    mode = "live Textract" if args.live else f"modelled upload at {args.uplink_mbps:g} Mbit/s"
+    print(f"max side {IMAGE_OCR_MAX_SIDE}px, JPEG quality {IMAGE_OCR_JPEG_QUALITY}, {mode}")
+    print(f"{'photo':<16} {'sent_before':>12} {'sent_after':>12} {'prep_ms':>8} {'before_ms':>10} {'after_ms':>10}")
+    for name, size, quality in PHOTOS:
+        original = make_photo(size, quality)
+        prep, before, after, sent = [], [], [], 0
+        for _ in range(REPEAT):
+            before.append(textract_call(original, args))
+            start = time.perf_counter()
+            prepared = prepare_image_for_ocr(original, IMAGE_OCR_MAX_SIDE, IMAGE_OCR_JPEG_QUALITY)
+            prep.append(time.perf_counter() - start)
+            sent = len(prepared["bytes"])
+            after.append(prep[-1] + textract_call(prepared["bytes"], args))
+        print(
+            f"{name:<16} {len(original) / 1e6:>10.2f}MB {sent / 1e6:>10.2f}MB "
+            f"{statistics.median(prep) * 1000:>8.0f} {statistics.median(before) * 1000:>10.0f} "
+            f"{statistics.median(after) * 1000:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Login throughput and latency per bcrypt cost, to pick BCRYPT_ROUNDS.
+
+Each login is what /auth/login costs the server on top of the DynamoDB read:
+one verify_and_update_password on the auth process pool. A burst of
+--logins logins is submitted at once (well above the pool size, like a
+login storm), so the tail includes queueing behind the pool.
+
+    python -m benchmarks.bench_login [--logins 64] [--costs 10 11 12 13]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.utils.executor import AUTH_EXECUTOR_WORKERS, auth_pool
+from app.utils.passwords import hash_password, verify_and_update_password
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def burst(hashed: str, rounds: int, logins: int):
+    async def one():
+        start = time.perf_counter()
+        verified, _ = await auth_pool.run(verify_and_update_password, "correct horse", hashed, rounds)
+        assert verified
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one() for _ in range(logins)))
+    return time.perf_counter() - start, latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--costs", type=int, nargs="+", default=[10, 11, 12, 13])
+    args = parser.parse_args()
+    auth_pool.max_pending = None
+
+    # Start the workers before timing anything.
+    await auth_pool.run(hash_password, "warm up", 4)
+
+    print(f"auth pool: {AUTH_EXECUTOR_WORKERS} workers, {args.logins} concurrent logins per cost")
+    print(f"{'cost':>4} {'hash_ms':>8} {'logins/s':>9} {'p50_ms':>8} {'p99_ms':>8}")
+    for rounds in args.costs:
+        hashed = hash_password("correct horse", rounds)
+        start = time.perf_counter()
+        verify_and_update_password("correct horse", hashed, rounds)
+        single = time.perf_counter() - start
+
+        elapsed, latencies = await burst(hashed, rounds, args.logins)
+        print(
+            f"{rounds:>4} {single * 1000:>8.0f} {args.logins / elapsed:>9.1f} "
+            f"{statistics.median(latencies) * 1000:>8.0f} {percentile(latencies, 99) * 1000:>8.0f}"
+        )
+    auth_pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
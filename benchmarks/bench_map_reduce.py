@@ -0,0 +1,79 @@
+"""
+Wall-clock scaling of map-reduce summarization against document length.
+
+The OpenAI call is replaced by a latency model of a hosted chat model:
+BASE_LATENCY + input tokens * PREFILL_PER_TOKEN + output tokens * DECODE_PER_TOKEN.
+"Single call" sends the whole document in one prompt (ignoring context
+limits), "map-reduce" uses the SUMMARY_CHUNK_* settings.
+
+    python -m benchmarks.bench_map_reduce --tokens 10000 50000 100000 200000
+"""
+import argparse
+import asyncio
+import time
+from unittest.mock import patch
+
+from fakeredis import FakeAsyncRedis
+
+from app.common import SummaryLength
+from app.services import openai_service
+from app.utils.tokens import count_tokens
+
+BASE_LATENCY = 0.3
+PREFILL_PER_TOKEN = 0.00005
+DECODE_PER_TOKEN = 0.01
+
+
+def make_document(tokens: int) -> str:
+    # Unique lines, otherwise the chunk summary cache dedupes repeated chunks.
+    lines = []
+    while count_tokens("\n".join(lines)) < tokens:
+        start = len(lines)
+        lines.extend(
+            f"Line {i}: the quarterly report lists revenue, costs and headcount per region."
+            for i in range(start, start + 200)
+        )
+    return "\n".join(lines)
+
+
+async def fake_acreate(time_scale, calls, **kwargs):
+    calls.append(1)
+    input_tokens = count_tokens(kwargs["messages"][0]["content"])
+    latency = BASE_LATENCY + input_tokens * PREFILL_PER_TOKEN + kwargs["max_tokens"] * DECODE_PER_TOKEN
+    await asyncio.sleep(latency * time_scale)
+    message = type("Message", (), {"content": "summary " * (kwargs["max_tokens"] // 2)})
+    return type("Response", (), {"choices": [type("Choice", (), {"message": message})]})
+
+
+async def measure(text: str, chunk_tokens: int, time_scale: float):
+    calls = []
+
+    async def acreate(**kwargs):
+        return await fake_acreate(time_scale, calls, **kwargs)
+
+    with (
+        patch.object(openai_service, "SUMMARY_CHUNK_TOKENS", chunk_tokens),
+        patch.object(openai_service, "redis_client", FakeAsyncRedis()),
+        patch("openai.ChatCompletion.acreate", new=acreate),
+    ):
+        start = time.perf_counter()
+        await openai_service.summarize_text(text, SummaryLength.medium)
+        return (time.perf_counter() - start) / time_scale, len(calls)
+
+
+async def run(lengths, time_scale):
+    print(f"chunk_tokens={openai_service.SUMMARY_CHUNK_TOKENS} concurrency={openai_service.SUMMARY_CHUNK_CONCURRENCY}")
+    print(f"{'tokens':>8} {'single_s':>9} {'mapreduce_s':>12} {'calls':>6}")
+    for tokens in lengths:
+        text = make_document(tokens)
+        single, _ = await measure(text, 10 ** 9, time_scale)
+        mapped, calls = await measure(text, openai_service.SUMMARY_CHUNK_TOKENS, time_scale)
+        print(f"{tokens:>8} {single:>9.2f} {mapped:>12.2f} {calls:>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, nargs="+", default=[5000, 25000, 50000, 100000, 200000])
+    parser.add_argument("--time-scale", type=float, default=0.1, help="shrink simulated latencies to keep the run short")
+    args = parser.parse_args()
+    asyncio.run(run(args.tokens, args.time_scale))
@@ -0,0 +1,159 @@
+"""
+Near-duplicate summary index: detection rate, false-positive rate and
+lookup cost, to pick NEAR_DUPLICATE_MIN_SIMILARITY.
+
+A corpus of --documents synthetic texts (Zipf-distributed vocabulary, so
+common phrases repeat across documents as they do in real ones) is indexed
+into fakeredis. Then three kinds of query are run:
+
+  rescans      an indexed text with a share of its words replaced, like
+               OCR noise on a re-scan (should be reused)
+  unrelated    new texts from the same vocabulary (must not be reused)
+  templates    an indexed text with only its numbers changed, like the
+               next invoice from the same template (must not be reused;
+               the numbers check is what stops these)
+
+    python -m benchmarks.bench_near_duplicates [--documents 2000] [--queries 200]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from unittest.mock import patch
+
+from fakeredis import FakeAsyncRedis
+
+from app.common import SummaryLength
+from app.services import text_cache
+from app.utils.fingerprint import similarity, text_signature
+
+VOCABULARY = ["".join(random.Random(i).choices("abcdefghijklmnopqrstuvwxyz", k=3 + i % 7)) for i in range(3000)]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+THRESHOLDS = [0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def make_document(rng: random.Random, words: int) -> str:
+    body = rng.choices(VOCABULARY, WEIGHTS, k=words)
+    for i in range(0, words, 40):
+        body[i] = f"{rng.randint(1, 99999)}.{rng.randint(0, 99):02d}"
+    return " ".join(body)
+
+
+def rescan(rng: random.Random, text: str, noise: float) -> str:
+    words = text.split(" ")
+    for i in range(len(words)):
+        if not words[i][0].isdigit() and rng.random() < noise:
+            words[i] = words[i][:-1] + "x"
+    return " ".join(words)
+
+
+def refill_numbers(rng: random.Random, text: str) -> str:
+    return " ".join(
+        f"{rng.randint(1, 99999)}.{rng.randint(0, 99):02d}" if word[0].isdigit() else word
+        for word in text.split(" ")
+    )
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    corpus = [make_document(rng, rng.randint(args.min_words, args.max_words)) for _ in range(args.documents)]
+
+    started = time.perf_counter()
+    signatures = [text_signature(text) for text in corpus]
+    per_word = (time.perf_counter() - started) / sum(s.words for s in signatures)
+    print(f"signature: {per_word * 1e6:.2f}us per word ({per_word * 1e6:.2f}ms per 1000 words)")
+
+    for i, signature in enumerate(signatures):
+        await text_cache.remember_summary(signature, SummaryLength.medium, f"summary {i}")
+
+    async def query(text):
+        signature = text_signature(text)
+        candidates_before = text_cache.text_cache_stats["candidates"]
+        started = time.perf_counter()
+        summary = await text_cache.get_reusable_summary(signature, SummaryLength.medium)
+        elapsed = time.perf_counter() - started
+        return summary, elapsed, text_cache.text_cache_stats["candidates"] - candidates_before
+
+    picks = rng.sample(range(args.documents), args.queries)
+    lookups = []
+    candidates = []
+
+    print(f"\n{'query':>12} {'reused':>7} {'correct':>8} {'cand/lookup':>12}")
+    for noise in args.noise:
+        reused = correct = 0
+        for i in picks:
+            summary, elapsed, found = await query(rescan(rng, corpus[i], noise))
+            lookups.append(elapsed)
+            candidates.append(found)
+            reused += summary is not None
+            correct += summary == f"summary {i}"
+        print(f"{f'rescan {noise:.0%}':>12} {reused / len(picks):>7.1%} {correct / len(picks):>8.1%} "
+              f"{statistics.fmean(candidates[-len(picks):]):>12.1f}")
+
+    for name, make in (
+        ("unrelated", lambda i: make_document(rng, len(corpus[i].split(" ")))),
+        ("templates", lambda i: refill_numbers(rng, corpus[i])),
+    ):
+        reused = 0
+        for i in picks:
+            summary, elapsed, found = await query(make(i))
+            lookups.append(elapsed)
+            candidates.append(found)
+            reused += summary is not None
+        print(f"{name:>12} {reused / len(picks):>7.1%} {'':>8} {statistics.fmean(candidates[-len(picks):]):>12.1f}")
+
+    print(
+        f"\nlookup (fakeredis, in process): p50 {percentile(lookups, 50) * 1000:.2f}ms "
+        f"p99 {percentile(lookups, 99) * 1000:.2f}ms; "
+        f"two round trips to Redis in production"
+    )
+
+    # How the threshold trades detection against false positives, before the
+    # numbers check: similarity of each rescan and template to its source,
+    # and of each unrelated text to its most similar indexed text.
+    print(
+        f"\n{'threshold':>9} " + " ".join(f"{f'rescan {n:.0%}':>11}" for n in args.noise)
+        + f" {'unrelated':>10} {'templates':>10}"
+    )
+    rescan_scores = {
+        noise: [similarity(signatures[i].minhash, text_signature(rescan(rng, corpus[i], noise)).minhash) for i in picks]
+        for noise in args.noise
+    }
+    template_scores = [
+        similarity(signatures[i].minhash, text_signature(refill_numbers(rng, corpus[i])).minhash) for i in picks
+    ]
+    unrelated_scores = []
+    for i in picks[: args.queries // 4]:
+        probe = text_signature(make_document(rng, len(corpus[i].split(" ")))).minhash
+        unrelated_scores.append(max(similarity(probe, s.minhash) for s in signatures))
+    for threshold in THRESHOLDS:
+        detected = " ".join(
+            f"{sum(s >= threshold for s in rescan_scores[n]) / len(picks):>11.1%}" for n in args.noise
+        )
+        unrelated = sum(s >= threshold for s in unrelated_scores) / len(unrelated_scores)
+        templates = sum(s >= threshold for s in template_scores) / len(template_scores)
+        print(f"{threshold:>9} {detected} {unrelated:>10.1%} {templates:>10.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--min-words", type=int, default=150)
+    parser.add_argument("--max-words", type=int, default=1500)
+    parser.add_argument("--noise", type=float, nargs="+", default=[0.01, 0.02, 0.05, 0.1])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with patch.object(text_cache, "redis_client", FakeAsyncRedis()):
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Per-request cost of the Redis rate limiter.
+
+Two otherwise identical endpoints, one decorated with @limiter.limit, are
+called through the ASGI app in-process. The difference is the limiter:
+identity extraction (including a JWT signature check for signed-in users),
+one EVALSHA round trip and the script itself.
+Without --redis-url the script runs in fakeredis (Lua in-process, no
+network), so the numbers are a lower bound; pass a real Redis to include
+the round trip.
+
+    python -m benchmarks.bench_rate_limiter [--requests 2000] [--redis-url redis://localhost:6379]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from unittest.mock import patch
+
+from fastapi import FastAPI, Request
+from httpx import AsyncClient
+
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+
+from app.services.user_documents import create_access_token
+from app.utils.limiter import limiter
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/plain")
+    async def plain(request: Request):
+        return {"ok": True}
+
+    @app.get("/limited")
+    @limiter.limit("1000000/minute")
+    async def limited(request: Request):
+        return {"ok": True}
+
+    return app
+
+
+async def measure(ac: AsyncClient, path: str, requests: int, headers: dict):
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        resp = await ac.get(path, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        assert resp.status_code == 200
+    return latencies
+
+
+def summary(latencies):
+    ordered = sorted(latencies)
+    return statistics.median(ordered) * 1e6, ordered[int(len(ordered) * 0.99)] * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--redis-url")
+    args = parser.parse_args()
+
+    if args.redis_url:
+        from redis.asyncio import Redis
+        redis = Redis.from_url(args.redis_url)
+    else:
+        from fakeredis import FakeAsyncRedis
+        redis = FakeAsyncRedis()
+
+    app = build_app()
+    with patch("app.utils.limiter.redis_client", redis):
+        async with AsyncClient(app=app, base_url="http://bench") as ac:
+            print(f"redis: {args.redis_url or 'fakeredis (in-process)'}, {args.requests} requests each")
+            print(f"{'endpoint':<22} {'p50_us':>8} {'p99_us':>8}")
+            for name, path, headers in [
+                ("no limiter", "/plain", {}),
+                ("limiter, by IP", "/limited", {"X-Forwarded-For": "203.0.113.7"}),
+                ("limiter, by JWT", "/limited", {"Authorization": f"Bearer {create_access_token({'sub': 'bench'})}"}),
+            ]:
+                await measure(ac, path, 100, headers)
+                p50, p99 = summary(await measure(ac, path, args.requests, headers))
+                print(f"{name:<22} {p50:>8.0f} {p99:>8.0f}")
+    await redis.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,420 @@
+"""
+End-to-end load test of the API over real HTTP, against local stand-ins:
+
+  - the app runs under uvicorn in its own process, with S3, Textract and
+    DynamoDB served in-process by moto
+  - Redis is a fakeredis TCP server in another process (or a real one with
+    --redis-url)
+  - OpenAI is app.utils.fake_llm_server with --llm-latency seconds before
+    the first token and --llm-token-interval between streamed tokens
+
+Every scenario runs at each --concurrency level and the report records
+latency percentiles, throughput, errors by status and the RSS of the app
+process (including its pool workers) for each level, together with the
+commit and settings it was measured on.
+
+    python -m benchmarks.load_test run --concurrency 1 8 32 --output before.json
+    python -m benchmarks.load_test compare before.json after.json
+
+Scenarios: upload (a new PDF every request, full pipeline), upload_stream
+(the same through /documents/upload/stream), cache_hit (one PDF uploaded
+over and over) and login (/auth/login for one registered user).
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+SCENARIOS = ["upload", "upload_stream", "cache_hit", "login"]
+DEFAULT_SCENARIOS = ["upload", "cache_hit", "login"]
+USERNAME = "bench-user"
+PASSWORD = "bench-password"
+# Settings of the app process that change the numbers; recorded in the report.
+RECORDED_ENV = [
+    "BCRYPT_ROUNDS",
+    "CPU_EXECUTOR_WORKERS",
+    "AUTH_EXECUTOR_WORKERS",
+    "AWS_EXECUTOR_WORKERS",
+    "LOCAL_PDF_EXTRACTION",
+    "LOCAL_CACHE_MAX_BYTES",
+    "METRICS_ENABLED",
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_pdf(lines) -> bytes:
+    """A one-page PDF whose text layer holds lines."""
+    from pypdf import PdfWriter
+    from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    page = writer.add_blank_page(612, 792)
+    text = " ".join(f"({line}) Tj 0 -14 Td" for line in lines)
+    stream = DecodedStreamObject()
+    stream.set_data(f"BT /F1 11 Tf 72 740 Td {text} ET".encode())
+    page[NameObject("/Contents")] = writer._add_object(stream)
+    page[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+    })
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def document(i: int) -> bytes:
+    return make_pdf([f"Benchmark document {i}, line {n}: quarterly figures and notes." for n in range(40)])
+
+
+def process_tree_rss_mb(pid: int):
+    """RSS of pid and all its descendants, or None where /proc is unavailable."""
+    total_kb = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            status = Path(f"/proc/{current}/status").read_text()
+        except OSError:
+            continue
+        for line in status.splitlines():
+            if line.startswith("VmRSS:"):
+                total_kb += int(line.split()[1])
+        for task in Path(f"/proc/{current}/task").glob("*"):
+            try:
+                pending.extend(int(child) for child in (task / "children").read_text().split())
+            except OSError:
+                pass
+    return round(total_kb / 1024, 1) if total_kb else None
+
+
+# -- stand-in processes -------------------------------------------------------
+
+def serve_redis(args):
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(("127.0.0.1", args.port))
+    server.serve_forever()
+
+
+def serve_app(args):
+    # The mocks are started before the app builds its boto3 clients.
+    from moto import mock_dynamodb, mock_s3, mock_textract
+
+    for mock in (mock_s3(), mock_dynamodb(), mock_textract()):
+        mock.start()
+
+    import uvicorn
+
+    from app.main import app
+    from app.services import s3_service
+    from app.utils import db_setup
+    from app.utils.limiter import limiter
+
+    s3_service.s3_client.create_bucket(Bucket=s3_service.BUCKET_NAME)
+    db_setup.create_users_table()
+    db_setup.create_documents_table()
+    limiter.enabled = args.rate_limit
+
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def start_process(*command, env=None, verbose=False) -> subprocess.Popen:
+    output = None if verbose else subprocess.DEVNULL
+    return subprocess.Popen(
+        [sys.executable, "-m", *command], env={**os.environ, **(env or {})}, stdout=output, stderr=output
+    )
+
+
+def wait_for_port(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+# -- load generation ----------------------------------------------------------
+
+class Scenarios:
+    def __init__(self, client: httpx.AsyncClient, summary_length: str):
+        self.client = client
+        self.summary_length = summary_length
+        self.next_document = 0
+        self.cached_document = document(-1)
+
+    async def setup(self, scenario: str) -> None:
+        if scenario == "cache_hit":
+            await self.upload_bytes("/documents/upload", self.cached_document)
+        elif scenario == "login":
+            await self.client.post("/auth/register", json={"username": USERNAME, "password": PASSWORD})
+
+    async def upload_bytes(self, path: str, data: bytes) -> httpx.Response:
+        return await self.client.post(
+            path,
+            files={"file": ("bench.pdf", data, "application/pdf")},
+            params={"summary_length": self.summary_length},
+        )
+
+    def payload(self, scenario: str):
+        # Built before the request is timed.
+        if scenario in ("upload", "upload_stream"):
+            self.next_document += 1
+            return document(self.next_document)
+        if scenario == "cache_hit":
+            return self.cached_document
+        return None
+
+    async def request(self, scenario: str, payload) -> httpx.Response:
+        if scenario == "upload_stream":
+            return await self.upload_bytes("/documents/upload/stream", payload)
+        if scenario in ("upload", "cache_hit"):
+            return await self.upload_bytes("/documents/upload", payload)
+        return await self.client.post("/auth/login", data={"username": USERNAME, "password": PASSWORD})
+
+
+async def run_level(scenarios: Scenarios, scenario: str, concurrency: int, total: int, app_pid: int) -> dict:
+    latencies = []
+    statuses = Counter()
+    remaining = iter(range(total))
+    rss_samples = [process_tree_rss_mb(app_pid)]
+
+    async def worker():
+        for _ in remaining:
+            payload = scenarios.payload(scenario)
+            started = time.perf_counter()
+            try:
+                response = await scenarios.request(scenario, payload)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    async def sample_rss(stop: asyncio.Event):
+        while not stop.is_set():
+            rss_samples.append(process_tree_rss_mb(app_pid))
+            try:
+                await asyncio.wait_for(stop.wait(), 0.1)
+            except asyncio.TimeoutError:
+                pass
+
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    stop.set()
+    await sampler
+    rss_samples.append(process_tree_rss_mb(app_pid))
+
+    ok = statuses.get(200, 0)
+    rss = [sample for sample in rss_samples if sample is not None]
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": ok,
+        "errors": {str(status): count for status, count in statuses.items() if status != 200},
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(ok / wall, 2),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(max(latencies) * 1000, 1),
+            "mean": round(statistics.fmean(latencies) * 1000, 1),
+        },
+        "rss_mb": {"start": rss[0], "peak": max(rss), "end": rss[-1]} if rss else None,
+    }
+
+
+async def drive(args, base_url: str, app_pid: int) -> list:
+    results = []
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        scenarios = Scenarios(client, args.summary_length)
+        for scenario in args.scenarios:
+            await scenarios.setup(scenario)
+            for _ in range(args.warmup):
+                await scenarios.request(scenario, scenarios.payload(scenario))
+            for concurrency in args.concurrency:
+                result = await run_level(scenarios, scenario, concurrency, args.requests, app_pid)
+                latency = result["latency_ms"]
+                print(
+                    f"{scenario:>13} c={concurrency:<3} {result['throughput_rps']:>8.1f} req/s  "
+                    f"p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms  "
+                    f"rss={result['rss_mb']['peak'] if result['rss_mb'] else '?'}MB  errors={result['errors']}"
+                )
+                results.append(result)
+    return results
+
+
+def git_revision() -> dict:
+    def git(*command):
+        try:
+            return subprocess.run(["git", *command], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(status) if status is not None else None}
+
+
+def run(args):
+    redis_process = None
+    redis_url = args.redis_url
+    if redis_url is None:
+        redis_port = free_port()
+        redis_process = start_process("benchmarks.load_test", "redis", "--port", str(redis_port), verbose=args.verbose)
+        wait_for_port(redis_port)
+        redis_url = f"redis://127.0.0.1:{redis_port}"
+
+    llm_port = free_port()
+    llm_process = start_process(
+        "app.utils.fake_llm_server",
+        "--port", str(llm_port),
+        "--first-token-latency", str(args.llm_latency),
+        "--token-interval", str(args.llm_token_interval),
+        verbose=args.verbose,
+    )
+
+    app_port = free_port()
+    app_env = {
+        "REDIS_URL": redis_url,
+        "LLM_PROVIDER": "stub",
+        "LLM_STUB_URL": f"http://127.0.0.1:{llm_port}/v1",
+        "OPENAI_API_KEY": "bench",
+        "SECRET_KEY": os.getenv("SECRET_KEY", "bench-secret"),
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    }
+    serve_command = ["benchmarks.load_test", "serve", "--port", str(app_port)]
+    if args.rate_limit:
+        serve_command.append("--rate-limit")
+    app_process = start_process(*serve_command, env=app_env, verbose=args.verbose)
+
+    try:
+        wait_for_port(llm_port)
+        wait_for_port(app_port, timeout=60)
+        results = asyncio.run(drive(args, f"http://127.0.0.1:{app_port}", app_process.pid))
+    finally:
+        for process in (app_process, llm_process, redis_process):
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    report = {
+        "meta": {
+            **git_revision(),
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "redis": "external" if args.redis_url else "fakeredis",
+            "llm_latency_s": args.llm_latency,
+            "llm_token_interval_s": args.llm_token_interval,
+            "summary_length": args.summary_length,
+            "rate_limit": args.rate_limit,
+            "env": {name: os.environ[name] for name in RECORDED_ENV if name in os.environ},
+        },
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Report written to {args.output}")
+
+
+def compare(args):
+    before = json.loads(Path(args.before).read_text())
+    after = json.loads(Path(args.after).read_text())
+    print(f"before: {before['meta'].get('commit')}  after: {after['meta'].get('commit')}")
+
+    def change(old, new):
+        if not old or new is None:
+            return "     n/a"
+        return f"{(new - old) / old * 100:>+7.1f}%"
+
+    baseline = {(r["scenario"], r["concurrency"]): r for r in before["results"]}
+    print(f"{'scenario':>13} {'c':>3} {'req/s':>17} {'p50 ms':>17} {'p99 ms':>17} {'peak rss':>17}")
+    for result in after["results"]:
+        old = baseline.get((result["scenario"], result["concurrency"]))
+        if old is None:
+            continue
+        old_rss = (old["rss_mb"] or {}).get("peak")
+        new_rss = (result["rss_mb"] or {}).get("peak")
+        print(
+            f"{result['scenario']:>13} {result['concurrency']:>3} "
+            f"{result['throughput_rps']:>8} {change(old['throughput_rps'], result['throughput_rps'])} "
+            f"{result['latency_ms']['p50']:>8} {change(old['latency_ms']['p50'], result['latency_ms']['p50'])} "
+            f"{result['latency_ms']['p99']:>8} {change(old['latency_ms']['p99'], result['latency_ms']['p99'])} "
+            f"{new_rss!s:>8} {change(old_rss, new_rss)}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="start the stack, run the scenarios and write a report")
+    run_parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=DEFAULT_SCENARIOS)
+    run_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    run_parser.add_argument("--requests", type=int, default=64, help="requests per scenario and concurrency level")
+    run_parser.add_argument("--warmup", type=int, default=2, help="untimed requests before each scenario")
+    run_parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds before the first token")
+    run_parser.add_argument("--llm-token-interval", type=float, default=0.0, help="seconds between tokens")
+    run_parser.add_argument("--summary-length", default="medium", choices=["short", "medium", "long"])
+    run_parser.add_argument("--redis-url", help="use this Redis instead of a fakeredis server")
+    run_parser.add_argument("--rate-limit", action="store_true", help="keep the rate limiter on")
+    run_parser.add_argument("--output", default="benchmark-report.json")
+    run_parser.add_argument("--verbose", action="store_true", help="show the output of the app and stand-ins")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="compare two reports")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.set_defaults(func=compare)
+
+    serve_parser = commands.add_parser("serve", help=argparse.SUPPRESS)
+    serve_parser.add_argument("--port", type=int, required=True)
+    serve_parser.add_argument("--rate-limit", action="store_true")
+    serve_parser.set_defaults(func=serve_app)
+
+    redis_parser = commands.add_parser("redis", help=argparse.SUPPRESS)
+    redis_parser.add_argument("--port", type=int, required=True)
+    redis_parser.set_defaults(func=serve_redis)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+#!/bin/sh
+# Every container command starts here, whatever docker-compose sets as the
+# command. prometheus_client's multiprocess mode needs
+# PROMETHEUS_MULTIPROC_DIR to exist and to start empty: files left by the
+# workers of an earlier run would be added to this run's metrics.
+set -e
+
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+exec "$@"